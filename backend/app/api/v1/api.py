@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from app.api.v1 import auth, whiteboards, elements, search
+from app.api.v1 import auth, whiteboards, elements, search, metrics
 
 api_router = APIRouter()
 
@@ -30,4 +30,11 @@ api_router.include_router(
     search.router,
     prefix="/search",
     tags=["search"]
-)
\ No newline at end of file
+)
+
+# メトリクス関連
+api_router.include_router(
+    metrics.router,
+    prefix="/metrics",
+    tags=["metrics"]
+)
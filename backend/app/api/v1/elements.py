@@ -1,12 +1,12 @@
 """Drawing elements API endpoints."""
-from typing import Any, List
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from typing import Any, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
 from fastapi.exceptions import RequestValidationError
 from sqlalchemy.orm import Session
-from uuid import UUID
+from uuid import UUID, uuid4
 from pydantic import ValidationError
 import json
-import traceback
+import logging
 
 from app.core.database import get_db
 from app.core.dependencies import get_current_active_user
@@ -19,6 +19,12 @@ from app.schemas.element import (
     DrawingElementUpdate,
     BatchElementsUpdate
 )
+from app.websocket.board_snapshot import board_snapshots
+from app.websocket.element_persister import element_uuid
+from app.websocket.room_state import room_states
+from app.websocket.websocket import get_message_handler
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -39,6 +45,12 @@ def read_drawing_elements(
     # ホワイトボードの存在とアクセス権限をチェック
     _ = _get_whiteboard_with_access_check(db, whiteboard_id, current_user)
     
+    # 編集中のボードはメモリ上の要素一覧から返す
+    if room_states is not None:
+        encoded = room_states.get_encoded(str(whiteboard_id), skip, limit)
+        if encoded is not None:
+            return Response(content=encoded, media_type="application/json")
+    
     elements = db.query(DrawingElement).filter(
         DrawingElement.whiteboard_id == whiteboard_id
     ).order_by(DrawingElement.created_at).all()
@@ -68,6 +80,7 @@ def create_drawing_element(
     db.add(element)
     db.commit()
     db.refresh(element)
+    _update_board_caches(whiteboard_id, [element])
     return element
 
 
@@ -105,6 +118,7 @@ def update_drawing_element(
     db.add(element)
     db.commit()
     db.refresh(element)
+    _update_board_caches(whiteboard_id, [element])
     return element
 
 
@@ -135,6 +149,7 @@ def delete_drawing_element(
     
     db.delete(element)
     db.commit()
+    _update_board_caches(whiteboard_id, removed_id=element_id)
     return {"detail": "Drawing element deleted successfully"}
 
 
@@ -156,6 +171,7 @@ def delete_all_drawing_elements(
     ).delete()
     
     db.commit()
+    _update_board_caches(whiteboard_id, [], replace=True)
     return {"detail": f"{deleted_count} drawing elements deleted"}
 
 
@@ -170,44 +186,65 @@ async def save_whiteboard_elements(
     """
     ホワイトボードの描画要素を一括保存
     既存の要素をすべて削除して新しい要素で置き換える
+    要素IDはWebSocketの操作と同じ規則で決め（app.websocket.element_persister.element_uuid）、
+    置き換え後に届いた操作が同じ行に反映されるようにする
     """
     try:
-        print(f"=== BATCH SAVE REQUEST RECEIVED ===")
-        print(f"Whiteboard ID: {whiteboard_id}")
-        print(f"User: {current_user.email}")
-        
         # 生のリクエストボディを取得してパース
         body = await request.body()
-        print(f"Raw request body: {body.decode('utf-8')}")
-        
         data = json.loads(body.decode('utf-8'))
         elements_data = BatchElementsUpdate(**data)
         
-        print(f"Number of elements to save: {len(elements_data.elements)}")
+        logger.debug(
+            "Batch save request",
+            extra={
+                "whiteboard_id": str(whiteboard_id),
+                "user_id": str(current_user.id),
+                "elements": len(elements_data.elements)
+            }
+        )
         
         # ホワイトボードの存在と編集権限をチェック
         _ = _get_whiteboard_with_edit_check(db, whiteboard_id, current_user)
         
         # バリデーション: 空の要素配列チェック
         if not elements_data.elements:
-            print("Empty elements array - skipping save")
             return []
         
-        # トランザクション内で既存要素の削除と新要素の追加を実行
-        print("Starting database transaction...")
+        # WebSocketで受信した未反映の操作を書き込んでから破棄（置き換えた行に古い操作が重ならないようにする）
+        element_persister = get_message_handler().element_persister
+        if element_persister is not None:
+            await element_persister.flush(whiteboard_id)
+            await element_persister.discard(whiteboard_id)
+        
+        # 要素IDを決定（同じIDの要素は後のものを保存）
+        elements_by_id = {}
+        for element_data in elements_data.elements:
+            element_id = (
+                element_uuid(whiteboard_id, element_data.id) if element_data.id is not None else uuid4()
+            )
+            elements_by_id.pop(element_id, None)
+            elements_by_id[element_id] = element_data
         
+        # トランザクション内で既存要素の削除と新要素の追加を実行
         # 既存の要素をすべて削除
         deleted_count = db.query(DrawingElement).filter(
             DrawingElement.whiteboard_id == whiteboard_id
         ).delete()
-        print(f"Deleted {deleted_count} existing elements")
+        
+        # 他のボードの要素と重なるIDは新しいIDにする
+        foreign_ids = {
+            row.id for row in db.query(DrawingElement.id).filter(
+                DrawingElement.id.in_(list(elements_by_id))
+            )
+        }
         
         # 新しい要素を追加
         saved_elements = []
-        for i, element_data in enumerate(elements_data.elements):
-            print(f"Saving element {i}: {element_data.model_dump()}")
+        for element_id, element_data in elements_by_id.items():
             element = DrawingElement(
-                **element_data.model_dump(),
+                **element_data.model_dump(exclude={"id"}),
+                id=uuid4() if element_id in foreign_ids else element_id,
                 whiteboard_id=whiteboard_id,
                 user_id=current_user.id
             )
@@ -215,24 +252,31 @@ async def save_whiteboard_elements(
             saved_elements.append(element)
         
         db.commit()
-        print(f"Successfully saved {len(saved_elements)} elements")
+        logger.info(
+            "Batch saved drawing elements",
+            extra={
+                "whiteboard_id": str(whiteboard_id),
+                "deleted": deleted_count,
+                "saved": len(saved_elements)
+            }
+        )
         
         # 追加された要素を取得してリフレッシュ
         for element in saved_elements:
             db.refresh(element)
+        _update_board_caches(whiteboard_id, saved_elements, replace=True)
         
         return saved_elements
         
     except ValidationError as ve:
-        print(f"Validation error: {ve}")
+        logger.info("Batch save validation error", extra={"whiteboard_id": str(whiteboard_id)})
         db.rollback()
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
             detail=f"Validation error: {ve.errors()}"
         )
     except Exception as e:
-        print(f"ERROR in batch save: {e}")
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.exception("Error in batch save", extra={"whiteboard_id": str(whiteboard_id)})
         db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -299,4 +343,24 @@ def _get_whiteboard_with_edit_check(
                 detail="Not enough permissions to edit"
             )
     
-    return whiteboard
\ No newline at end of file
+    return whiteboard
+
+
+def _update_board_caches(
+    whiteboard_id: UUID,
+    elements: Optional[List[DrawingElement]] = None,
+    removed_id: Optional[UUID] = None,
+    replace: bool = False
+) -> None:
+    """要素の変更をWebSocketのスナップショットとメモリ上の要素一覧に反映"""
+    board_snapshots.invalidate(str(whiteboard_id))
+    if room_states is None:
+        return
+    if removed_id is not None:
+        room_states.remove_element(str(whiteboard_id), str(removed_id))
+    if elements is not None:
+        room_states.put_elements(
+            str(whiteboard_id),
+            [DrawingElementSchema.model_validate(e).model_dump(mode="json") for e in elements],
+            replace=replace
+        )
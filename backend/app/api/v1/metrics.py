@@ -0,0 +1,36 @@
+"""Real-time collaboration metrics API endpoints."""
+from typing import Any
+
+from fastapi import APIRouter, Depends
+
+from app.core.dependencies import get_current_admin_user
+from app.models.user import User
+from app.websocket.metrics import metrics
+from app.websocket.websocket import get_connection_manager, get_message_handler
+
+router = APIRouter()
+
+
+@router.get("/websocket")
+async def read_websocket_metrics(
+    *,
+    current_user: User = Depends(get_current_admin_user),
+) -> Any:
+    """
+    WebSocketのメトリクスを取得（このワーカープロセスの値、接続状態を読むためイベントループ上で実行）
+
+    ルームごとの人数にはアクセス権に関係なくボードIDが含まれるため、管理者のみ取得できる。
+
+    メッセージタイプ別の送受信数・バイト数、配信処理時間・ソケット書き込み時間のヒストグラム、
+    接続の増減、ルームの人数、送信キューの長さ・破棄数、レート制限による破棄数を返す。
+    """
+    manager = get_connection_manager()
+    result = metrics.snapshot(manager.rooms, list(manager.connections.values()))
+
+    rate_limiter = get_message_handler().rate_limiter
+    if rate_limiter is not None:
+        result["rate_limited"] = {
+            "by_connection": dict(rate_limiter.dropped_by_connection),
+            "by_room": dict(rate_limiter.dropped_by_room),
+        }
+    return result
@@ -2,10 +2,12 @@
 from typing import Any, List, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import or_, func
 
+from app.core.config import settings
 from app.core.database import get_db
 from app.core.dependencies import get_current_active_user
 from app.models.user import User
@@ -20,6 +22,10 @@ from app.schemas.whiteboard import (
     WhiteboardCollaboratorResponse
 )
 from app.schemas.user import User as UserSchema
+from app.websocket.codec import OutgoingMessage
+from app.websocket.event_stream import EventStreamSocket, parse_last_event_id
+from app.websocket.handshake_auth import handshake_auth
+from app.websocket.websocket import get_connection_manager, get_message_handler
 
 router = APIRouter()
 
@@ -204,6 +210,75 @@ def read_whiteboard(
     return wb_dict
 
 
+@router.get("/{whiteboard_id}/events")
+async def stream_whiteboard_events(
+    *,
+    request: Request,
+    whiteboard_id: UUID,
+    token: Optional[str] = None,
+    rate: Optional[float] = Query(None, gt=0),
+    snapshot: bool = False,
+    last_event_id: Optional[str] = Header(None),
+) -> Any:
+    """
+    ホワイトボードの更新をServer-Sent Eventsで購読（受信のみ、app.websocket.event_stream 参照）
+
+    閲覧専用接続としてWebSocketと同じ配信を受け取る。EventSourceはヘッダーを付けられないため、
+    トークンは Authorization ヘッダーまたは token クエリで渡す。
+    rate で1秒あたりの書き込み回数を WS_SSE_RATE_HZ 以下に下げられ、
+    再接続時は Last-Event-ID の位置から取りこぼした操作だけを再送する。
+    snapshot を指定すると購読直後にボードの要素一覧を snapshot イベントで送信する。
+    """
+    if token is None:
+        scheme, _, credentials = request.headers.get("authorization", "").partition(" ")
+        if scheme.lower() == "bearer":
+            token = credentials
+
+    # ボードの閲覧権限を確認（WebSocketのハンドシェイクと同じキャッシュを使用）
+    whiteboard_key = str(whiteboard_id)
+    authorized = await handshake_auth.authorize(whiteboard_key, token)
+    if authorized is None:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions"
+        )
+    user_id, permission = authorized
+
+    manager = get_connection_manager()
+    stream = EventStreamSocket(lambda: manager.get_op_log(whiteboard_key).epoch)
+    epoch, last_seq = parse_last_event_id(last_event_id)
+    # SSEはpongを返せないためハートビートの対象外（キープアライブはコメント行で送る）
+    connection = await manager.connect(
+        stream, whiteboard_key, user_id, last_seq=last_seq, epoch=epoch,
+        send_resync=not snapshot, viewer=True, heartbeat=False, permission=permission
+    )
+    op_log = manager.get_op_log(whiteboard_key)
+    # 接続時点の seq をイベントIDにして、最初の再接続から差分で再開できるようにする
+    manager.send_to_connection(connection, OutgoingMessage({
+        "type": "connection_success",
+        "data": {"message": "Connected successfully", "epoch": op_log.epoch, "seq": op_log.seq, "viewer": True},
+        "userId": user_id,
+        "timestamp": ""
+    }, seq=op_log.seq))
+    if snapshot and not connection.resumed:
+        await get_message_handler().send_snapshot(connection)
+
+    interval = 1.0 / min(rate or settings.WS_SSE_RATE_HZ, settings.WS_SSE_RATE_HZ)
+
+    async def events():
+        try:
+            async for chunk in stream.events(interval, settings.WS_SSE_KEEPALIVE_SECONDS):
+                yield chunk
+        finally:
+            await manager.disconnect(stream, whiteboard_key, user_id)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.put("/{whiteboard_id}", response_model=WhiteboardSchema)
 def update_whiteboard(
     *,
@@ -240,6 +315,8 @@ def update_whiteboard(
     db.add(whiteboard)
     db.commit()
     db.refresh(whiteboard)
+    # 公開設定の変更をWebSocket接続時の権限チェックに反映
+    handshake_auth.invalidate(whiteboard_id)
     return whiteboard
 
 
@@ -272,6 +349,7 @@ def delete_whiteboard(
 
     db.delete(whiteboard)
     db.commit()
+    handshake_auth.invalidate(whiteboard_id)
     return {"detail": "Whiteboard deleted successfully"}
 
 
@@ -347,6 +425,9 @@ def share_whiteboard(
         })
 
     db.commit()
+    # WebSocket接続時の権限チェックに反映（権限なしとしてキャッシュされている場合がある）
+    for shared_user in shared_users:
+        handshake_auth.invalidate(whiteboard_id, shared_user["user_id"])
 
     # 結果を返す
     if len(shared_users) == 0:
@@ -449,6 +530,7 @@ def update_whiteboard_permissions(
     setattr(collaboration, 'permission', Permission(permission_update.permission))
     db.add(collaboration)
     db.commit()
+    handshake_auth.invalidate(whiteboard_id, permission_update.user_id)
 
     return {"detail": "Permission updated successfully"}
 
@@ -559,6 +641,7 @@ def remove_whiteboard_collaborator(
     # コラボレーターを削除
     db.delete(collaboration)
     db.commit()
+    handshake_auth.invalidate(whiteboard_id, user_id)
 
     return {"detail": "Collaborator removed successfully"}
 
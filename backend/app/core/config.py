@@ -20,6 +20,8 @@ class Settings(BaseSettings):
     # データベース設定
     DATABASE_URL: str = "postgresql://postgres:postgres@db:5432/whiteboard_dev"
     TEST_DATABASE_URL: Optional[str] = None
+    DB_POOL_SIZE: int = 5  # 接続プールで保持するDB接続数
+    DB_MAX_OVERFLOW: int = 5  # プールを超えて一時的に作成できるDB接続数
     
     # CORS設定
     BACKEND_CORS_ORIGINS: list[str] = [
@@ -42,11 +44,48 @@ class Settings(BaseSettings):
     ENVIRONMENT: str = "development"
     
     # ログ設定
-    LOG_LEVEL: str = "INFO"
+    LOG_LEVEL: str = "INFO"  # モジュールごとの指定も可能（例: "INFO,app.websocket=DEBUG"）
+    LOG_SAMPLE_PER_SECOND: int = 10  # メッセージごとのログの出力上限（キーごと・1秒あたり）
     
     # WebSocket設定
-    WS_MESSAGE_SIZE_LIMIT: int = 16 * 1024 * 1024  # 16MB
+    WS_MESSAGE_SIZE_LIMIT: int = 16 * 1024 * 1024  # 16MB（分割転送したメッセージ全体の上限、超えた場合は 1009 で切断）
+    WS_FRAME_SIZE_LIMIT: int = 1024 * 1024  # 1フレームの上限（超えるメッセージは chunk で分割して送る）
     WS_CONNECTION_LIMIT: int = 1000
+    WS_SEND_TIMEOUT_SECONDS: float = 5.0  # 1送信あたりのタイムアウト（遅いクライアント対策）
+    WS_OUTBOUND_QUEUE_SIZE: int = 256  # 接続ごとの送信キュー上限（フレーム数）
+    WS_OUTBOUND_OVERFLOW_POLICY: str = "drop_stale"  # drop_stale: 古いカーソル等を破棄 / disconnect: 即切断
+    WS_OUTBOUND_CURSOR_QUEUE_SIZE: int = 8  # 接続ごとに溜めておくカーソルフレームの上限（超えた分は古いものから破棄）
+    WS_CURSOR_FLUSH_HZ: float = 20.0  # カーソル集約の配信レート（0で受信ごとに即時配信）
+    WS_DRAWING_BATCH_WINDOW_MS: int = 0  # 描画プレビューのバッチ期間（0でバッチ無効）
+    WS_PERSIST_FLUSH_INTERVAL_MS: int = 1000  # 描画・消去イベントをDBへ反映するまでの最大待ち時間（0で永続化しない）
+    WS_PERSIST_BATCH_SIZE: int = 100  # この件数に達したら待たずにDBへ反映
+    WS_OP_LOG_SIZE: int = 1000  # 再接続時の差分再送用にルームごとに保持する操作数
+    WS_OP_LOG_MAX_ROOMS: int = 1000  # 操作ログを保持するルーム数の上限（接続のないルームから削除）
+    WS_SNAPSHOT_CHUNK_SIZE: int = 500  # 参加時スナップショットの1フレームあたりの要素数
+    WS_SNAPSHOT_CACHE_TTL_SECONDS: float = 30.0  # スナップショットのキャッシュ有効期間（他ワーカーでのREST更新対策）
+    WS_DB_MAX_WORKERS: int = 4  # WebSocketのDB処理を実行するスレッド数（同時に使うDB接続数の上限）
+    WS_RATE_LIMITS: dict[str, float] = {  # 接続ごと・メッセージタイプごとの受信レート上限（毎秒、0以下で無制限）
+        "cursor": 60.0, "drawing_event": 120.0, "draw": 50.0, "erase": 50.0,
+        "stroke_begin": 50.0, "stroke_append": 120.0, "stroke_end": 50.0, "viewport": 30.0,
+        "chunk": 20.0
+    }
+    WS_ROOM_RATE_LIMITS: dict[str, float] = {  # ルーム全体での受信レート上限（毎秒、0以下で無制限）
+        "cursor": 600.0, "drawing_event": 1200.0, "draw": 300.0, "erase": 300.0,
+        "stroke_begin": 300.0, "stroke_append": 1200.0, "stroke_end": 300.0, "chunk": 100.0
+    }
+    WS_RATE_LIMIT_BURST_SECONDS: float = 2.0  # 上限の何秒分まで連続した受信を許容するか
+    WS_HEARTBEAT_INTERVAL_SECONDS: float = 20.0  # この間受信がない接続にサーバーから ping を送る（0で無効）
+    WS_HEARTBEAT_MAX_MISSED: int = 2  # 応答のない ping がこの回数に達した接続を切断
+    WS_AUTH_CACHE_TTL_SECONDS: float = 60.0  # 接続時に確認したボード権限のキャッシュ有効期間
+    WS_AUTH_CACHE_SIZE: int = 10000  # 権限をキャッシュする（ユーザー, ボード）の上限
+    WS_STROKE_MAX_POINTS: int = 20000  # ストロークの差分配信で1ストロークに追加できる点数の上限
+    WS_STROKE_MAX_OPEN: int = 4  # 1接続で同時に描画中にできるストローク数
+    WS_VIEWPORT_MARGIN: float = 200.0  # 表示範囲で配信先を絞り込む際に範囲の外側に含める余白（キャンバス座標）
+    WS_VIEWER_CURSOR_HZ: float = 2.0  # 閲覧専用接続へカーソルをまとめて配信する回数（1秒あたり、0で配信しない）
+    WS_SSE_RATE_HZ: float = 10.0  # SSEで溜まったイベントをまとめて書き込む回数の上限（1秒あたり、rate クエリで下げられる）
+    WS_SSE_KEEPALIVE_SECONDS: float = 15.0  # SSEでイベントがない間にコメント行を送る間隔（プロキシのタイムアウト対策）
+    WS_ROOM_STATE_MEMORY_MB: int = 64  # 編集中ボードの要素をメモリに保持する上限（0で無効、REDIS_URL設定時も無効）
+    WS_REDIS_OUTBOX_LIMIT: int = 10000  # Redisへの発行待ちにできるメッセージ数（超えた分は破棄、Redis停止中のメモリ増加を防ぐ）
     
     # Redis設定（将来的な拡張用）
     REDIS_URL: Optional[str] = None
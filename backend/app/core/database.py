@@ -1,12 +1,21 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+import asyncio
+import functools
+
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
 
+T = TypeVar("T")
+
 # データベースエンジンの作成
 engine = create_engine(
     settings.DATABASE_URL,
     pool_pre_ping=True,  # 接続プールの事前チェック
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
     echo=settings.is_development  # 開発環境ではSQLログを出力
 )
 
@@ -34,4 +43,29 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+# WebSocketなどイベントループ上から使うDB処理のスレッドプール
+# スレッド数で同時に使うDB接続数を抑え、WebSocketの接続数に関係なく小さな接続プールで動かす
+db_executor = ThreadPoolExecutor(
+    max_workers=settings.WS_DB_MAX_WORKERS,
+    thread_name_prefix="ws-db"
+)
+
+
+async def run_in_db_executor(func: Callable[..., T], *args: Any) -> T:
+    """
+    同期のDB処理をDB用スレッドプールで実行（イベントループを止めない）
+
+    func は処理ごとにセッションを作成し、終了時にクローズすること（接続を長時間保持しない）。
+
+    Args:
+        func: 実行する関数
+        *args: 関数の引数
+
+    Returns:
+        関数の戻り値
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, functools.partial(func, *args))
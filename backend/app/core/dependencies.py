@@ -8,7 +8,7 @@ from sqlalchemy.orm import Session
 from app.core import security
 from app.core.config import settings
 from app.core.database import get_db
-from app.models.user import User
+from app.models.user import User, UserRole
 from app.schemas.auth import TokenPayload
 
 # OAuth2スキーム
@@ -70,4 +70,27 @@ def get_current_active_user(
         HTTPException: ユーザーが非アクティブ
     """
     # 将来的にユーザーの有効/無効フラグを追加する場合はここでチェック
-    return current_user
\ No newline at end of file
+    return current_user
+
+
+def get_current_admin_user(
+    current_user: User = Depends(get_current_active_user),
+) -> User:
+    """
+    現在の管理者ユーザーを取得
+    
+    Args:
+        current_user: 現在のユーザー
+    
+    Returns:
+        管理者ユーザー
+    
+    Raises:
+        HTTPException: 管理者ではない
+    """
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions"
+        )
+    return current_user
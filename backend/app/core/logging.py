@@ -0,0 +1,151 @@
+"""
+ログ設定
+
+ログはキュー経由で別スレッドから出力し（QueueHandler / QueueListener）、
+イベントループや処理スレッドが標準出力への書き込みで止まらないようにする。
+出力は key=value 形式で、logger.info("...", extra={"whiteboard_id": ...}) の追加項目も出力する。
+
+ログレベルは Settings.LOG_LEVEL で指定し、モジュールごとのレベルも指定できる。
+    LOG_LEVEL="INFO"
+    LOG_LEVEL="INFO,app.websocket=DEBUG,app.api=WARNING"
+
+メッセージごとのログなど大量に出るログは extra={"sample_key": "..."} を付けると、
+キーごとに1秒あたり LOG_SAMPLE_PER_SECOND 件までに間引かれる
+（間引いた件数は次に出力されるログの suppressed に出力する）。
+"""
+from queue import SimpleQueue
+from typing import Dict, Optional, Tuple
+import atexit
+import json
+import logging
+import logging.handlers
+import sys
+import threading
+import time
+
+from app.core.config import settings
+
+
+# LogRecord の標準属性（これ以外の属性を extra の項目として出力する）
+_RESERVED_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message", "asctime", "sample_key"
+}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class KeyValueFormatter(logging.Formatter):
+    """key=value 形式のフォーマッター"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                fields[key] = value
+        line = " ".join(f"{key}={_format_value(value)}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """sample_key を持つログをキーごとに1秒あたりの件数で間引くフィルター"""
+
+    def __init__(self, per_second: int):
+        super().__init__()
+        self.per_second = per_second
+        # sample_key -> (集計開始時刻, 出力数, 間引いた数)
+        self._windows: Dict[str, Tuple[float, int, int]] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, "sample_key", None)
+        if key is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            started, emitted, suppressed = self._windows.get(key, (now, 0, 0))
+            if now - started >= 1.0:
+                started, emitted = now, 0
+            if emitted >= self.per_second:
+                self._windows[key] = (started, emitted, suppressed + 1)
+                return False
+            self._windows[key] = (started, emitted + 1, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+def setup_logging(level: Optional[str] = None):
+    """
+    ログ出力を設定（アプリケーション起動時に1回呼ぶ）
+
+    Args:
+        level: ログレベルの指定（省略時は Settings.LOG_LEVEL）
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    root_level, module_levels = parse_log_levels(level or settings.LOG_LEVEL)
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(KeyValueFormatter())
+    log_queue: SimpleQueue = SimpleQueue()
+    handler = logging.handlers.QueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(settings.LOG_SAMPLE_PER_SECOND))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(root_level)
+    for name, module_level in module_levels.items():
+        logging.getLogger(name).setLevel(module_level)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """キューに残っているログを出力して出力スレッドを停止（アプリケーション終了時）"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def parse_log_levels(spec: str) -> Tuple[str, Dict[str, str]]:
+    """
+    ログレベルの指定を解析
+
+    Args:
+        spec: "INFO" または "INFO,app.websocket=DEBUG" 形式の指定
+
+    Returns:
+        (全体のレベル, モジュール名 -> レベル)
+    """
+    root_level = "INFO"
+    module_levels: Dict[str, str] = {}
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "=" in part:
+            name, module_level = part.split("=", 1)
+            module_levels[name.strip()] = module_level.strip().upper()
+        else:
+            root_level = part.upper()
+    return root_level, module_levels
+
+
+def _format_value(value) -> str:
+    """空白や引用符を含む値は引用符で囲む"""
+    text = str(value)
+    if not text or any(c in text for c in ' "=\n'):
+        return json.dumps(text, ensure_ascii=False)
+    return text
@@ -66,6 +66,11 @@ class DrawingElementInDB(DrawingElementInDBBase):
     pass
 
 
+class BatchElementCreate(DrawingElementCreate):
+    """バッチ保存する描画要素スキーマ（WebSocketの操作と同じ行に当たるようクライアントの要素IDを含む）"""
+    id: Optional[str] = None
+
+
 class BatchElementsUpdate(BaseModel):
     """バッチ要素更新スキーマ"""
-    elements: List[DrawingElementCreate] = Field(..., description="保存する要素配列")
\ No newline at end of file
+    elements: List[BatchElementCreate] = Field(..., description="保存する要素配列")
\ No newline at end of file
@@ -0,0 +1,148 @@
+"""
+参加時にWebSocketで送るボードのスナップショット
+
+GET /whiteboards/{id}/elements と同じ形式の要素一覧を、エンコード済みのチャンクとして
+ボードごとにキャッシュする。キャッシュは操作ログの位置（epoch, seq）で検証し、
+WebSocket経由の操作があった場合やREST APIで要素が変更された場合は作り直す。
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from uuid import UUID
+import asyncio
+import json
+import time
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal, run_in_db_executor
+from app.models.whiteboard import DrawingElement
+from app.schemas.element import DrawingElement as DrawingElementSchema
+from app.websocket.codec import OutgoingMessage
+
+
+# キャッシュの検証キー（操作ログの epoch, seq）
+SnapshotKey = Tuple[str, int]
+
+
+class BoardSnapshotCache:
+    """ボードのスナップショットのキャッシュ"""
+
+    def __init__(
+        self,
+        chunk_size: int,
+        ttl_seconds: float,
+        session_factory: Callable[[], Session] = SessionLocal
+    ):
+        """
+        キャッシュを初期化
+
+        Args:
+            chunk_size: 1フレームに含める要素数
+            ttl_seconds: キャッシュの有効期間（他ワーカーでのREST更新を反映するため）
+            session_factory: DBセッションの生成関数
+        """
+        self.chunk_size = chunk_size
+        self.ttl_seconds = ttl_seconds
+        self.session_factory = session_factory
+        # whiteboard_id -> (検証キー, 作成時刻, チャンク)
+        self._snapshots: Dict[str, Tuple[SnapshotKey, float, List[OutgoingMessage]]] = {}
+        # whiteboard_id -> 作成中のロック（同時に参加したクライアントで1回だけ作る）
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def invalidate(self, whiteboard_id: str):
+        """
+        ボードのスナップショットを破棄（REST APIで要素を変更した場合）
+
+        Args:
+            whiteboard_id: ホワイトボードID
+        """
+        self._snapshots.pop(str(whiteboard_id), None)
+
+    async def get(
+        self,
+        whiteboard_id: str,
+        key: SnapshotKey,
+        elements: Optional[List[Dict[str, Any]]] = None
+    ) -> List[OutgoingMessage]:
+        """
+        ボードのスナップショットを取得（キャッシュが古い場合は作成）
+
+        Args:
+            whiteboard_id: ホワイトボードID
+            key: 現在の操作ログの位置
+            elements: メモリ上の要素一覧（指定しない場合はDBから読み込む）
+
+        Returns:
+            スナップショットのチャンク
+        """
+        cached = self._valid(whiteboard_id, key)
+        if cached is not None:
+            return cached
+
+        lock = self._locks.setdefault(whiteboard_id, asyncio.Lock())
+        async with lock:
+            cached = self._valid(whiteboard_id, key)
+            if cached is not None:
+                return cached
+            if elements is None:
+                # 同期セッションのためイベントループを止めないようDB用スレッドで実行
+                elements = await run_in_db_executor(self.load_elements, whiteboard_id)
+            chunks = self._encode(elements)
+            self._snapshots[whiteboard_id] = (key, time.monotonic(), chunks)
+        self._locks.pop(whiteboard_id, None)
+        return chunks
+
+    def _valid(self, whiteboard_id: str, key: SnapshotKey) -> Optional[List[OutgoingMessage]]:
+        """検証キーが一致し、有効期間内のキャッシュを返す"""
+        cached = self._snapshots.get(whiteboard_id)
+        if cached is None:
+            return None
+        cached_key, created_at, chunks = cached
+        if cached_key != key or time.monotonic() - created_at > self.ttl_seconds:
+            return None
+        return chunks
+
+    def load_elements(self, whiteboard_id: str) -> List[Dict[str, Any]]:
+        """
+        DBから要素一覧を取得（別スレッドで実行）
+
+        Args:
+            whiteboard_id: ホワイトボードID
+
+        Returns:
+            REST APIと同じ形式の要素一覧
+        """
+        db = self.session_factory()
+        try:
+            elements = db.query(DrawingElement).filter(
+                DrawingElement.whiteboard_id == UUID(whiteboard_id)
+            ).order_by(DrawingElement.created_at).all()
+            return [
+                DrawingElementSchema.model_validate(element).model_dump(mode="json")
+                for element in elements
+            ]
+        finally:
+            db.close()
+
+    def _encode(self, elements: List[Dict[str, Any]]) -> List[OutgoingMessage]:
+        """要素一覧をチャンクに分けてJSONにエンコード"""
+        batches = [
+            elements[i:i + self.chunk_size] for i in range(0, len(elements), self.chunk_size)
+        ] or [[]]
+        chunks = []
+        for index, batch in enumerate(batches):
+            message = {
+                "type": "snapshot",
+                "data": {"elements": batch, "chunk": index, "chunks": len(batches)},
+                "userId": "",
+                "timestamp": ""
+            }
+            chunks.append(OutgoingMessage(message_type="snapshot", text=json.dumps(message)))
+        return chunks
+
+
+# グローバルスナップショットキャッシュ（REST APIの要素変更時に破棄する）
+board_snapshots = BoardSnapshotCache(
+    settings.WS_SNAPSHOT_CHUNK_SIZE,
+    settings.WS_SNAPSHOT_CACHE_TTL_SECONDS
+)
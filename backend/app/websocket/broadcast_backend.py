@@ -0,0 +1,310 @@
+"""
+ルームブロードキャストのプロセス間配信バックエンド
+
+ConnectionManager はプロセスごとに存在するため、複数ワーカーで動かす場合は
+他のワーカーに接続しているメンバーへもメッセージを届ける必要がある。
+- InMemoryBroadcastBackend: 同一プロセス内のみ（単一ワーカー、テスト用の疑似マルチワーカー）
+- RedisBroadcastBackend: Redis Pub/Sub 経由で全ワーカーへ配信（REDIS_URL を設定した場合）
+"""
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Dict, Optional, Set
+import asyncio
+import json
+import logging
+import uuid
+
+from app.core.config import settings
+from app.websocket.codec import JSON_CODEC, OutgoingMessage
+from app.websocket.metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# 他ワーカーからのメッセージを受け取るハンドラー (whiteboard_id, message, exclude_users)
+RemoteHandler = Callable[[str, OutgoingMessage, Set[str]], Awaitable[None]]
+
+# Redisのチャンネル名のプレフィックス
+CHANNEL_PREFIX = "whiteboard:"
+
+# Redisとの接続が切れた場合に購読し直すまでの待ち時間（秒、失敗するたびに倍にする）
+RECONNECT_DELAY_SECONDS = 0.5
+MAX_RECONNECT_DELAY_SECONDS = 30.0
+
+
+class BroadcastBackend(ABC):
+    """プロセス間ブロードキャストのインターフェース"""
+
+    # ルームのメッセージがこのプロセス内からしか発行されないか
+    # （Falseの場合、購読していない間に他のプロセスで発行されたメッセージは受け取れない）
+    is_local = True
+
+    @abstractmethod
+    async def subscribe(self, whiteboard_id: str, subscriber_id: str, handler: RemoteHandler):
+        """
+        ルームの購読を開始
+
+        Args:
+            whiteboard_id: ホワイトボードID
+            subscriber_id: 購読者（ConnectionManager）の識別子
+            handler: 他の購読者からのメッセージを受け取るハンドラー
+        """
+
+    @abstractmethod
+    async def unsubscribe(self, whiteboard_id: str, subscriber_id: str):
+        """
+        ルームの購読を終了
+
+        Args:
+            whiteboard_id: ホワイトボードID
+            subscriber_id: 購読者の識別子
+        """
+
+    @abstractmethod
+    async def publish(
+        self,
+        whiteboard_id: str,
+        message: OutgoingMessage,
+        exclude_users: Set[str],
+        origin: str
+    ):
+        """
+        ルームの他の購読者へメッセージを配信（発行元自身には配信しない）
+
+        Args:
+            whiteboard_id: ホワイトボードID
+            message: 配信するメッセージ
+            exclude_users: 配信から除外するユーザーID
+            origin: 発行元の購読者識別子
+        """
+
+    async def close(self):
+        """バックエンドを停止"""
+
+
+class InMemoryBroadcastBackend(BroadcastBackend):
+    """同一プロセス内の購読者にのみ配信するバックエンド"""
+
+    def __init__(self):
+        # whiteboard_id -> subscriber_id -> handler
+        self._subscribers: Dict[str, Dict[str, RemoteHandler]] = {}
+
+    async def subscribe(self, whiteboard_id: str, subscriber_id: str, handler: RemoteHandler):
+        self._subscribers.setdefault(whiteboard_id, {})[subscriber_id] = handler
+
+    async def unsubscribe(self, whiteboard_id: str, subscriber_id: str):
+        subscribers = self._subscribers.get(whiteboard_id)
+        if subscribers is None:
+            return
+        subscribers.pop(subscriber_id, None)
+        if not subscribers:
+            del self._subscribers[whiteboard_id]
+
+    async def publish(
+        self,
+        whiteboard_id: str,
+        message: OutgoingMessage,
+        exclude_users: Set[str],
+        origin: str
+    ):
+        subscribers = self._subscribers.get(whiteboard_id)
+        if not subscribers or (len(subscribers) == 1 and origin in subscribers):
+            return
+        for subscriber_id, handler in list(subscribers.items()):
+            if subscriber_id != origin:
+                await handler(whiteboard_id, message, exclude_users)
+
+
+class RedisBroadcastBackend(BroadcastBackend):
+    """
+    Redis Pub/Sub 経由で全ワーカーに配信するバックエンド
+
+    ルームごとに1チャンネルを購読し、メッセージは
+    「ヘッダーJSON + 改行 + メッセージのJSONテキスト」の形式で発行する。
+    発行は1つのタスクで順番に行い、ルーム内のメッセージ順序を保つ。
+    Redisが停止している間も発行待ちは outbox_limit 件までしか溜めず、溢れた分は破棄する。
+    """
+
+    is_local = False
+
+    def __init__(self, url: str, channel_prefix: str = CHANNEL_PREFIX, outbox_limit: int = 0):
+        """
+        Redisバックエンドを初期化
+
+        Args:
+            url: RedisのURL
+            channel_prefix: チャンネル名のプレフィックス
+            outbox_limit: 発行待ちにできるメッセージ数（0の場合は上限なし）
+        """
+        self.url = url
+        self.channel_prefix = channel_prefix
+        # このプロセスの識別子（自分が発行したメッセージを無視するため）
+        self.process_id = uuid.uuid4().hex
+        # whiteboard_id -> subscriber_id -> handler
+        self._subscribers: Dict[str, Dict[str, RemoteHandler]] = {}
+        self._redis = None
+        self._pubsub = None
+        self._listener_task: Optional[asyncio.Task] = None
+        self._publisher_task: Optional[asyncio.Task] = None
+        self._outbox: "asyncio.Queue[tuple[str, bytes]]" = asyncio.Queue(maxsize=outbox_limit)
+        # 購読し直すまでの最初の待ち時間（秒）
+        self.reconnect_delay = RECONNECT_DELAY_SECONDS
+
+    def _connect(self):
+        """Redisクライアントを作成（redisパッケージはこのバックエンドを使う場合のみ必要）"""
+        if self._redis is None:
+            import redis.asyncio as redis
+            self._redis = redis.from_url(self.url)
+            self._pubsub = self._redis.pubsub()
+
+    def _channel(self, whiteboard_id: str) -> str:
+        return f"{self.channel_prefix}{whiteboard_id}"
+
+    async def subscribe(self, whiteboard_id: str, subscriber_id: str, handler: RemoteHandler):
+        self._connect()
+        subscribers = self._subscribers.setdefault(whiteboard_id, {})
+        first = not subscribers
+        subscribers[subscriber_id] = handler
+        if first:
+            await self._pubsub.subscribe(self._channel(whiteboard_id))
+        if self._listener_task is None or self._listener_task.done():
+            self._listener_task = asyncio.create_task(self._listen())
+
+    async def unsubscribe(self, whiteboard_id: str, subscriber_id: str):
+        subscribers = self._subscribers.get(whiteboard_id)
+        if subscribers is None:
+            return
+        subscribers.pop(subscriber_id, None)
+        if not subscribers:
+            del self._subscribers[whiteboard_id]
+            await self._pubsub.unsubscribe(self._channel(whiteboard_id))
+
+    async def publish(
+        self,
+        whiteboard_id: str,
+        message: OutgoingMessage,
+        exclude_users: Set[str],
+        origin: str
+    ):
+        # 同一プロセス内の他の購読者にはそのまま渡す
+        for subscriber_id, handler in list(self._subscribers.get(whiteboard_id, {}).items()):
+            if subscriber_id != origin:
+                await handler(whiteboard_id, message, exclude_users)
+
+        header = json.dumps({
+            "process": self.process_id,
+            "type": message.type,
+            "exclude": sorted(exclude_users),
+        })
+        payload = f"{header}\n{message.encode(JSON_CODEC)}".encode()
+        try:
+            self._outbox.put_nowait((self._channel(whiteboard_id), payload))
+        except asyncio.QueueFull:
+            # Redisへの発行が止まっている間は、溢れた分の他ワーカーへの配信を諦める
+            metrics.record_redis_outbox_drop()
+            logger.warning(
+                "Redis outbox full, dropping message",
+                extra={"whiteboard_id": whiteboard_id, "message_type": message.type, "sample_key": "ws.redis_outbox_full"}
+            )
+        if self._publisher_task is None or self._publisher_task.done():
+            self._publisher_task = asyncio.create_task(self._publish_loop())
+
+    async def _publish_loop(self):
+        """発行キューを順番にRedisへ送る"""
+        self._connect()
+        while True:
+            channel, payload = await self._outbox.get()
+            try:
+                await self._redis.publish(channel, payload)
+            except Exception as e:
+                logger.error("Error publishing to Redis", extra={"error": str(e)})
+
+    async def _listen(self):
+        """
+        購読中のチャンネルからメッセージを受け取り、ローカルの購読者へ配信
+
+        配信できないメッセージはログに残して読み飛ばす。Redisとの接続が切れた場合は
+        待ち時間を倍にしながら購読し直し、購読中のルームがなくなるまで終了しない。
+        """
+        delay = self.reconnect_delay
+        reconnect = False
+        while True:
+            try:
+                if reconnect:
+                    await self._resubscribe()
+                    reconnect = False
+                async for item in self._pubsub.listen():
+                    delay = self.reconnect_delay
+                    if item.get("type") != "message":
+                        continue
+                    try:
+                        await self._dispatch(item["channel"], item["data"])
+                    except Exception as e:
+                        logger.warning(
+                            "Dropping undeliverable Redis message",
+                            extra={"channel": str(item.get("channel")), "error": str(e)}
+                        )
+                # 購読中のチャンネルがなくなると listen() が終わる（次の subscribe で再開）
+                if not self._subscribers:
+                    return
+                reconnect = True
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Redis listener disconnected", extra={"error": str(e), "retry_in": delay})
+                reconnect = True
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY_SECONDS)
+
+    async def _resubscribe(self):
+        """Pub/Subの接続を作り直し、購読中のルームのチャンネルを購読し直す"""
+        pubsub, self._pubsub = self._pubsub, self._redis.pubsub()
+        try:
+            await pubsub.close()
+        except Exception:
+            pass
+        channels = [self._channel(whiteboard_id) for whiteboard_id in self._subscribers]
+        if channels:
+            await self._pubsub.subscribe(*channels)
+
+    async def _dispatch(self, channel: bytes | str, data: bytes):
+        """
+        Redisから受信したペイロードをローカルの購読者へ配信
+
+        Args:
+            channel: 受信したチャンネル名
+            data: 受信したペイロード
+        """
+        if isinstance(channel, bytes):
+            channel = channel.decode()
+        whiteboard_id = channel[len(self.channel_prefix):]
+
+        header_line, _, text = data.decode().partition("\n")
+        header = json.loads(header_line)
+        if header.get("process") == self.process_id:
+            return
+
+        message = OutgoingMessage(message_type=header.get("type"), text=text)
+        exclude_users = set(header.get("exclude") or [])
+        for handler in list(self._subscribers.get(whiteboard_id, {}).values()):
+            await handler(whiteboard_id, message, exclude_users)
+
+    async def close(self):
+        for task in (self._listener_task, self._publisher_task):
+            if task is not None:
+                task.cancel()
+        if self._pubsub is not None:
+            await self._pubsub.close()
+        if self._redis is not None:
+            await self._redis.close()
+
+
+def create_broadcast_backend() -> BroadcastBackend:
+    """
+    設定に応じたブロードキャストバックエンドを作成
+
+    Returns:
+        REDIS_URL が設定されていればRedisバックエンド、なければインメモリバックエンド
+    """
+    if settings.REDIS_URL:
+        return RedisBroadcastBackend(settings.REDIS_URL, outbox_limit=settings.WS_REDIS_OUTBOX_LIMIT)
+    return InMemoryBroadcastBackend()
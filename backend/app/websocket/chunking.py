@@ -0,0 +1,129 @@
+"""
+大きなメッセージの分割転送
+
+1フレームの上限（WS_FRAME_SIZE_LIMIT）を超えるメッセージは、クライアントがJSONテキストを分割し、
+chunk メッセージとして順番に送る。
+    {"type": "chunk", "data": {"id": ..., "index": 0, "count": n, "messageType": "draw", "payload": "..."}}
+（messageType は index 0 のみ必須、payload は元のメッセージのJSONテキストの一部）
+
+サーバーは各チャンクを受信した時点でそのまま他のメンバーへ中継し、受信側で元のメッセージに組み立てる。
+サーバーで内容を処理する必要がある draw / erase だけはサーバーでも組み立てて保存し、
+最後に seq 付きの chunk_commit を配信する（再接続時に chunk_commit だけを受け取ったクライアントは再同期する）。
+組み立て中に保持するのは1接続あたり1メッセージ分（WS_MESSAGE_SIZE_LIMIT まで）だけで、
+それを超えるメッセージや1フレームの上限を超えるフレームは 1009 で切断する。
+"""
+from typing import Any, Dict, List, Optional
+import json
+
+from app.websocket.connection import Connection
+
+
+# 分割して送れるメッセージタイプ
+CHUNKABLE_MESSAGE_TYPES = frozenset({"draw", "erase", "drawing_event"})
+
+# サーバーでも組み立てて処理するメッセージタイプ（それ以外は中継のみ）
+ASSEMBLED_MESSAGE_TYPES = frozenset({"draw", "erase"})
+
+
+class MessageTooLarge(Exception):
+    """フレームまたは分割したメッセージ全体が上限を超えた場合の例外（1009 で切断する）"""
+
+
+class ChunkStream:
+    """接続ごとの受信中の分割メッセージ"""
+
+    __slots__ = ("id", "message_type", "count", "next_index", "size", "parts")
+
+    def __init__(self, stream_id: Any, message_type: str, count: int, assemble: bool):
+        self.id = stream_id
+        self.message_type = message_type
+        self.count = count
+        self.next_index = 0
+        self.size = 0
+        # 組み立てが必要な場合のみ payload を保持
+        self.parts: Optional[List[str]] = [] if assemble else None
+
+
+class ChunkAssembler:
+    """分割メッセージの検証と組み立て"""
+
+    def __init__(self, max_message_size: int):
+        """
+        組み立てを初期化
+
+        Args:
+            max_message_size: 分割したメッセージ全体のサイズの上限（payload の文字数）
+        """
+        self.max_message_size = max_message_size
+
+    def accept(self, connection: Connection, data: Any) -> Optional[ChunkStream]:
+        """
+        受信したチャンクを検証して受信中のメッセージに追加
+
+        Args:
+            connection: 受信した接続
+            data: chunk メッセージのデータ
+
+        Returns:
+            チャンクが属する分割メッセージ（順序や形式が不正な場合はNone、中継しない）
+
+        Raises:
+            MessageTooLarge: メッセージ全体が上限を超えた場合
+        """
+        if not isinstance(data, dict) or not isinstance(data.get("payload"), str):
+            return None
+        index, count = data.get("index"), data.get("count")
+        if not _is_int(index) or not _is_int(count) or not 0 <= index < count:
+            return None
+
+        stream = connection.chunks
+        if index == 0:
+            message_type = data.get("messageType")
+            if message_type not in CHUNKABLE_MESSAGE_TYPES or not isinstance(data.get("id"), (str, int)):
+                connection.chunks = None
+                return None
+            # 前のメッセージが途中の場合は破棄する（受信側も同じ送信者の新しいメッセージで置き換える）
+            stream = connection.chunks = ChunkStream(
+                data.get("id"), message_type, count, message_type in ASSEMBLED_MESSAGE_TYPES
+            )
+        elif stream is None or stream.id != data.get("id") or stream.next_index != index or stream.count != count:
+            connection.chunks = None
+            return None
+
+        stream.size += len(data["payload"])
+        if stream.size > self.max_message_size:
+            connection.chunks = None
+            raise MessageTooLarge(f"Chunked message exceeds {self.max_message_size} bytes")
+        if stream.parts is not None:
+            stream.parts.append(data["payload"])
+        stream.next_index += 1
+        if stream.next_index == stream.count:
+            connection.chunks = None
+        return stream
+
+    @staticmethod
+    def assemble(stream: ChunkStream) -> Optional[Dict[str, Any]]:
+        """
+        受信し終えた分割メッセージを元のメッセージに組み立てる
+
+        Args:
+            stream: 最後のチャンクまで受信した分割メッセージ
+
+        Returns:
+            元のメッセージ（組み立て対象外・形式が不正な場合はNone）
+        """
+        if stream.parts is None or stream.next_index != stream.count:
+            return None
+        try:
+            message = json.loads("".join(stream.parts))
+        except ValueError:
+            return None
+        finally:
+            stream.parts = None
+        if not isinstance(message, dict) or message.get("type") != stream.message_type:
+            return None
+        return message
+
+
+def _is_int(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
@@ -0,0 +1,353 @@
+"""
+WebSocketメッセージのエンコード・デコード
+
+クライアントはWebSocketのサブプロトコルでエンコード方式を選択する。
+- whiteboard.json（または指定なし）: 従来どおりJSONテキストフレーム
+- whiteboard.bin.v1: カーソル座標とペンの点列を固定レイアウトのバイナリフレームで送る
+
+バイナリフレームのレイアウト（リトルエンディアン、座標はfloat32）:
+- 0x01 cursor : [op:u8][uid_len:u8][uid:utf8][x:f32][y:f32]
+- 0x02 cursors: [op:u8][count:u16] + count × ([uid_len:u8][uid:utf8][x:f32][y:f32])
+- 0x03 points : [op:u8][json_len:u32][json:utf8][blocks:u16] + blocks × ([n:u32] + n × [x:f32][y:f32])
+  JSON内の {x, y} だけからなる点列は {"$p": ブロック番号} に置き換えられる。
+
+バイナリレイアウトに当てはまらないメッセージはバイナリ接続でもJSONテキストフレームで送る。
+"""
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Tuple, Union
+import json
+import struct
+
+from app.websocket.validation import is_number, is_point
+
+
+SUBPROTOCOL_JSON = "whiteboard.json"
+SUBPROTOCOL_BINARY = "whiteboard.bin.v1"
+
+OP_CURSOR = 0x01
+OP_CURSORS = 0x02
+OP_POINTS = 0x03
+
+_COORDS = struct.Struct("<ff")
+_U8 = struct.Struct("<B")
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+
+# 点列の置き換えに使うキー
+_POINTS_REF = "$p"
+
+# エンコード結果（テキストフレームはstr、バイナリフレームはbytes）
+Frame = Union[str, bytes]
+
+
+class CodecError(ValueError):
+    """フレームのデコードに失敗した場合の例外"""
+
+
+class JsonCodec:
+    """JSONテキストフレームのコーデック"""
+
+    subprotocol: Optional[str] = None
+
+    def encode(self, message: Dict[str, Any]) -> Frame:
+        return json.dumps(message)
+
+    def decode(self, data: Union[str, bytes]) -> Dict[str, Any]:
+        return json.loads(data)
+
+
+class BinaryCodec(JsonCodec):
+    """カーソル・点列を固定レイアウトのバイナリで扱うコーデック"""
+
+    subprotocol = SUBPROTOCOL_BINARY
+
+    def encode(self, message: Dict[str, Any]) -> Frame:
+        """
+        メッセージをエンコード
+
+        Args:
+            message: 送信するメッセージ
+
+        Returns:
+            バイナリフレーム（レイアウトに合わない場合はJSONテキスト）
+        """
+        try:
+            return self._encode_binary(message)
+        except (CodecError, OverflowError, struct.error):
+            # float32に収まらない座標などはJSONで送る
+            return json.dumps(message)
+
+    def _encode_binary(self, message: Dict[str, Any]) -> Frame:
+        """バイナリレイアウトでエンコード（当てはまらない場合はJSONテキスト）"""
+        message_type = message.get("type")
+        data = message.get("data")
+
+        if message_type == "cursor" and _is_bare_point(data):
+            user_id = message.get("userId") or ""
+            return _U8.pack(OP_CURSOR) + _pack_cursor(user_id, data["x"], data["y"])
+
+        if message_type == "cursors" and isinstance(data, dict):
+            cursors = data.get("cursors")
+            if isinstance(cursors, list) and all(_is_cursor_entry(c) for c in cursors):
+                parts = [_U8.pack(OP_CURSORS), _U16.pack(len(cursors))]
+                for cursor in cursors:
+                    parts.append(_pack_cursor(cursor["userId"], cursor["x"], cursor["y"]))
+                return b"".join(parts)
+
+        blocks: List[Sequence[Dict[str, Any]]] = []
+        stripped = _extract_point_lists(message, blocks)
+        if blocks:
+            header = json.dumps(stripped, separators=(",", ":")).encode()
+            parts = [_U8.pack(OP_POINTS), _U32.pack(len(header)), header, _U16.pack(len(blocks))]
+            for points in blocks:
+                parts.append(_U32.pack(len(points)))
+                parts.append(b"".join(_COORDS.pack(p["x"], p["y"]) for p in points))
+            return b"".join(parts)
+
+        return json.dumps(message)
+
+    def decode(self, data: Union[str, bytes]) -> Dict[str, Any]:
+        """
+        フレームをデコード
+
+        Args:
+            data: 受信したフレーム（テキストの場合はJSONとして扱う）
+
+        Returns:
+            デコードしたメッセージ
+
+        Raises:
+            CodecError: バイナリフレームが不正な場合
+        """
+        if isinstance(data, str):
+            return json.loads(data)
+
+        try:
+            op = data[0]
+            if op == OP_CURSOR:
+                user_id, x, y, _ = _unpack_cursor(data, 1)
+                return {"type": "cursor", "data": {"x": x, "y": y}, "userId": user_id, "timestamp": ""}
+
+            if op == OP_CURSORS:
+                (count,) = _U16.unpack_from(data, 1)
+                offset = 1 + _U16.size
+                cursors = []
+                for _ in range(count):
+                    user_id, x, y, offset = _unpack_cursor(data, offset)
+                    cursors.append({"x": x, "y": y, "userId": user_id})
+                return {"type": "cursors", "data": {"cursors": cursors}, "userId": "", "timestamp": ""}
+
+            if op == OP_POINTS:
+                (header_len,) = _U32.unpack_from(data, 1)
+                offset = 1 + _U32.size
+                stripped = json.loads(data[offset:offset + header_len])
+                offset += header_len
+                (block_count,) = _U16.unpack_from(data, offset)
+                offset += _U16.size
+                blocks = []
+                for _ in range(block_count):
+                    (n,) = _U32.unpack_from(data, offset)
+                    offset += _U32.size
+                    points = []
+                    for _ in range(n):
+                        x, y = _COORDS.unpack_from(data, offset)
+                        points.append({"x": x, "y": y})
+                        offset += _COORDS.size
+                    blocks.append(points)
+                return _restore_point_lists(stripped, blocks)
+        except (IndexError, TypeError, struct.error, UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise CodecError(f"Malformed binary frame: {e}") from e
+
+        raise CodecError(f"Unknown binary opcode: {op}")
+
+
+JSON_CODEC = JsonCodec()
+BINARY_CODEC = BinaryCodec()
+
+
+class OutgoingMessage:
+    """
+    送信するメッセージ
+
+    コーデックごとのエンコード結果を1回だけ作って全送信先で共有する。
+    受信したJSONテキストをそのまま中継する場合は、JSON接続にはテキストを変更せずに送り、
+    他のコーデックの接続がある場合にだけデコードする。
+    """
+
+    __slots__ = ("type", "seq", "_message", "_frames", "_senders")
+
+    def __init__(
+        self,
+        message: Optional[Dict[str, Any]] = None,
+        message_type: Optional[str] = None,
+        text: Optional[str] = None,
+        seq: Optional[int] = None
+    ):
+        """
+        送信メッセージを初期化
+
+        Args:
+            message: 送信するメッセージ（textを指定する場合は省略可）
+            message_type: メッセージタイプ（省略時はmessageから取得）
+            text: エンコード済みのJSONテキスト
+            seq: 操作ログでの再開位置（SSEのイベントIDに使用、デコードせずに参照できるよう保持）
+        """
+        if message is None and text is None:
+            raise ValueError("message or text is required")
+        self._message = message
+        self.type = message_type if message_type is not None else (message or {}).get("type")
+        self.seq = seq
+        self._senders: Optional[FrozenSet[str]] = None
+        self._frames: Dict[JsonCodec, Frame] = {}
+        if text is not None:
+            self._frames[JSON_CODEC] = text
+
+    @property
+    def message(self) -> Dict[str, Any]:
+        """デコード済みのメッセージ（必要になった時点でデコード）"""
+        if self._message is None:
+            self._message = json.loads(self._frames[JSON_CODEC])
+        return self._message
+
+    @property
+    def senders(self) -> FrozenSet[str]:
+        """
+        メッセージの送信者のユーザーID（必要になった時点でデコード）
+
+        カーソル・描画プレビューをまとめたフレームは含まれる全員の送信者を返す。
+        デコードせずに中継したテキストがJSONとして不正な場合は空を返す。
+        """
+        if self._senders is None:
+            try:
+                self._senders = _message_senders(self.message)
+            except ValueError:
+                self._senders = frozenset()
+        return self._senders
+
+    def encode(self, codec: JsonCodec) -> Frame:
+        """
+        コーデックでエンコードしたフレームを取得
+
+        Args:
+            codec: 送信先接続のコーデック
+
+        Returns:
+            エンコード済みフレーム
+        """
+        frame = self._frames.get(codec)
+        if frame is None:
+            frame = self._frames[codec] = codec.encode(self.message)
+        return frame
+
+    def with_fields(self, **fields: Any) -> "OutgoingMessage":
+        """
+        トップレベルにフィールドを追加したメッセージを作成
+
+        JSONテキストがある場合はデコードせずに末尾へ追記する（同じキーがあっても追加した値が優先される）。
+
+        Args:
+            **fields: 追加するフィールド
+
+        Returns:
+            フィールドを追加した新しいメッセージ
+        """
+        text = self._frames.get(JSON_CODEC)
+        if text is not None:
+            body = text.rstrip()
+            if body.endswith("}"):
+                extra = ",".join(f"{json.dumps(key)}:{json.dumps(value)}" for key, value in fields.items())
+                separator = "," if body[:-1].rstrip() != "{" else ""
+                return OutgoingMessage(message_type=self.type, text=f"{body[:-1]}{separator}{extra}}}")
+        return OutgoingMessage({**self.message, **fields}, message_type=self.type)
+
+
+def negotiate_codec(offered: Sequence[str]) -> Tuple[JsonCodec, Optional[str]]:
+    """
+    クライアントが提示したサブプロトコルからコーデックを選択
+
+    Args:
+        offered: Sec-WebSocket-Protocol で提示されたサブプロトコル
+
+    Returns:
+        (使用するコーデック, ハンドシェイクで返すサブプロトコル)
+    """
+    if SUBPROTOCOL_BINARY in offered:
+        return BINARY_CODEC, SUBPROTOCOL_BINARY
+    if SUBPROTOCOL_JSON in offered:
+        return JSON_CODEC, SUBPROTOCOL_JSON
+    return JSON_CODEC, None
+
+
+# ヘルパー関数
+
+def _message_senders(message: Dict[str, Any]) -> FrozenSet[str]:
+    """メッセージ（まとめたフレームは各要素）の senderId / userId を集める"""
+    data = message.get("data")
+    if message.get("type") == "cursors" and isinstance(data, dict):
+        items = data.get("cursors") or []
+    elif message.get("type") == "drawing_events" and isinstance(data, dict):
+        items = data.get("events") or []
+    else:
+        items = [message]
+    return frozenset(
+        sender for sender in (
+            item.get("senderId") or item.get("userId") for item in items if isinstance(item, dict)
+        )
+        if isinstance(sender, str) and sender
+    )
+
+
+def _is_bare_point(value: Any) -> bool:
+    """{x, y} だけからなる座標かどうか（他のキーがあるとバイナリに詰められない）"""
+    return is_point(value) and len(value) == 2
+
+
+def _is_cursor_entry(value: Any) -> bool:
+    """{x, y, userId} だけからなるカーソル情報かどうか"""
+    return (
+        isinstance(value, dict)
+        and len(value) == 3
+        and isinstance(value.get("userId"), str)
+        and is_number(value.get("x"))
+        and is_number(value.get("y"))
+    )
+
+
+def _pack_cursor(user_id: str, x: float, y: float) -> bytes:
+    encoded = user_id.encode()
+    if len(encoded) > 255:
+        raise CodecError("userId is too long for binary cursor frame")
+    return _U8.pack(len(encoded)) + encoded + _COORDS.pack(x, y)
+
+
+def _unpack_cursor(data: bytes, offset: int) -> Tuple[str, float, float, int]:
+    (length,) = _U8.unpack_from(data, offset)
+    offset += _U8.size
+    user_id = data[offset:offset + length].decode()
+    if len(user_id.encode()) != length:
+        raise CodecError("Truncated userId")
+    offset += length
+    x, y = _COORDS.unpack_from(data, offset)
+    return user_id, x, y, offset + _COORDS.size
+
+
+def _extract_point_lists(value: Any, blocks: List[Sequence[Dict[str, Any]]]) -> Any:
+    """点列を取り出して参照に置き換えたコピーを返す"""
+    if isinstance(value, list):
+        if value and all(_is_bare_point(p) for p in value):
+            blocks.append(value)
+            return {_POINTS_REF: len(blocks) - 1}
+        return [_extract_point_lists(v, blocks) for v in value]
+    if isinstance(value, dict):
+        return {k: _extract_point_lists(v, blocks) for k, v in value.items()}
+    return value
+
+
+def _restore_point_lists(value: Any, blocks: List[List[Dict[str, float]]]) -> Any:
+    """参照に置き換えた点列を元に戻す"""
+    if isinstance(value, list):
+        return [_restore_point_lists(v, blocks) for v in value]
+    if isinstance(value, dict):
+        if len(value) == 1 and _POINTS_REF in value:
+            return blocks[value[_POINTS_REF]]
+        return {k: _restore_point_lists(v, blocks) for k, v in value.items()}
+    return value
@@ -0,0 +1,90 @@
+from fastapi import WebSocket
+import time
+
+from app.websocket.codec import JsonCodec
+from app.websocket.outbound_queue import OutboundQueue
+
+
+class Connection:
+    """
+    WebSocket接続1本分の情報
+
+    接続数の上限（WS_CONNECTION_LIMIT）まで保持するため、__slots__ でメモリを抑える。
+    """
+
+    __slots__ = (
+        "websocket",
+        "user_id",
+        "whiteboard_id",
+        "codec",
+        "queue",
+        "joined_at",
+        "messages_in",
+        "messages_out",
+        "resumed",
+        "rate_buckets",
+        "messages_dropped",
+        "rate_limited",
+        "heartbeat_slot",
+        "heartbeat_seen",
+        "missed_pongs",
+        "strokes",
+        "viewport",
+        "chunks",
+        "viewer",
+        "permission",
+    )
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        user_id: str,
+        whiteboard_id: str,
+        codec: JsonCodec,
+        queue: OutboundQueue
+    ):
+        """
+        接続情報を初期化
+
+        Args:
+            websocket: WebSocket接続
+            user_id: ユーザーID
+            whiteboard_id: ホワイトボードID
+            codec: この接続で使用するコーデック
+            queue: この接続の送信キュー
+        """
+        self.websocket = websocket
+        self.user_id = user_id
+        self.whiteboard_id = whiteboard_id
+        self.codec = codec
+        self.queue = queue
+        self.joined_at = time.time()
+        # 受信・送信したメッセージ数
+        self.messages_in = 0
+        self.messages_out = 0
+        # 再接続時に取りこぼした操作を差分で再送できたか
+        self.resumed = False
+        # メッセージタイプ -> 受信レート制限のバケット（app.websocket.rate_limiter 参照）
+        self.rate_buckets = {}
+        # レート制限で破棄したメッセージ数
+        self.messages_dropped = 0
+        # 状態変更メッセージを破棄し、再同期を通知済みか（次に受け付けた時点で解除）
+        self.rate_limited = False
+        # ハートビートのホイール上のスロット、前回確認時の受信数、応答のない ping の回数
+        # （app.websocket.heartbeat 参照）
+        self.heartbeat_slot = None
+        self.heartbeat_seen = 0
+        self.missed_pongs = 0
+        # strokeId -> 描画中のストローク（app.websocket.stroke_stream 参照）
+        self.strokes = {}
+        # 表示範囲（None の場合はルーム全体の配信を受け取る、app.websocket.interest 参照）
+        self.viewport = None
+        # 受信中の分割メッセージ（app.websocket.chunking 参照）
+        self.chunks = None
+        # 閲覧専用接続か（app.websocket.viewers 参照）
+        self.viewer = False
+        # ハンドシェイクで解決したボードへの権限（None の場合は未解決、app.websocket.handshake_auth 参照）
+        self.permission = None
+
+    def __repr__(self):
+        return f"<Connection(user_id={self.user_id}, whiteboard_id={self.whiteboard_id})>"
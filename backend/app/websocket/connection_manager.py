@@ -1,21 +1,91 @@
+from collections import OrderedDict
 from typing import Dict, List, Set
 from fastapi import WebSocket
-from uuid import UUID
-import json
+from uuid import UUID, uuid4
+import logging
+import time
+
+from app.core.config import settings
+from app.websocket.broadcast_backend import BroadcastBackend, InMemoryBroadcastBackend
+from app.websocket.codec import JSON_CODEC, JsonCodec, OutgoingMessage
+from app.websocket.connection import Connection
+from app.websocket.heartbeat import HeartbeatWheel
+from app.websocket.interest import Rect, intersects
+from app.websocket.metrics import metrics
+from app.websocket.op_log import SEQUENCED_MESSAGE_TYPES, RoomOpLog
+from app.websocket.outbound_queue import OutboundQueue
+from app.websocket.relay import peek_message_type
+from app.websocket.viewers import ViewerTier
+
+
+logger = logging.getLogger(__name__)
+
+# サーバーから送るハートビート（全接続で同じエンコード結果を使い回す）
+HEARTBEAT_PING = OutgoingMessage({"type": "ping", "data": {}, "userId": "", "timestamp": ""})
 
 
 class ConnectionManager:
     """WebSocket接続管理クラス"""
     
-    def __init__(self):
-        # whiteboard_id -> List[WebSocket]
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+    def __init__(
+        self,
+        send_timeout: float | None = None,
+        queue_size: int | None = None,
+        overflow_policy: str | None = None,
+        backend: BroadcastBackend | None = None,
+        heartbeat_interval: float | None = None
+    ):
+        # 1送信あたりのタイムアウト（秒）
+        self.send_timeout = (
+            send_timeout if send_timeout is not None else settings.WS_SEND_TIMEOUT_SECONDS
+        )
+        # 接続ごとの送信キュー上限と溢れ時のポリシー
+        self.queue_size = queue_size if queue_size is not None else settings.WS_OUTBOUND_QUEUE_SIZE
+        self.overflow_policy = overflow_policy or settings.WS_OUTBOUND_OVERFLOW_POLICY
+        self.cursor_queue_size = settings.WS_OUTBOUND_CURSOR_QUEUE_SIZE
+        # 他ワーカーのメンバーへ配信するバックエンドと、このマネージャーの識別子
+        self.backend = backend or InMemoryBroadcastBackend()
+        self.instance_id = uuid4().hex
+        # whiteboard_id -> user_id -> Set[Connection]（同じユーザーの複数タブに対応）
+        self.rooms: Dict[str, Dict[str, Set[Connection]]] = {}
+        # 閲覧専用接続（メンバーとは別に管理し、共有フレームと間引いたカーソルだけを配信）
+        self.viewers = ViewerTier(settings.WS_VIEWER_CURSOR_HZ, self._enqueue)
         # user_id -> Set[whiteboard_id]
         self.user_sessions: Dict[str, Set[str]] = {}
-        # websocket -> (user_id, whiteboard_id)
-        self.connection_info: Dict[WebSocket, tuple[str, str]] = {}
+        # websocket -> Connection
+        self.connections: Dict[WebSocket, Connection] = {}
+        # whiteboard_id -> 表示範囲を登録している接続数（app.websocket.interest 参照）
+        self.viewport_counts: Dict[str, int] = {}
+        self.viewport_margin = settings.WS_VIEWPORT_MARGIN
+        # whiteboard_id -> 操作ログ（最近使ったものほど後ろ、接続がなくなっても再接続用に残す）
+        self.op_logs: "OrderedDict[str, RoomOpLog]" = OrderedDict()
+        # サーバー主導のハートビート（0の場合は無効）
+        if heartbeat_interval is None:
+            heartbeat_interval = settings.WS_HEARTBEAT_INTERVAL_SECONDS
+        self.heartbeat = (
+            HeartbeatWheel(
+                heartbeat_interval,
+                settings.WS_HEARTBEAT_MAX_MISSED,
+                on_ping=self._send_heartbeat,
+                on_idle=self._evict_idle
+            )
+            if heartbeat_interval > 0 else None
+        )
     
-    async def connect(self, websocket: WebSocket, whiteboard_id: str, user_id: str):
+    async def connect(
+        self,
+        websocket: WebSocket,
+        whiteboard_id: str,
+        user_id: str,
+        codec: JsonCodec = JSON_CODEC,
+        subprotocol: str | None = None,
+        last_seq: int | None = None,
+        epoch: str | None = None,
+        send_resync: bool = True,
+        viewer: bool = False,
+        heartbeat: bool = True,
+        permission: str | None = None
+    ) -> Connection:
         """
         WebSocket接続を受け入れて管理
         
@@ -23,21 +93,66 @@ class ConnectionManager:
             websocket: WebSocket接続
             whiteboard_id: ホワイトボードID
             user_id: ユーザーID
+            codec: この接続で使用するコーデック
+            subprotocol: ハンドシェイクで返すサブプロトコル
+            last_seq: 再接続時にクライアントが最後に受信した seq
+            epoch: last_seq を受信した操作ログの epoch
+            send_resync: 差分を再送できない場合に再同期（resync）を要求するか
+                （スナップショットを送る場合はFalse）
+            viewer: 閲覧専用接続として登録するか（入退室を通知せず、受信したメッセージを処理しない）
+            heartbeat: ハートビートの対象にするか（応答を返せないSSEの接続はFalse）
+            permission: ハンドシェイクで解決したボードへの権限（閲覧のみの場合は要素を変更できない）
+        
+        Returns:
+            登録した接続情報
         """
-        await websocket.accept()
+        await websocket.accept(subprotocol=subprotocol)
         
-        # ホワイトボードの接続リストに追加
-        if whiteboard_id not in self.active_connections:
-            self.active_connections[whiteboard_id] = []
-        self.active_connections[whiteboard_id].append(websocket)
+        # 送信キューと書き込みタスクを用意
+        async def on_failure():
+            await self.disconnect(websocket, whiteboard_id, user_id)
         
-        # ユーザーセッションに追加
-        if user_id not in self.user_sessions:
-            self.user_sessions[user_id] = set()
-        self.user_sessions[user_id].add(whiteboard_id)
+        queue = OutboundQueue(
+            websocket,
+            max_size=self.queue_size,
+            send_timeout=self.send_timeout,
+            overflow_policy=self.overflow_policy,
+            on_failure=on_failure,
+            cursor_queue_size=self.cursor_queue_size
+        )
+        connection = Connection(websocket, user_id, whiteboard_id, codec, queue)
+        connection.viewer = viewer
+        connection.permission = permission
+        self.connections[websocket] = connection
+        metrics.record_connect()
+        
+        # ルームに追加（このプロセスで最初の接続ならルームを購読）
+        if not self._has_local_connections(whiteboard_id):
+            await self.backend.subscribe(whiteboard_id, self.instance_id, self._on_remote_message)
+        if viewer:
+            self.viewers.add(connection)
+        else:
+            self.rooms.setdefault(whiteboard_id, {}).setdefault(user_id, set()).add(connection)
+        
+        # 再接続の場合は取りこぼした操作を再送（ルーム登録と同時に積んで新しい配信との順序を保つ）
+        if last_seq is not None:
+            connection.resumed = self._resume(connection, last_seq, epoch)
+            if not connection.resumed and send_resync:
+                self._enqueue(connection, OutgoingMessage({
+                    "type": "resync",
+                    "data": {"reason": "gap"},
+                    "userId": "",
+                    "timestamp": ""
+                }))
+        
+        queue.start()
+        if self.heartbeat is not None and heartbeat:
+            self.heartbeat.add(connection)
+        if viewer:
+            return connection
         
-        # 接続情報を保存
-        self.connection_info[websocket] = (user_id, whiteboard_id)
+        # ユーザーセッションに追加
+        self.user_sessions.setdefault(user_id, set()).add(whiteboard_id)
         
         # 他のユーザーに参加を通知
         await self.broadcast_to_whiteboard(
@@ -53,6 +168,7 @@ class ConnectionManager:
             },
             exclude_user=user_id
         )
+        return connection
     
     async def disconnect(self, websocket: WebSocket, whiteboard_id: str, user_id: str):
         """
@@ -63,22 +179,40 @@ class ConnectionManager:
             whiteboard_id: ホワイトボードID
             user_id: ユーザーID
         """
-        # ホワイトボードの接続リストから削除
-        if whiteboard_id in self.active_connections:
-            if websocket in self.active_connections[whiteboard_id]:
-                self.active_connections[whiteboard_id].remove(websocket)
-            if not self.active_connections[whiteboard_id]:
-                del self.active_connections[whiteboard_id]
+        # 既に切断済みの接続は何もしない（離脱通知の重複を防ぐ）
+        connection = self.connections.pop(websocket, None)
+        if connection is None:
+            return
         
-        # ユーザーセッションから削除
-        if user_id in self.user_sessions:
-            self.user_sessions[user_id].discard(whiteboard_id)
-            if not self.user_sessions[user_id]:
-                del self.user_sessions[user_id]
+        # 送信キューを破棄（破棄前にクローズコードと破棄数を記録）
+        metrics.record_disconnect(connection)
+        connection.queue.close()
+        self.set_viewport(connection, None)
+        if self.heartbeat is not None:
+            self.heartbeat.remove(connection)
+        
+        if connection.viewer:
+            self.viewers.remove(connection)
+            await self._release_room(whiteboard_id)
+            return
         
-        # 接続情報を削除
-        if websocket in self.connection_info:
-            del self.connection_info[websocket]
+        # ルームから削除（ユーザーの最後の接続ならユーザーごと削除）
+        room = self.rooms.get(whiteboard_id)
+        if room is not None:
+            user_connections = room.get(user_id)
+            if user_connections is not None:
+                user_connections.discard(connection)
+                if not user_connections:
+                    del room[user_id]
+                    # ユーザーセッションから削除
+                    sessions = self.user_sessions.get(user_id)
+                    if sessions is not None:
+                        sessions.discard(whiteboard_id)
+                        if not sessions:
+                            del self.user_sessions[user_id]
+            if not room:
+                del self.rooms[whiteboard_id]
+                await self._release_room(whiteboard_id)
         
         # 他のユーザーに離脱を通知
         await self.broadcast_to_whiteboard(
@@ -95,60 +229,305 @@ class ConnectionManager:
             exclude_user=user_id
         )
     
+    def _resume(self, connection: Connection, last_seq: int, epoch: str | None) -> bool:
+        """
+        再接続したクライアントに取りこぼした操作を再送
+        
+        Args:
+            connection: 再接続した接続
+            last_seq: クライアントが最後に受信した seq
+            epoch: last_seq を受信した操作ログの epoch
+        
+        Returns:
+            再送できたかどうか（Falseの場合は全体の再同期が必要）
+        """
+        op_log = self.op_logs.get(connection.whiteboard_id)
+        missed = (
+            op_log.since(last_seq, connection.user_id)
+            if op_log is not None and op_log.epoch == epoch else None
+        )
+        if missed is None:
+            return False
+        for outgoing in missed:
+            self._enqueue(connection, outgoing)
+        return True
+    
+    def _has_local_connections(self, whiteboard_id: str) -> bool:
+        """このプロセスにルームのメンバーまたは閲覧専用接続がいるか"""
+        return bool(self.rooms.get(whiteboard_id)) or self.viewers.count(whiteboard_id) > 0
+    
+    async def _release_room(self, whiteboard_id: str):
+        """このプロセスの最後の接続が切断されたルームの購読を解除"""
+        if self._has_local_connections(whiteboard_id):
+            return
+        await self.backend.unsubscribe(whiteboard_id, self.instance_id)
+        # 購読していない間の他ワーカーの操作はログに残らないため、差分再送には使えない
+        if not self.backend.is_local:
+            self.op_logs.pop(whiteboard_id, None)
+    
+    def get_op_log(self, whiteboard_id: str) -> RoomOpLog:
+        """
+        ホワイトボードの操作ログを取得（なければ作成）
+        
+        Args:
+            whiteboard_id: ホワイトボードID
+        
+        Returns:
+            操作ログ
+        """
+        op_log = self.op_logs.get(whiteboard_id)
+        if op_log is None:
+            op_log = self.op_logs[whiteboard_id] = RoomOpLog(settings.WS_OP_LOG_SIZE)
+            self._evict_op_logs()
+        else:
+            self.op_logs.move_to_end(whiteboard_id)
+        return op_log
+    
+    def _evict_op_logs(self):
+        """上限を超えた操作ログを、接続のないルームの古いものから削除"""
+        excess = len(self.op_logs) - settings.WS_OP_LOG_MAX_ROOMS
+        if excess <= 0:
+            return
+        for whiteboard_id in list(self.op_logs):
+            if whiteboard_id not in self.rooms:
+                del self.op_logs[whiteboard_id]
+                excess -= 1
+                if excess <= 0:
+                    break
+    
+    def set_viewport(self, connection: Connection, viewport: Rect | None):
+        """
+        接続の表示範囲を登録（Noneの場合は解除してルーム全体の配信を受け取る）
+        
+        Args:
+            connection: 接続
+            viewport: 表示範囲
+        """
+        whiteboard_id = connection.whiteboard_id
+        delta = (viewport is not None) - (connection.viewport is not None)
+        connection.viewport = viewport
+        if delta:
+            count = self.viewport_counts.get(whiteboard_id, 0) + delta
+            if count > 0:
+                self.viewport_counts[whiteboard_id] = count
+            else:
+                self.viewport_counts.pop(whiteboard_id, None)
+    
+    def has_viewports(self, whiteboard_id: str) -> bool:
+        """ルームに表示範囲を登録している接続があるか（ない場合は座標を取り出さずに全体へ配信）"""
+        return whiteboard_id in self.viewport_counts
+    
+    def is_visible(self, connection: Connection, bounds: Rect | None) -> bool:
+        """
+        メッセージが接続の表示範囲（＋余白）に含まれるか
+        
+        Args:
+            connection: 配信先の接続
+            bounds: メッセージの座標の外接矩形（Noneの場合は常に含まれる）
+        
+        Returns:
+            配信するかどうか
+        """
+        return (
+            bounds is None
+            or connection.viewport is None
+            or intersects(connection.viewport, bounds, self.viewport_margin)
+        )
+    
+    def get_connection(self, websocket: WebSocket) -> Connection | None:
+        """
+        WebSocketに対応する接続情報を取得
+        
+        Args:
+            websocket: WebSocket接続
+        
+        Returns:
+            接続情報（管理外の場合はNone）
+        """
+        return self.connections.get(websocket)
+    
     async def send_personal_message(self, message: str, websocket: WebSocket):
         """
         特定のWebSocketに個人メッセージを送信
         
+        管理下の接続であれば送信キュー経由で送り、ブロードキャストとの順序を保つ。
+        
         Args:
             message: 送信するメッセージ
             websocket: 送信先のWebSocket
         """
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            connection.messages_out += 1
+            metrics.record_outbound(peek_message_type(message), len(message))
+            connection.queue.put(None, message)
+            return
+        
         try:
             await websocket.send_text(message)
         except Exception as e:
-            print(f"Error sending personal message: {e}")
+            logger.info("Error sending personal message", extra={"error": str(e)})
     
     async def broadcast_to_whiteboard(
         self, 
         whiteboard_id: str, 
-        message: dict, 
-        exclude_user: str | None = None
+        message: dict | OutgoingMessage, 
+        exclude_user: str | None = None,
+        exclude_users: Set[str] | None = None,
+        bounds: Rect | None = None
     ):
         """
         特定のホワイトボードの全ユーザーにメッセージをブロードキャスト
         
         Args:
             whiteboard_id: ホワイトボードID
-            message: 送信するメッセージ
+            message: 送信するメッセージ（エンコード済みの場合はOutgoingMessage）
             exclude_user: 除外するユーザーID（送信者など）
+            exclude_users: 除外するユーザーIDのセット（複数送信者をまとめて配信する場合）
+            bounds: メッセージの座標の外接矩形（指定した場合、表示範囲外の接続には送らない）
+                他ワーカーのメンバーには絞り込まずに配信する
         """
-        if whiteboard_id not in self.active_connections:
-            return
+        excluded = set(exclude_users) if exclude_users else set()
+        if exclude_user:
+            excluded.add(exclude_user)
+        
+        # エンコード結果はコーデックごとに1回だけ作って全送信先で共有
+        outgoing = message if isinstance(message, OutgoingMessage) else OutgoingMessage(message)
+        
+        self._deliver_local(whiteboard_id, outgoing, excluded, bounds)
+        
+        # 他ワーカーに接続しているメンバーへ配信
+        await self.backend.publish(whiteboard_id, outgoing, excluded, self.instance_id)
+    
+    async def publish_remote(
+        self,
+        whiteboard_id: str,
+        message: dict | OutgoingMessage,
+        exclude_users: Set[str] | None = None
+    ):
+        """
+        他ワーカーに接続しているメンバーにだけ配信（このプロセスのメンバーへは呼び出し側が個別に送る）
+        
+        Args:
+            whiteboard_id: ホワイトボードID
+            message: 送信するメッセージ（エンコード済みの場合はOutgoingMessage）
+            exclude_users: 除外するユーザーIDのセット
+        """
+        outgoing = message if isinstance(message, OutgoingMessage) else OutgoingMessage(message)
+        await self.backend.publish(whiteboard_id, outgoing, set(exclude_users or ()), self.instance_id)
+    
+    async def _on_remote_message(
+        self,
+        whiteboard_id: str,
+        outgoing: OutgoingMessage,
+        exclude_users: Set[str]
+    ):
+        """
+        他ワーカーから届いたメッセージをこのプロセスのメンバーへ配信
+        
+        Args:
+            whiteboard_id: ホワイトボードID
+            outgoing: 配信するメッセージ
+            exclude_users: 除外するユーザーID
+        """
+        self._deliver_local(whiteboard_id, outgoing, exclude_users)
+    
+    def _deliver_local(
+        self,
+        whiteboard_id: str,
+        outgoing: OutgoingMessage,
+        excluded: Set[str],
+        bounds: Rect | None = None
+    ):
+        """
+        このプロセスに接続しているルームメンバーの送信キューに積む
+        
+        実際の送信は接続ごとの書き込みタスクが行う（遅いクライアントが送信者や他のメンバーを待たせない）
         
-        # メッセージをJSON文字列に変換
-        message_text = json.dumps(message)
+        Args:
+            whiteboard_id: ホワイトボードID
+            outgoing: 配信するメッセージ
+            excluded: 除外するユーザーID
+            bounds: メッセージの座標の外接矩形（表示範囲外の接続には送らない）
+        """
+        room = self.rooms.get(whiteboard_id)
+        if not room and not self.viewers.count(whiteboard_id):
+            return
         
-        # 切断されたWebSocketを追跡
-        disconnected = []
+        # 要素を変更する操作は seq を付けてログに残す
+        if outgoing.type in SEQUENCED_MESSAGE_TYPES:
+            outgoing = self.get_op_log(whiteboard_id).append(outgoing, frozenset(excluded))
         
-        for connection in self.active_connections[whiteboard_id]:
+        started = time.perf_counter()
+        recipients = 0
+        skipped = 0
+        if bounds is not None and whiteboard_id not in self.viewport_counts:
+            bounds = None
+        for user_id, user_connections in (room or {}).items():
             # 除外ユーザーのチェック
-            if exclude_user and connection in self.connection_info:
-                user_id, _ = self.connection_info[connection]
-                if user_id == exclude_user:
+            if user_id in excluded:
+                continue
+            for connection in user_connections:
+                if bounds is not None and not self.is_visible(connection, bounds):
+                    skipped += 1
                     continue
-            
-            try:
-                await connection.send_text(message_text)
-            except Exception as e:
-                print(f"Error broadcasting message: {e}")
-                disconnected.append(connection)
-        
-        # 切断されたWebSocketを削除
-        for connection in disconnected:
-            if connection in self.connection_info:
-                user_id, wb_id = self.connection_info[connection]
-                await self.disconnect(connection, wb_id, user_id)
+                self._enqueue(connection, outgoing)
+                recipients += 1
+        # 閲覧専用接続には除外・表示範囲の判定をせずに配信（カーソルは間引く）
+        recipients += self.viewers.deliver(whiteboard_id, outgoing)
+        metrics.record_fanout(time.perf_counter() - started, recipients, skipped)
+    
+    async def send_to_user(self, whiteboard_id: str, user_id: str, message: dict | OutgoingMessage):
+        """
+        ホワイトボード上の特定ユーザーの全接続にメッセージを送信
+        
+        Args:
+            whiteboard_id: ホワイトボードID
+            user_id: 送信先のユーザーID
+            message: 送信するメッセージ（エンコード済みの場合はOutgoingMessage）
+        """
+        user_connections = self.rooms.get(whiteboard_id, {}).get(user_id)
+        if not user_connections:
+            return
+        
+        outgoing = message if isinstance(message, OutgoingMessage) else OutgoingMessage(message)
+        for connection in user_connections:
+            self._enqueue(connection, outgoing)
+    
+    def send_to_connection(self, connection: Connection, message: dict | OutgoingMessage):
+        """
+        特定の接続にメッセージを送信
+        
+        Args:
+            connection: 送信先の接続
+            message: 送信するメッセージ（エンコード済みの場合はOutgoingMessage）
+        """
+        outgoing = message if isinstance(message, OutgoingMessage) else OutgoingMessage(message)
+        self._enqueue(connection, outgoing)
+    
+    @staticmethod
+    def _enqueue(connection: Connection, outgoing: OutgoingMessage):
+        """
+        接続のコーデックでエンコードして送信キューに積む
+        
+        デコードせずに中継したテキスト（cursor など）がJSONとして不正な場合、
+        デコードが必要な接続（バイナリコーデック）にだけ送らない。
+        
+        Args:
+            connection: 送信先の接続
+            outgoing: 送信するメッセージ
+        """
+        try:
+            frame = outgoing.encode(connection.codec)
+        except ValueError:
+            logger.debug(
+                "Malformed relayed message skipped",
+                extra={"message_type": outgoing.type, "user_id": connection.user_id, "sample_key": "ws.malformed"}
+            )
+            return
+        connection.messages_out += 1
+        metrics.record_outbound(outgoing.type, len(frame))
+        connection.queue.put(outgoing.type, frame, outgoing)
     
     def get_whiteboard_users(self, whiteboard_id: str) -> List[str]:
         """
@@ -160,14 +539,7 @@ class ConnectionManager:
         Returns:
             ユーザーIDのリスト
         """
-        users = []
-        if whiteboard_id in self.active_connections:
-            for connection in self.active_connections[whiteboard_id]:
-                if connection in self.connection_info:
-                    user_id, _ = self.connection_info[connection]
-                    if user_id not in users:
-                        users.append(user_id)
-        return users
+        return list(self.rooms.get(whiteboard_id, {}))
     
     def get_user_whiteboards(self, user_id: str) -> Set[str]:
         """
@@ -179,4 +551,25 @@ class ConnectionManager:
         Returns:
             ホワイトボードIDのセット
         """
-        return self.user_sessions.get(user_id, set())
\ No newline at end of file
+        return self.user_sessions.get(user_id, set())
+    
+    def _send_heartbeat(self, connection: Connection):
+        """ハートビートの ping を送信（クライアントは pong を返す）"""
+        self._enqueue(connection, HEARTBEAT_PING)
+    
+    def _evict_idle(self, connection: Connection):
+        """ハートビートに応答しない接続を切断（切断後に送信キューから disconnect される）"""
+        logger.info(
+            "Evicting idle connection",
+            extra={"whiteboard_id": connection.whiteboard_id, "user_id": connection.user_id}
+        )
+        connection.queue.disconnect_idle()
+    
+    async def shutdown(self):
+        """全接続の送信キューを停止し、ブロードキャストバックエンドを閉じる"""
+        if self.heartbeat is not None:
+            self.heartbeat.stop()
+        self.viewers.stop()
+        for connection in list(self.connections.values()):
+            connection.queue.close()
+        await self.backend.close()
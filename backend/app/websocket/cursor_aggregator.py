@@ -0,0 +1,122 @@
+from typing import Any, Dict, List, Tuple
+import asyncio
+
+from app.websocket.codec import OutgoingMessage
+from app.websocket.connection_manager import ConnectionManager
+from app.websocket.interest import point_bounds
+
+
+class CursorAggregator:
+    """
+    ルームごとのカーソル位置集約クラス
+
+    カーソル更新を受信するたびに配信するのではなく、ユーザーごとの最新位置だけを保持し、
+    一定間隔（tick）ごとに全ユーザー分をまとめた1つの "cursors" フレームとして配信する。
+    これにより配信フレーム数が O(ユーザー数² × 送信レート) から O(ユーザー数 × tick) に下がる。
+    表示範囲を登録しているメンバーがいるルームでは、範囲内のカーソルだけを含むフレームを送る
+    （同じカーソルの組み合わせになる接続どうしでエンコード結果を共有する）。
+    """
+
+    def __init__(self, connection_manager: ConnectionManager, flush_hz: float):
+        """
+        カーソル集約を初期化
+
+        Args:
+            connection_manager: 配信に使用する接続マネージャー
+            flush_hz: 1秒あたりの配信回数
+        """
+        self.manager = connection_manager
+        self.flush_interval = 1.0 / flush_hz
+        # whiteboard_id -> user_id -> 最新のカーソル情報
+        self._pending: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # whiteboard_id -> 配信待ちタスク
+        self._flush_tasks: Dict[str, asyncio.Task] = {}
+
+    def update(self, whiteboard_id: str, user_id: str, data: Dict[str, Any]):
+        """
+        ユーザーの最新カーソル位置を記録し、次のtickでの配信を予約
+
+        Args:
+            whiteboard_id: ホワイトボードID
+            user_id: ユーザーID
+            data: カーソル情報（x, y など）
+        """
+        cursor = dict(data)
+        cursor["userId"] = user_id
+        self._pending.setdefault(whiteboard_id, {})[user_id] = cursor
+
+        if whiteboard_id not in self._flush_tasks:
+            self._flush_tasks[whiteboard_id] = asyncio.create_task(
+                self._flush_after_tick(whiteboard_id)
+            )
+
+    def discard_user(self, whiteboard_id: str, user_id: str):
+        """
+        配信待ちのカーソルからユーザーを除外（離脱時）
+
+        Args:
+            whiteboard_id: ホワイトボードID
+            user_id: ユーザーID
+        """
+        pending = self._pending.get(whiteboard_id)
+        if pending:
+            pending.pop(user_id, None)
+
+    async def _flush_after_tick(self, whiteboard_id: str):
+        """1tick待ってからルームのカーソルを配信"""
+        try:
+            await asyncio.sleep(self.flush_interval)
+        finally:
+            self._flush_tasks.pop(whiteboard_id, None)
+        await self.flush(whiteboard_id)
+
+    async def flush(self, whiteboard_id: str):
+        """
+        ルームに溜まったカーソル位置を1フレームにまとめて配信
+
+        Args:
+            whiteboard_id: ホワイトボードID
+        """
+        pending = self._pending.pop(whiteboard_id, None)
+        if not pending:
+            return
+
+        if self.manager.has_viewports(whiteboard_id):
+            await self._flush_by_viewport(whiteboard_id, pending)
+            return
+
+        # 自分のカーソルはクライアント側でuserIdにより除外する
+        await self.manager.broadcast_to_whiteboard(whiteboard_id, self._build_frame(list(pending.values())))
+
+    async def _flush_by_viewport(self, whiteboard_id: str, pending: Dict[str, Dict[str, Any]]):
+        """接続ごとに表示範囲内のカーソルだけを配信"""
+        cursors = [(user_id, cursor, point_bounds(cursor)) for user_id, cursor in pending.items()]
+        frames: Dict[Tuple[str, ...], OutgoingMessage] = {}
+        for user_connections in list(self.manager.rooms.get(whiteboard_id, {}).values()):
+            for connection in user_connections:
+                visible = tuple(
+                    user_id for user_id, _, bounds in cursors
+                    if self.manager.is_visible(connection, bounds)
+                )
+                if not visible:
+                    continue
+                frame = frames.get(visible)
+                if frame is None:
+                    frame = frames[visible] = OutgoingMessage(
+                        self._build_frame([pending[user_id] for user_id in visible])
+                    )
+                self.manager.send_to_connection(connection, frame)
+
+        # 閲覧専用接続と他ワーカーのメンバーには絞り込まずに配信
+        frame = OutgoingMessage(self._build_frame(list(pending.values())))
+        self.manager.viewers.deliver(whiteboard_id, frame)
+        await self.manager.publish_remote(whiteboard_id, frame)
+
+    @staticmethod
+    def _build_frame(cursors: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {
+            "type": "cursors",
+            "data": {"cursors": cursors},
+            "userId": "",
+            "timestamp": ""
+        }
@@ -0,0 +1,142 @@
+from typing import Dict, List, Optional, Tuple
+import asyncio
+
+from app.websocket.codec import JSON_CODEC, OutgoingMessage
+from app.websocket.connection_manager import ConnectionManager
+from app.websocket.interest import Rect
+
+
+# 1バッチに含める最大イベント数（超えた場合は待たずに配信）
+MAX_BATCH_EVENTS = 200
+
+
+class DrawingEventBatcher:
+    """
+    描画プレビューイベントのバッチ配信クラス
+
+    ルームごとに数ミリ秒間の drawing_event を溜め、1つの "drawing_events" フレームとして配信する。
+    イベントは受信順に並ぶため送信者ごとの順序は保たれる。
+    送信者本人には自分のイベントを除いたフレームを送る。
+    フレームは各イベントのJSONテキストを連結して組み立てるため、中継時に再エンコードしない。
+    表示範囲を登録しているメンバーがいるルームでは、接続ごとに範囲内のイベントだけを送る。
+    """
+
+    def __init__(self, connection_manager: ConnectionManager, window_ms: int):
+        """
+        バッチ配信を初期化
+
+        Args:
+            connection_manager: 配信に使用する接続マネージャー
+            window_ms: イベントを溜める時間（ミリ秒）
+        """
+        self.manager = connection_manager
+        self.window = window_ms / 1000
+        # whiteboard_id -> [(user_id, message, 座標の外接矩形), ...]
+        self._pending: Dict[str, List[Tuple[str, OutgoingMessage, Optional[Rect]]]] = {}
+        # whiteboard_id -> 配信待ちタスク
+        self._flush_tasks: Dict[str, asyncio.Task] = {}
+
+    async def add(
+        self,
+        whiteboard_id: str,
+        user_id: str,
+        message: OutgoingMessage,
+        bounds: Optional[Rect] = None
+    ):
+        """
+        描画イベントをバッチに追加
+
+        Args:
+            whiteboard_id: ホワイトボードID
+            user_id: 送信者のユーザーID
+            message: 描画イベントメッセージ
+            bounds: イベントの座標の外接矩形（表示範囲での絞り込み用、Noneの場合は全員に配信）
+        """
+        events = self._pending.setdefault(whiteboard_id, [])
+        events.append((user_id, message, bounds))
+
+        if len(events) >= MAX_BATCH_EVENTS:
+            task = self._flush_tasks.pop(whiteboard_id, None)
+            if task is not None:
+                task.cancel()
+            await self.flush(whiteboard_id)
+            return
+
+        if whiteboard_id not in self._flush_tasks:
+            self._flush_tasks[whiteboard_id] = asyncio.create_task(
+                self._flush_after_window(whiteboard_id)
+            )
+
+    async def _flush_after_window(self, whiteboard_id: str):
+        """バッチ期間が過ぎたらルームのイベントを配信"""
+        try:
+            await asyncio.sleep(self.window)
+        finally:
+            if self._flush_tasks.get(whiteboard_id) is asyncio.current_task():
+                del self._flush_tasks[whiteboard_id]
+        await self.flush(whiteboard_id)
+
+    async def flush(self, whiteboard_id: str):
+        """
+        ルームに溜まった描画イベントを配信
+
+        Args:
+            whiteboard_id: ホワイトボードID
+        """
+        events = self._pending.pop(whiteboard_id, None)
+        if not events:
+            return
+
+        senders = {user_id for user_id, _, _ in events}
+
+        if self.manager.has_viewports(whiteboard_id):
+            await self._flush_by_viewport(whiteboard_id, events, senders)
+            return
+
+        # 送信者以外には全イベントをまとめた1フレーム
+        await self.manager.broadcast_to_whiteboard(
+            whiteboard_id,
+            self._build_frame([message for _, message, _ in events]),
+            exclude_users=senders
+        )
+
+        # 送信者には自分以外のイベントのみ
+        for sender in senders:
+            others = [message for user_id, message, _ in events if user_id != sender]
+            if others:
+                await self.manager.send_to_user(whiteboard_id, sender, self._build_frame(others))
+
+    async def _flush_by_viewport(
+        self,
+        whiteboard_id: str,
+        events: List[Tuple[str, OutgoingMessage, Optional[Rect]]],
+        senders: set
+    ):
+        """接続ごとに自分以外かつ表示範囲内のイベントだけを配信"""
+        frames: Dict[Tuple[int, ...], OutgoingMessage] = {}
+        for user_connections in list(self.manager.rooms.get(whiteboard_id, {}).values()):
+            for connection in user_connections:
+                visible = tuple(
+                    i for i, (user_id, _, bounds) in enumerate(events)
+                    if user_id != connection.user_id and self.manager.is_visible(connection, bounds)
+                )
+                if not visible:
+                    continue
+                frame = frames.get(visible)
+                if frame is None:
+                    frame = frames[visible] = self._build_frame([events[i][1] for i in visible])
+                self.manager.send_to_connection(connection, frame)
+
+        # 閲覧専用接続と他ワーカーのメンバーには絞り込まずに配信（送信者はこのプロセスに接続している）
+        frame = self._build_frame([message for _, message, _ in events])
+        self.manager.viewers.deliver(whiteboard_id, frame)
+        await self.manager.publish_remote(whiteboard_id, frame, exclude_users=senders)
+
+    @staticmethod
+    def _build_frame(messages: List[OutgoingMessage]) -> OutgoingMessage:
+        """各イベントのJSONテキストを連結してバッチフレームを組み立てる"""
+        events = ",".join(message.encode(JSON_CODEC) for message in messages)
+        return OutgoingMessage(
+            message_type="drawing_events",
+            text=f'{{"type":"drawing_events","data":{{"events":[{events}]}},"userId":"","timestamp":""}}'
+        )
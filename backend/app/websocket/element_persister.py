@@ -0,0 +1,413 @@
+"""
+WebSocketの描画・消去イベントの書き込み遅延（write-behind）永続化
+
+draw / erase メッセージから要素の作成・更新・削除をホワイトボードごとにバッファし、
+件数または時間の条件でまとめて1トランザクションで drawing_elements に反映する。
+同じ要素への操作はバッファ内で最新のものだけが残る。
+"""
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+from uuid import UUID, NAMESPACE_URL, uuid5
+import asyncio
+import logging
+
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.database import SessionLocal, run_in_db_executor
+from app.models.whiteboard import DrawingElement, DrawingType
+from app.websocket.validation import is_number, is_point
+
+
+logger = logging.getLogger(__name__)
+
+# 連続して書き込みに失敗した場合に破棄するまでの回数
+MAX_FLUSH_ATTEMPTS = 3
+
+# クライアント生成のIDから要素IDを決めるための名前空間
+ELEMENT_ID_NAMESPACE = uuid5(NAMESPACE_URL, "whiteboard/drawing-element")
+
+# 保留中の操作（"upsert", カラム値）または（"delete", None）
+PendingOp = Tuple[str, Optional[Dict[str, Any]]]
+
+
+class _PendingBoard:
+    """ホワイトボード1つ分の未反映の操作"""
+
+    __slots__ = ("clear", "ops", "attempts")
+
+    def __init__(self):
+        # 全削除（クリア）を先に実行するか
+        self.clear = False
+        # 要素ID -> 操作（受信順）
+        self.ops: "OrderedDict[UUID, PendingOp]" = OrderedDict()
+        # 連続失敗回数
+        self.attempts = 0
+
+    def __len__(self) -> int:
+        return len(self.ops) + (1 if self.clear else 0)
+
+
+class ElementPersister:
+    """描画要素の書き込み遅延永続化"""
+
+    def __init__(
+        self,
+        flush_interval_ms: int,
+        batch_size: int,
+        session_factory: Callable[[], Session] = SessionLocal
+    ):
+        """
+        永続化を初期化
+
+        Args:
+            flush_interval_ms: 最初の操作からDBへ反映するまでの最大待ち時間（ミリ秒）
+            batch_size: この件数に達したら待たずに反映する
+            session_factory: DBセッションの生成関数
+        """
+        self.flush_interval = flush_interval_ms / 1000
+        self.batch_size = batch_size
+        self.session_factory = session_factory
+        # whiteboard_id -> 未反映の操作
+        self._pending: Dict[UUID, _PendingBoard] = {}
+        # whiteboard_id -> 反映予約タスク
+        self._flush_tasks: Dict[UUID, asyncio.Task] = {}
+        # whiteboard_id -> 反映中のロック（同じボードの書き込み順序を保つ）
+        self._locks: Dict[UUID, asyncio.Lock] = {}
+
+    def add_message(self, whiteboard_id: str, user_id: str, message: Dict[str, Any]):
+        """
+        draw / erase メッセージから操作をバッファに追加
+
+        Args:
+            whiteboard_id: ホワイトボードID
+            user_id: 送信したユーザーID
+            message: 受信したメッセージ
+        """
+        board_id = parse_uuid(whiteboard_id)
+        data = message.get("data")
+        if board_id is None or not isinstance(data, dict):
+            return
+
+        message_type = message.get("type")
+        if message_type == "draw":
+            element = data.get("element")
+            if not isinstance(element, dict) or element.get("id") is None:
+                return
+            values = element_to_columns(element)
+            if values is None:
+                return
+            values["user_id"] = parse_uuid(user_id)
+            self._add(board_id, element_uuid(board_id, element["id"]), ("upsert", values))
+        elif message_type == "erase":
+            if data.get("action") == "clear":
+                pending = self._pending.setdefault(board_id, _PendingBoard())
+                pending.clear = True
+                pending.ops.clear()
+                self._schedule(board_id, pending)
+            elif data.get("elementId") is not None:
+                self._add(board_id, element_uuid(board_id, data["elementId"]), ("delete", None))
+
+    def _add(self, board_id: UUID, element_id: UUID, op: PendingOp):
+        """操作を追加（同じ要素の古い操作は置き換える）"""
+        pending = self._pending.setdefault(board_id, _PendingBoard())
+        previous = pending.ops.pop(element_id, None)
+        if previous is not None and previous[0] == "upsert" and op[0] == "upsert":
+            # 追加する場合の作成者はバッファ中の最初の描画のユーザー
+            op[1]["user_id"] = previous[1]["user_id"]
+        pending.ops[element_id] = op
+        self._schedule(board_id, pending)
+
+    def _schedule(self, board_id: UUID, pending: _PendingBoard):
+        """件数に達していればすぐに、そうでなければ待ち時間後に反映を予約"""
+        if len(pending) >= self.batch_size:
+            task = self._flush_tasks.pop(board_id, None)
+            if task is not None:
+                task.cancel()
+            self._flush_tasks[board_id] = asyncio.create_task(self._flush_after(board_id, 0))
+        elif board_id not in self._flush_tasks:
+            self._flush_tasks[board_id] = asyncio.create_task(
+                self._flush_after(board_id, self.flush_interval)
+            )
+
+    async def _flush_after(self, board_id: UUID, delay: float):
+        """待ち時間後にボードの操作を反映"""
+        try:
+            if delay > 0:
+                await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            return
+        if self._flush_tasks.get(board_id) is asyncio.current_task():
+            del self._flush_tasks[board_id]
+        await self.flush(board_id)
+
+    async def flush(self, whiteboard_id: str | UUID):
+        """
+        ホワイトボードの未反映の操作を1トランザクションでDBへ書き込む
+
+        Args:
+            whiteboard_id: ホワイトボードID
+        """
+        board_id = whiteboard_id if isinstance(whiteboard_id, UUID) else parse_uuid(whiteboard_id)
+        if board_id is None:
+            return
+
+        lock = self._locks.setdefault(board_id, asyncio.Lock())
+        async with lock:
+            pending = self._pending.pop(board_id, None)
+            if not pending:
+                return
+
+            try:
+                # 同期セッションのためイベントループを止めないようDB用スレッドで実行
+                await run_in_db_executor(self._write, board_id, pending)
+            except Exception as e:
+                pending.attempts += 1
+                logger.error(
+                    "Error persisting drawing elements",
+                    extra={"whiteboard_id": str(board_id), "attempts": pending.attempts, "error": str(e)}
+                )
+                if pending.attempts < MAX_FLUSH_ATTEMPTS:
+                    self._requeue(board_id, pending)
+                else:
+                    logger.error(
+                        "Dropping drawing element changes",
+                        extra={"whiteboard_id": str(board_id), "changes": len(pending)}
+                    )
+
+        if not self._pending.get(board_id) and board_id not in self._flush_tasks:
+            self._locks.pop(board_id, None)
+
+    async def discard(self, whiteboard_id: str | UUID):
+        """
+        ホワイトボードの未反映の操作を破棄（REST APIでボード全体を置き換える前）
+
+        書き込み中の操作は完了を待ってから破棄する。
+
+        Args:
+            whiteboard_id: ホワイトボードID
+        """
+        board_id = whiteboard_id if isinstance(whiteboard_id, UUID) else parse_uuid(whiteboard_id)
+        if board_id is None:
+            return
+
+        task = self._flush_tasks.pop(board_id, None)
+        if task is not None:
+            task.cancel()
+        lock = self._locks.setdefault(board_id, asyncio.Lock())
+        async with lock:
+            self._pending.pop(board_id, None)
+        if board_id not in self._pending and board_id not in self._flush_tasks:
+            self._locks.pop(board_id, None)
+
+    def _requeue(self, board_id: UUID, failed: _PendingBoard):
+        """失敗した操作を、その後に届いた操作より前に戻して再予約"""
+        newer = self._pending.get(board_id)
+        if newer is not None:
+            if newer.clear:
+                # 後からクリアされた場合は失敗分は不要
+                return
+            for element_id, op in newer.ops.items():
+                failed.ops.pop(element_id, None)
+                failed.ops[element_id] = op
+        self._pending[board_id] = failed
+        if board_id not in self._flush_tasks:
+            self._flush_tasks[board_id] = asyncio.create_task(
+                self._flush_after(board_id, self.flush_interval)
+            )
+
+    def _write(self, board_id: UUID, pending: _PendingBoard):
+        """
+        未反映の操作をDBへ書き込む（別スレッドで実行）
+
+        まとめて書き込めない要素がある場合は、要素ごとのセーブポイントで書き込み直し、
+        失敗した要素だけを破棄する（他のユーザーの操作を巻き込まない）。
+
+        Args:
+            board_id: ホワイトボードID
+            pending: 反映する操作
+        """
+        db = self.session_factory()
+        try:
+            try:
+                self._apply(db, board_id, pending, isolate=False)
+                db.commit()
+            except (IntegrityError, DataError):
+                db.rollback()
+                self._apply(db, board_id, pending, isolate=True)
+                db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _apply(self, db: Session, board_id: UUID, pending: _PendingBoard, isolate: bool):
+        """
+        操作をセッションに反映
+
+        Args:
+            db: DBセッション
+            board_id: ホワイトボードID
+            pending: 反映する操作
+            isolate: 要素ごとにセーブポイントを作り、失敗した要素を破棄するか
+        """
+        if pending.clear:
+            db.query(DrawingElement).filter(
+                DrawingElement.whiteboard_id == board_id
+            ).delete(synchronize_session=False)
+
+        deletes = [element_id for element_id, (kind, _) in pending.ops.items() if kind == "delete"]
+        upserts = {
+            element_id: values
+            for element_id, (kind, values) in pending.ops.items() if kind == "upsert"
+        }
+
+        if deletes:
+            db.query(DrawingElement).filter(
+                DrawingElement.whiteboard_id == board_id,
+                DrawingElement.id.in_(deletes)
+            ).delete(synchronize_session=False)
+
+        if not upserts:
+            return
+        # 他のボードの要素と同じIDも検出するため、ボードで絞らずにIDで検索する
+        existing = {
+            element.id: element
+            for element in db.query(DrawingElement).filter(DrawingElement.id.in_(list(upserts)))
+        }
+        for element_id, values in upserts.items():
+            element = existing.get(element_id)
+            if element is not None and element.whiteboard_id != board_id:
+                logger.warning(
+                    "Skipping drawing element owned by another whiteboard",
+                    extra={"whiteboard_id": str(board_id), "element_id": str(element_id)}
+                )
+                continue
+            if not isolate:
+                _upsert(db, board_id, element_id, element, values)
+                continue
+            try:
+                with db.begin_nested():
+                    _upsert(db, board_id, element_id, element, values)
+            except (IntegrityError, DataError) as e:
+                logger.warning(
+                    "Dropping drawing element change",
+                    extra={"whiteboard_id": str(board_id), "element_id": str(element_id), "error": str(e)}
+                )
+
+    async def flush_all(self):
+        """全ホワイトボードの未反映の操作を書き込む（終了時）"""
+        for board_id in list(self._pending):
+            await self.flush(board_id)
+        for task in list(self._flush_tasks.values()):
+            task.cancel()
+        self._flush_tasks.clear()
+
+
+def _upsert(
+    db: Session,
+    board_id: UUID,
+    element_id: UUID,
+    element: Optional[DrawingElement],
+    values: Dict[str, Any]
+):
+    """要素を追加、または既存の要素を更新（作成者 user_id は追加時にだけ設定する）"""
+    if element is None:
+        db.add(DrawingElement(id=element_id, whiteboard_id=board_id, **values))
+    else:
+        for field, value in values.items():
+            if field != "user_id":
+                setattr(element, field, value)
+
+
+def element_uuid(board_id: UUID, client_id: Any) -> UUID:
+    """
+    クライアントの要素IDからDBの要素IDを決める
+
+    APIから読み込んだ要素はUUIDをそのまま使い、クライアントで生成したIDは
+    ボードIDと組み合わせた決定的なUUIDにする（同じ要素の更新・削除が同じ行に当たる）。
+    UUIDが他のボードの要素と重なる場合、書き込み時にその要素は反映しない（ElementPersister._apply 参照）。
+
+    Args:
+        board_id: ホワイトボードID
+        client_id: クライアントの要素ID
+
+    Returns:
+        要素ID
+    """
+    parsed = parse_uuid(client_id)
+    if parsed is not None:
+        return parsed
+    return uuid5(ELEMENT_ID_NAMESPACE, f"{board_id}:{client_id}")
+
+
+def element_to_columns(element: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    クライアントの要素（camelCase）を drawing_elements のカラム値に変換
+
+    Args:
+        element: クライアントの描画要素
+
+    Returns:
+        カラム値（保存対象外の要素の場合はNone）
+    """
+    try:
+        element_type = DrawingType(element.get("type"))
+    except ValueError:
+        # eraser / select など保存対象外の要素
+        return None
+    if not is_number(element.get("x")) or not is_number(element.get("y")):
+        return None
+
+    points = element.get("points")
+    if isinstance(points, list) and points:
+        points = [
+            {"x": float(p["x"]), "y": float(p["y"])}
+            for p in points
+            if is_point(p)
+        ]
+    else:
+        points = None
+
+    return {
+        "type": element_type,
+        "x": float(element["x"]),
+        "y": float(element["y"]),
+        "width": _optional_float(element.get("width")),
+        "height": _optional_float(element.get("height")),
+        "end_x": _optional_float(element.get("endX")),
+        "end_y": _optional_float(element.get("endY")),
+        "points": points,
+        "color": _hex_color(element.get("color")) or "#000000",
+        "stroke_width": _optional_float(element.get("strokeWidth")),
+        "fill_color": _hex_color(element.get("fill")),
+        "text_content": _optional_str(element.get("text"), 1000),
+        "font_size": _optional_float(element.get("fontSize")),
+        "font_family": _optional_str(element.get("fontFamily"), 100),
+    }
+
+
+# ヘルパー関数
+
+def parse_uuid(value: Any) -> Optional[UUID]:
+    """UUIDとして解釈できる値をUUIDに変換（できない場合はNone）"""
+    try:
+        return UUID(str(value))
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def _optional_float(value: Any) -> Optional[float]:
+    return float(value) if is_number(value) else None
+
+
+def _optional_str(value: Any, max_length: int) -> Optional[str]:
+    return str(value)[:max_length] if value else None
+
+
+def _hex_color(value: Any) -> Optional[str]:
+    """#RRGGBB 形式の色のみ受け付ける（カラム長が7文字のため）"""
+    if isinstance(value, str) and len(value) == 7 and value.startswith("#"):
+        return value
+    return None
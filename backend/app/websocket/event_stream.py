@@ -0,0 +1,142 @@
+"""
+Server-Sent Events による配信（更新を受け取るだけのフォロワー向け）
+
+ダッシュボードや埋め込みプレビューなど受信のみのクライアントは、WebSocketの代わりに
+GET /api/v1/whiteboards/{id}/events を購読できる。SSEの接続は閲覧専用接続（app.websocket.viewers）
+としてルームに登録し、WebSocketと同じ配信経路・送信キュー（優先度・溢れ時の破棄）を使う。
+
+- 各イベントの data は WebSocket と同じ JSON メッセージ
+- seq 付きの操作（OutgoingMessage.seq、接続時の connection_success を含む）には id: "{epoch}:{seq}" を付け、再接続時の Last-Event-ID から取りこぼした操作だけを再送する
+- ソケットへの書き込みは rate の間隔でまとめて行い、イベントがない間はコメント行でキープアライブする
+"""
+from collections import deque
+from typing import AsyncIterator, Callable, Deque, Optional, Tuple
+import asyncio
+
+# 書き込み待ちにできるイベント数（超えると送信キューの書き込みタスクが待ち、遅いクライアントとして切断される）
+DEFAULT_MAX_PENDING = 64
+
+
+def parse_last_event_id(value: Optional[str]) -> Tuple[Optional[str], Optional[int]]:
+    """
+    Last-Event-ID から再開位置を取り出す
+
+    Args:
+        value: Last-Event-ID ヘッダーの値（"{epoch}:{seq}"）
+
+    Returns:
+        (epoch, seq)（形式が不正な場合は (None, None)）
+    """
+    if not value:
+        return None, None
+    epoch, _, seq = value.rpartition(":")
+    if not epoch or not seq.isdigit():
+        return None, None
+    return epoch, int(seq)
+
+
+class EventStreamSocket:
+    """
+    送信キューの書き込み先としてWebSocketの代わりに使うSSEストリーム
+
+    ConnectionManager からは WebSocket と同じく accept / send_text / close で扱い、
+    レスポンス側は events() で書き込む内容を取り出す。
+    """
+
+    def __init__(self, epoch: Callable[[], str], max_pending: int = DEFAULT_MAX_PENDING):
+        """
+        SSEストリームを初期化
+
+        Args:
+            epoch: ルームの操作ログの現在の epoch を返す関数（イベントIDに使用）
+            max_pending: 書き込み待ちにできるイベント数
+        """
+        self.epoch = epoch
+        self.max_pending = max_pending
+        self.close_code: Optional[int] = None
+        self._pending: Deque[str] = deque()
+        self._ready = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._closed = False
+
+    async def accept(self, subprotocol: Optional[str] = None):
+        """HTTPレスポンスとして返すため何もしない"""
+
+    async def send_text(self, text: str):
+        """
+        イベントIDのないイベントを書き込み待ちに追加
+
+        Args:
+            text: 送信するJSONメッセージ
+        """
+        await self.send_sequenced(text, None)
+
+    async def send_sequenced(self, text: str, seq: Optional[int]):
+        """
+        イベントを書き込み待ちに追加（溢れている場合は空くまで待つ）
+
+        送信キューは seq を持つメッセージをこのメソッドで渡す（app.websocket.outbound_queue 参照）。
+
+        Args:
+            text: 送信するJSONメッセージ
+            seq: 操作ログでの再開位置（イベントIDに使用）
+        """
+        while len(self._pending) >= self.max_pending and not self._closed:
+            self._space.clear()
+            await self._space.wait()
+        if self._closed:
+            raise RuntimeError("Event stream is closed")
+        self._pending.append(self._format(text, seq))
+        self._ready.set()
+
+    async def send_bytes(self, data: bytes):
+        """SSEはJSONコーデックのみのため、バイナリフレームはテキストとして送る"""
+        await self.send_text(data.decode())
+
+    async def close(self, code: int = 1000):
+        """
+        ストリームを終了（書き込み待ちのイベントを送ってからレスポンスを閉じる）
+
+        Args:
+            code: 終了理由のクローズコード
+        """
+        self.close_code = code
+        self._closed = True
+        self._ready.set()
+        self._space.set()
+
+    async def events(self, interval: float, keepalive: float) -> AsyncIterator[str]:
+        """
+        書き込む内容を rate の間隔でまとめて取り出す
+
+        Args:
+            interval: 書き込みの最小間隔（秒）
+            keepalive: イベントがない場合にコメント行を送る間隔（秒）
+
+        Yields:
+            SSE形式のテキスト
+        """
+        while True:
+            if not self._pending and not self._closed:
+                self._ready.clear()
+                try:
+                    await asyncio.wait_for(self._ready.wait(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+            if self._pending:
+                batch = "".join(self._pending)
+                self._pending.clear()
+                self._space.set()
+                yield batch
+            if self._closed:
+                return
+            await asyncio.sleep(interval)
+
+    def _format(self, text: str, seq: Optional[int]) -> str:
+        """JSONメッセージをSSEのイベントに変換（seq 付きの操作にはイベントIDを付ける）"""
+        lines = "".join(f"data: {line}\n" for line in text.split("\n"))
+        if seq is not None:
+            return f"id: {self.epoch()}:{seq}\n{lines}\n"
+        return f"{lines}\n"
@@ -0,0 +1,175 @@
+"""
+WebSocketハンドシェイク時のトークン・ボード権限の検証
+
+JWTを検証し、ユーザーのボードへの権限（オーナー・コラボレーター・公開ボード）を
+(user_id, whiteboard_id) ごとのTTLキャッシュから解決する。デプロイ直後などに
+クライアントが一斉に再接続しても、DBへの問い合わせはキャッシュの有効期間ごとに1回になる。
+
+共有・権限変更・コラボレーター削除などREST APIで権限が変わった場合はキャッシュを破棄する。
+破棄はこのプロセスのみのため、複数ワーカー構成では他ワーカーの反映は有効期間まで遅れる。
+"""
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+from uuid import UUID
+import threading
+import time
+
+from jose import jwt, JWTError
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+
+from app.core import security
+from app.core.config import settings
+from app.core.database import SessionLocal, run_in_db_executor
+from app.models.collaborator import Permission, WhiteboardCollaborator
+from app.models.user import User
+from app.models.whiteboard import Whiteboard
+from app.schemas.auth import TokenPayload
+
+
+# 権限（オーナーは "owner"、コラボレーターは Permission の値、公開ボードの閲覧のみは "public"）
+OWNER_PERMISSION = "owner"
+PUBLIC_PERMISSION = "public"
+
+# 閲覧専用接続（app.websocket.viewers）として扱う権限
+READ_ONLY_PERMISSIONS = frozenset({Permission.VIEW.value, PUBLIC_PERMISSION})
+
+
+class HandshakeAuthorizer:
+    """ハンドシェイク時の認証・権限チェック"""
+
+    def __init__(
+        self,
+        ttl_seconds: float,
+        max_entries: int,
+        session_factory: Callable[[], Session] = SessionLocal
+    ):
+        """
+        権限チェックを初期化
+
+        Args:
+            ttl_seconds: 権限をキャッシュする期間
+            max_entries: キャッシュする (user_id, whiteboard_id) の上限
+            session_factory: DBセッションの生成関数
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.session_factory = session_factory
+        # (whiteboard_id, user_id) -> (期限, 権限)。権限なし（None）もキャッシュする
+        self._cache: "OrderedDict[Tuple[str, str], Tuple[float, Optional[str]]]" = OrderedDict()
+        # REST APIはスレッドプールで破棄するため排他する
+        self._lock = threading.Lock()
+
+    def verify_token(self, token: Optional[str]) -> Optional[str]:
+        """
+        JWTを検証してユーザーIDを取得
+
+        Args:
+            token: JWTトークン
+
+        Returns:
+            ユーザーID（無効なトークンの場合はNone）
+        """
+        if not token:
+            return None
+        try:
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[security.ALGORITHM])
+            return TokenPayload(**payload).sub
+        except (JWTError, ValidationError):
+            return None
+
+    async def authorize(
+        self,
+        whiteboard_id: str,
+        token: Optional[str],
+        user_id: Optional[str] = None
+    ) -> Optional[Tuple[str, str]]:
+        """
+        トークンを検証し、ボードへの権限を解決
+
+        Args:
+            whiteboard_id: ホワイトボードID
+            token: JWTトークン
+            user_id: クエリパラメータのユーザーID（指定された場合はトークンと一致する必要がある）
+
+        Returns:
+            (ユーザーID, 権限)（認証できない・権限がない場合はNone）
+        """
+        subject = self.verify_token(token)
+        if subject is None or (user_id and user_id != subject):
+            return None
+
+        key = (str(whiteboard_id), subject)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] > time.monotonic():
+                self._cache.move_to_end(key)
+                permission = cached[1]
+                return (subject, permission) if permission is not None else None
+
+        permission = await run_in_db_executor(self.resolve_permission, whiteboard_id, subject)
+        with self._lock:
+            self._cache[key] = (time.monotonic() + self.ttl_seconds, permission)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return (subject, permission) if permission is not None else None
+
+    def resolve_permission(self, whiteboard_id: str, user_id: str) -> Optional[str]:
+        """
+        DBからユーザーのボードへの権限を取得（別スレッドで実行）
+
+        Args:
+            whiteboard_id: ホワイトボードID
+            user_id: ユーザーID
+
+        Returns:
+            権限（REST APIのアクセス権限チェックと同じ条件で、アクセスできない場合はNone）
+        """
+        try:
+            board_id = UUID(whiteboard_id)
+            user_uuid = UUID(user_id)
+        except ValueError:
+            return None
+
+        db = self.session_factory()
+        try:
+            whiteboard = db.query(Whiteboard).filter(Whiteboard.id == board_id).first()
+            if not whiteboard:
+                return None
+            if whiteboard.owner_id == user_uuid:
+                return OWNER_PERMISSION
+            collaboration = db.query(WhiteboardCollaborator).filter(
+                WhiteboardCollaborator.whiteboard_id == board_id,
+                WhiteboardCollaborator.user_id == user_uuid
+            ).first()
+            if collaboration is not None:
+                return collaboration.permission.value
+            if whiteboard.is_public and db.query(User.id).filter(User.id == user_uuid).first():
+                return PUBLIC_PERMISSION
+            return None
+        finally:
+            db.close()
+
+    def invalidate(self, whiteboard_id: str | UUID, user_id: str | UUID | None = None):
+        """
+        キャッシュした権限を破棄（REST APIで権限を変更した場合）
+
+        Args:
+            whiteboard_id: ホワイトボードID
+            user_id: ユーザーID（指定しない場合はボードの全ユーザー）
+        """
+        whiteboard_id = str(whiteboard_id)
+        with self._lock:
+            if user_id is not None:
+                self._cache.pop((whiteboard_id, str(user_id)), None)
+                return
+            for key in [key for key in self._cache if key[0] == whiteboard_id]:
+                del self._cache[key]
+
+
+# グローバル権限チェック（REST APIの権限変更時に破棄する）
+handshake_auth = HandshakeAuthorizer(
+    settings.WS_AUTH_CACHE_TTL_SECONDS,
+    settings.WS_AUTH_CACHE_SIZE
+)
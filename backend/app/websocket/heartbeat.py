@@ -0,0 +1,127 @@
+"""
+サーバー主導のハートビート（タイマーホイール）
+
+全接続を1つのタイマーホイールで管理し、一定時間何も受信していない接続にだけ ping を送る。
+ping に応答がないまま上限回数を超えた接続は切断し、半開きのTCP接続が
+ルームに残って配信の負荷やメモリを消費し続けないようにする。
+
+応答の確認には受信メッセージ数（Connection.messages_in）を使うため、
+受信ごとに時刻を記録する必要はない（pong 以外のメッセージも生存確認になる）。
+"""
+from typing import Callable, List, Optional, Set
+import asyncio
+
+from app.websocket.connection import Connection
+
+
+# ホイールのスロット数（interval をこの数に分割してtickごとに1スロットずつ確認する）
+DEFAULT_WHEEL_SLOTS = 16
+
+
+class HeartbeatWheel:
+    """ハートビートのタイマーホイール"""
+
+    def __init__(
+        self,
+        interval: float,
+        max_missed: int,
+        on_ping: Callable[[Connection], None],
+        on_idle: Callable[[Connection], None],
+        slots: int = DEFAULT_WHEEL_SLOTS
+    ):
+        """
+        タイマーホイールを初期化
+
+        Args:
+            interval: 接続ごとの確認間隔（秒）
+            max_missed: 切断するまでに許容する、応答のない ping の回数
+            on_ping: ping を送る関数
+            on_idle: 応答のない接続を切断する関数
+            slots: ホイールのスロット数
+        """
+        self.interval = interval
+        self.max_missed = max_missed
+        self.on_ping = on_ping
+        self.on_idle = on_idle
+        self.tick = interval / slots
+        self._slots: List[Set[Connection]] = [set() for _ in range(slots)]
+        # 最後に確認したスロット（追加した接続は1周後に確認される）
+        self._cursor = 0
+        self._size = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, connection: Connection):
+        """
+        接続を登録（interval 後から確認を開始）
+
+        Args:
+            connection: 接続
+        """
+        if connection.heartbeat_slot is not None:
+            return
+        connection.heartbeat_seen = connection.messages_in
+        connection.missed_pongs = 0
+        connection.heartbeat_slot = self._cursor
+        self._slots[self._cursor].add(connection)
+        self._size += 1
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def remove(self, connection: Connection):
+        """
+        接続の登録を解除（切断時）
+
+        Args:
+            connection: 接続
+        """
+        if connection.heartbeat_slot is None:
+            return
+        self._slots[connection.heartbeat_slot].discard(connection)
+        connection.heartbeat_slot = None
+        self._size -= 1
+
+    async def _run(self):
+        """tickごとに次のスロットの接続を確認（接続がなくなったら終了）"""
+        try:
+            while self._size > 0:
+                await asyncio.sleep(self.tick)
+                self._cursor = (self._cursor + 1) % len(self._slots)
+                due = self._slots[self._cursor]
+                self._slots[self._cursor] = set()
+                for connection in due:
+                    if self._check(connection):
+                        # 同じスロットに戻して1周後に再確認
+                        self._slots[self._cursor].add(connection)
+                    else:
+                        connection.heartbeat_slot = None
+                        self._size -= 1
+        finally:
+            self._task = None
+
+    def _check(self, connection: Connection) -> bool:
+        """
+        接続の生存を確認
+
+        Returns:
+            登録を続けるかどうか（切断した場合はFalse）
+        """
+        if connection.messages_in != connection.heartbeat_seen:
+            # 前回の確認以降に受信があった
+            connection.heartbeat_seen = connection.messages_in
+            connection.missed_pongs = 0
+            return True
+        if connection.missed_pongs >= self.max_missed:
+            self.on_idle(connection)
+            return False
+        connection.missed_pongs += 1
+        self.on_ping(connection)
+        return True
+
+    def stop(self):
+        """確認を停止（アプリケーション終了時）"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
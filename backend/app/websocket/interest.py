@@ -0,0 +1,106 @@
+"""
+表示範囲（ビューポート）による配信先の絞り込み
+
+クライアントは表示中のキャンバスの範囲を viewport メッセージで登録する。
+    {"type": "viewport", "data": {"x": 0, "y": 0, "width": 1600, "height": 900}}
+（data が null または不正な場合は登録を解除し、すべての配信を受け取る）
+
+カーソル・描画プレビューなど位置を持つ一時的なメッセージは、範囲（＋余白）と
+メッセージの座標の外接矩形が重なるメンバーにだけ配信する。
+範囲を登録していないメンバーや座標を取り出せないメッセージは、従来どおりルーム全体に配信する。
+draw / erase などの要素を変更する操作は、全員の要素一覧を揃えるため絞り込まない。
+"""
+from typing import Any, Dict, Optional, Tuple
+
+from app.websocket.validation import is_number, is_point
+
+
+# (左, 上, 右, 下)
+Rect = Tuple[float, float, float, float]
+
+# 表示範囲で配信先を絞り込むメッセージタイプ
+SPATIAL_MESSAGE_TYPES = frozenset({"cursor", "drawing_event", "stroke_begin", "stroke_append"})
+
+
+def parse_viewport(data: Any) -> Optional[Rect]:
+    """
+    viewport メッセージのデータから表示範囲を取得
+
+    Args:
+        data: viewport メッセージのデータ
+
+    Returns:
+        表示範囲（解除・不正な場合はNone）
+    """
+    if not isinstance(data, dict):
+        return None
+    x, y, width, height = (data.get(k) for k in ("x", "y", "width", "height"))
+    if not all(is_number(v) for v in (x, y, width, height)) or width < 0 or height < 0:
+        return None
+    return (x, y, x + width, y + height)
+
+
+def message_bounds(message: Dict[str, Any]) -> Optional[Rect]:
+    """
+    メッセージの座標の外接矩形を取得
+
+    Args:
+        message: 受信したメッセージ
+
+    Returns:
+        外接矩形（座標を取り出せない場合はNone、ルーム全体に配信する）
+    """
+    message_type = message.get("type")
+    data = message.get("data")
+    if not isinstance(data, dict):
+        return None
+
+    if message_type == "cursor":
+        return point_bounds(data)
+    if message_type == "drawing_event":
+        return point_bounds(data.get("point"))
+    if message_type == "stroke_begin":
+        element = data.get("element")
+        return point_bounds(element) if isinstance(element, dict) else None
+    if message_type == "stroke_append":
+        x, y, deltas = data.get("x"), data.get("y"), data.get("d", [])
+        if not is_number(x) or not is_number(y) or not isinstance(deltas, list):
+            return None
+        left = right = x
+        top = bottom = y
+        for i in range(0, len(deltas) - 1, 2):
+            if not is_number(deltas[i]) or not is_number(deltas[i + 1]):
+                return None
+            x += deltas[i]
+            y += deltas[i + 1]
+            left, right = min(left, x), max(right, x)
+            top, bottom = min(top, y), max(bottom, y)
+        return (left, top, right, bottom)
+    return None
+
+
+def intersects(viewport: Rect, bounds: Rect, margin: float) -> bool:
+    """
+    表示範囲（＋余白）と外接矩形が重なるか
+
+    Args:
+        viewport: 表示範囲
+        bounds: メッセージの外接矩形
+        margin: 表示範囲の外側に含める余白
+
+    Returns:
+        重なるかどうか
+    """
+    return (
+        bounds[0] <= viewport[2] + margin
+        and bounds[2] >= viewport[0] - margin
+        and bounds[1] <= viewport[3] + margin
+        and bounds[3] >= viewport[1] - margin
+    )
+
+
+def point_bounds(value: Any) -> Optional[Rect]:
+    """{x, y} を持つ値の外接矩形（座標がない場合はNone）"""
+    if not is_point(value):
+        return None
+    return (value["x"], value["y"], value["x"], value["y"])
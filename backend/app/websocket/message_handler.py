@@ -1,11 +1,38 @@
-from typing import Dict, Any
-from sqlalchemy.orm import Session
+from typing import Dict, Any, List, Optional
+from fastapi import WebSocket
 from uuid import UUID
 import json
+import logging
+import time
 
-from app.core.database import get_db
+from app.core.config import settings
+from app.core.database import run_in_db_executor
 from app.models.whiteboard import DrawingElement, DrawingType
+from app.websocket.board_snapshot import board_snapshots
+from app.websocket.chunking import ChunkAssembler
+from app.websocket.codec import OutgoingMessage
+from app.websocket.connection import Connection
 from app.websocket.connection_manager import ConnectionManager
+from app.websocket.cursor_aggregator import CursorAggregator
+from app.websocket.drawing_batcher import DrawingEventBatcher
+from app.websocket.element_persister import ElementPersister, parse_uuid
+from app.websocket.handshake_auth import READ_ONLY_PERMISSIONS
+from app.websocket.interest import SPATIAL_MESSAGE_TYPES, message_bounds, parse_viewport
+from app.websocket.rate_limiter import RateLimiter
+from app.websocket.relay import (
+    RELAY_MESSAGE_TYPES, VALIDATED_RELAY_TYPES, decode_relayed, peek_message_type, stamp_envelope
+)
+from app.websocket.room_state import room_states
+from app.websocket.stroke_stream import STROKE_MESSAGE_TYPES, StrokeAssembler, StrokeTooLong
+
+
+logger = logging.getLogger(__name__)
+
+# 要素を変更するメッセージタイプ（閲覧のみの権限の接続からは受け付けない）
+EDIT_MESSAGE_TYPES = frozenset({"draw", "erase", "chunk"}) | STROKE_MESSAGE_TYPES
+
+# レート制限で破棄した場合に再同期を通知するメッセージタイプ（要素を変更するもの）
+RESYNC_ON_DROP_TYPES = EDIT_MESSAGE_TYPES
 
 
 class MessageHandler:
@@ -13,13 +40,299 @@ class MessageHandler:
     
     def __init__(self, connection_manager: ConnectionManager):
         self.manager = connection_manager
+        # カーソル集約（0以下の場合は受信ごとに即時配信）
+        self.cursor_aggregator = (
+            CursorAggregator(connection_manager, settings.WS_CURSOR_FLUSH_HZ)
+            if settings.WS_CURSOR_FLUSH_HZ > 0 else None
+        )
+        # 描画プレビューのバッチ配信（オプトイン、0の場合は受信ごとに即時配信）
+        self.drawing_batcher = (
+            DrawingEventBatcher(connection_manager, settings.WS_DRAWING_BATCH_WINDOW_MS)
+            if settings.WS_DRAWING_BATCH_WINDOW_MS > 0 else None
+        )
+        # 描画・消去イベントの書き込み遅延永続化（0の場合は永続化しない）
+        self.element_persister = (
+            ElementPersister(settings.WS_PERSIST_FLUSH_INTERVAL_MS, settings.WS_PERSIST_BATCH_SIZE)
+            if settings.WS_PERSIST_FLUSH_INTERVAL_MS > 0 else None
+        )
+        # ペンのストロークの差分配信
+        self.stroke_assembler = StrokeAssembler(settings.WS_STROKE_MAX_POINTS, settings.WS_STROKE_MAX_OPEN)
+        # 大きなメッセージの分割転送
+        self.chunk_assembler = ChunkAssembler(settings.WS_MESSAGE_SIZE_LIMIT)
+        # 編集中ボードの要素一覧（無効の場合はNone）
+        self.room_states = room_states
+        # 受信レート制限（上限が1つも設定されていない場合はNone）
+        self.rate_limiter = (
+            RateLimiter(
+                settings.WS_RATE_LIMITS,
+                settings.WS_ROOM_RATE_LIMITS,
+                settings.WS_RATE_LIMIT_BURST_SECONDS
+            )
+            if any(r > 0 for r in [*settings.WS_RATE_LIMITS.values(), *settings.WS_ROOM_RATE_LIMITS.values()])
+            else None
+        )
+    
+    def admit(self, connection: Connection, message_type: str | None) -> bool:
+        """
+        受信したメッセージを処理するか、レート制限で破棄するかを判定
+        
+        cursor / drawing_event は次のメッセージで置き換わるため、超過分は破棄するだけ
+        （カーソル集約が有効な場合は、受け付けた最新の位置が次のtickで配信される）。
+        draw / erase / ストロークを破棄した場合は送信者の状態がずれるため、再同期（resync）を通知する。
+        
+        Args:
+            connection: 受信した接続
+            message_type: メッセージタイプ
+        
+        Returns:
+            処理するかどうか
+        """
+        if self.rate_limiter is None or self.rate_limiter.allow(connection, message_type):
+            connection.rate_limited = False
+            return True
+        if message_type in RESYNC_ON_DROP_TYPES and not connection.rate_limited:
+            connection.rate_limited = True
+            self.manager.send_to_connection(connection, {
+                "type": "resync",
+                "data": {"reason": "rate_limited"},
+                "userId": "",
+                "timestamp": ""
+            })
+        return False
+    
+    def can_edit(self, connection: Connection | None) -> bool:
+        """
+        接続が要素を変更できるかを判定
+        
+        閲覧専用接続と、閲覧のみの権限（READ_ONLY_PERMISSIONS）で接続したメンバーは変更できない。
+        
+        Args:
+            connection: 受信した接続（None の場合はサーバー内部からの変更として扱う）
+        
+        Returns:
+            変更できるかどうか
+        """
+        if connection is None:
+            return True
+        return not connection.viewer and connection.permission not in READ_ONLY_PERMISSIONS
+    
+    def reject_edit(self, connection: Connection | None, message_type: str | None) -> bool:
+        """
+        要素を変更するメッセージを権限がないため破棄するかを判定
+        
+        Args:
+            connection: 受信した接続
+            message_type: メッセージタイプ
+        
+        Returns:
+            破棄するかどうか
+        """
+        if message_type not in EDIT_MESSAGE_TYPES or self.can_edit(connection):
+            return False
+        logger.debug(
+            "Edit rejected for read-only connection",
+            extra={"message_type": message_type, "user_id": connection.user_id, "sample_key": "ws.edit_rejected"}
+        )
+        return True
+    
+    async def relay_text(
+        self,
+        text: str,
+        whiteboard_id: str,
+        user_id: str,
+        connection: Connection | None = None
+    ) -> bool:
+        """
+        中継のみのメッセージをデコードせずにそのまま転送（高速パス）
+        
+        seq を付けて記録・永続化する draw / erase と、他の送信者のイベントと1フレームにまとめる
+        drawing_event（バッチ配信が有効な場合）は、中継前に1回だけデコードして不正なものを破棄する。
+        
+        Args:
+            text: 受信したJSONテキスト
+            whiteboard_id: ホワイトボードID
+            user_id: ユーザーID
+            connection: 受信した接続（分割転送のチャンクの検証に使う）
+        
+        Returns:
+            中継したかどうか（Falseの場合は通常どおりデコードして処理する）
+        """
+        message_type = peek_message_type(text)
+        if self.reject_edit(connection, message_type):
+            return True
+        # チャンクは受信したテキストのまま中継する（payload を再エンコードしない）
+        if message_type == "chunk" and connection is not None:
+            message = decode_relayed(text, message_type)
+            if message is None:
+                self._reject_malformed(whiteboard_id, user_id, message_type)
+                return True
+            await self.handle_chunk(connection, message, whiteboard_id, user_id, text)
+            return True
+        if message_type not in RELAY_MESSAGE_TYPES:
+            return False
+        # カーソル集約には座標が必要なため通常処理
+        if message_type == "cursor" and self.cursor_aggregator is not None:
+            return False
+        # 表示範囲で配信先を絞り込む場合も座標が必要なため通常処理
+        if message_type in SPATIAL_MESSAGE_TYPES and self.manager.has_viewports(whiteboard_id):
+            return False
+        
+        message = None
+        if message_type in VALIDATED_RELAY_TYPES or (
+            message_type == "drawing_event" and self.drawing_batcher is not None
+        ):
+            message = decode_relayed(text, message_type)
+            if message is None:
+                self._reject_malformed(whiteboard_id, user_id, message_type)
+                return True
+        
+        server_timestamp = int(time.time() * 1000)
+        stamped = stamp_envelope(text, user_id, server_timestamp)
+        if stamped is None:
+            return False
+        if message is not None:
+            # デコード済みの内容を共有し、バイナリ接続・永続化で再度デコードしない
+            message = {**message, "senderId": user_id, "serverTimestamp": server_timestamp}
+        outgoing = OutgoingMessage(message, message_type=message_type, text=stamped)
+        
+        if message_type == "drawing_event" and self.drawing_batcher is not None:
+            await self.drawing_batcher.add(whiteboard_id, user_id, outgoing)
+        else:
+            await self.manager.broadcast_to_whiteboard(whiteboard_id, outgoing, exclude_user=user_id)
+        
+        # 配信後に永続化へ反映（配信の遅延にならないように）
+        if message_type in ("draw", "erase"):
+            self.record_element_change(whiteboard_id, user_id, outgoing, connection)
+        return True
+    
+    def _reject_malformed(self, whiteboard_id: str, user_id: str, message_type: str | None):
+        """JSONとして不正な中継メッセージを配信・記録せずに破棄"""
+        logger.debug(
+            "Malformed message rejected",
+            extra={
+                "whiteboard_id": whiteboard_id,
+                "user_id": user_id,
+                "message_type": message_type,
+                "sample_key": "ws.malformed"
+            }
+        )
+    
+    def record_element_change(
+        self,
+        whiteboard_id: str,
+        user_id: str,
+        message: dict | OutgoingMessage,
+        connection: Connection | None = None
+    ):
+        """
+        draw / erase をメモリ上の要素一覧と書き込み遅延永続化に反映
+        
+        Args:
+            whiteboard_id: ホワイトボードID
+            user_id: 送信したユーザーID
+            message: 受信したメッセージ（中継した場合はOutgoingMessage、必要な場合のみデコード）
+            connection: 受信した接続（要素を変更できない場合は反映しない）
+        """
+        if self.element_persister is None and self.room_states is None:
+            return
+        if not self.can_edit(connection):
+            return
+        if isinstance(message, OutgoingMessage):
+            message = message.message
+        if self.element_persister is not None:
+            self.element_persister.add_message(whiteboard_id, user_id, message)
+        if self.room_states is not None:
+            self.room_states.apply_message(whiteboard_id, user_id, message)
+    
+    async def warm_room_state(self, whiteboard_id: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        ボードの要素一覧をメモリに読み込む（読み込み済みの場合はそのまま返す）
+        
+        読み込み中にWebSocketで届いた操作は操作ログから反映する。
+        
+        Args:
+            whiteboard_id: ホワイトボードID
+        
+        Returns:
+            メモリ上の要素一覧（無効または読み込めなかった場合はNone）
+        """
+        if self.room_states is None or parse_uuid(whiteboard_id) is None:
+            return None
+        elements = self.room_states.get_elements(whiteboard_id)
+        if elements is not None:
+            return elements
+        
+        op_log = self.manager.get_op_log(whiteboard_id)
+        seq = op_log.seq
+        generation = self.room_states.generation(whiteboard_id)
+        # バッファ中の操作をDBへ反映してから読み込む
+        if self.element_persister is not None:
+            await self.element_persister.flush(whiteboard_id)
+        loaded = await run_in_db_executor(board_snapshots.load_elements, whiteboard_id)
+        
+        if not self.room_states.is_warm(whiteboard_id):
+            missed = op_log.since(seq, "")
+            if missed is None or not self.room_states.load(whiteboard_id, loaded, generation):
+                return None
+            for outgoing in missed:
+                message = outgoing.message
+                sender_id = message.get("senderId") or message.get("userId") or ""
+                self.room_states.apply_message(whiteboard_id, sender_id, message)
+        return self.room_states.get_elements(whiteboard_id)
+    
+    async def send_snapshot(self, connection: Connection):
+        """
+        参加したクライアントにボードの現在の状態をチャンクで送信
+        
+        スナップショットはメモリ上の要素一覧（なければDB）から作成し、
+        作成中にWebSocketで届いた操作は、スナップショットの後に操作ログから再送する。
+        スナップショットを送れない場合は再同期（resync）を要求し、クライアントはREST APIで取得する。
+        
+        閲覧権限はハンドシェイク時に確認済み（app.websocket.handshake_auth 参照）。
+        
+        Args:
+            connection: 送信先の接続
+        """
+        whiteboard_id = connection.whiteboard_id
+        resync = {"type": "resync", "data": {"reason": "snapshot_unavailable"}, "userId": "", "timestamp": ""}
+        
+        try:
+            # メモリ上の要素一覧があればそこから作成（最新の操作まで反映済み）
+            elements = await self.warm_room_state(whiteboard_id)
+            op_log = self.manager.get_op_log(whiteboard_id)
+            key = (op_log.epoch, op_log.seq)
+            # なければバッファ中の操作をDBへ反映してからDBから作成
+            if elements is None and self.element_persister is not None:
+                await self.element_persister.flush(whiteboard_id)
+            chunks = await board_snapshots.get(whiteboard_id, key, elements)
+        except Exception as e:
+            logger.warning(
+                "Error building snapshot", extra={"whiteboard_id": whiteboard_id, "error": str(e)}
+            )
+            self.manager.send_to_connection(connection, resync)
+            return
+        
+        for chunk in chunks:
+            self.manager.send_to_connection(connection, chunk)
+        
+        missed = op_log.since(key[1], connection.user_id)
+        if missed is None:
+            self.manager.send_to_connection(connection, resync)
+            return
+        for outgoing in missed:
+            self.manager.send_to_connection(connection, outgoing)
+    
+    async def shutdown(self):
+        """バッファ中の描画要素をDBへ反映（アプリケーション終了時）"""
+        if self.element_persister is not None:
+            await self.element_persister.flush_all()
     
     async def handle_message(
         self, 
         message: dict, 
         whiteboard_id: str, 
         user_id: str,
-        db: Session
+        websocket: WebSocket | None = None
     ):
         """
         受信したメッセージをタイプに応じて処理
@@ -28,29 +341,45 @@ class MessageHandler:
             message: 受信したメッセージ
             whiteboard_id: ホワイトボードID
             user_id: ユーザーID
-            db: データベースセッション
+            websocket: 受信したWebSocket（応答の返信先）
         """
         message_type = message.get("type")
+        connection = self.manager.get_connection(websocket) if websocket is not None else None
+        if self.reject_edit(connection, message_type):
+            return
         
         if message_type == "draw":
-            await self.handle_drawing_update(message, whiteboard_id, user_id, db)
+            await self.handle_drawing_update(message, whiteboard_id, user_id, connection)
         elif message_type == "erase":
-            await self.handle_erase(message, whiteboard_id, user_id, db)
+            await self.handle_erase(message, whiteboard_id, user_id, connection)
         elif message_type == "cursor":
             await self.handle_cursor_update(message, whiteboard_id, user_id)
         elif message_type == "ping":
-            await self.handle_ping(message, whiteboard_id, user_id)
+            await self.handle_ping(message, whiteboard_id, user_id, websocket)
         elif message_type == "drawing_event":
             await self.handle_drawing_event(message, whiteboard_id, user_id)
+        elif message_type in STROKE_MESSAGE_TYPES:
+            await self.handle_stroke(message, whiteboard_id, user_id, websocket)
+        elif message_type == "viewport":
+            self.handle_viewport(message, websocket)
+        elif message_type == "chunk":
+            if connection is not None:
+                await self.handle_chunk(connection, message, whiteboard_id, user_id)
+        elif message_type == "pong":
+            # サーバーからのハートビートへの応答（受信したこと自体で生存を確認済み）
+            pass
         else:
-            print(f"Unknown message type: {message_type}")
+            logger.warning(
+                "Unknown message type",
+                extra={"message_type": message_type, "user_id": user_id, "sample_key": "ws.unknown_type"}
+            )
     
     async def handle_drawing_update(
         self, 
         message: dict, 
         whiteboard_id: str, 
         user_id: str,
-        db: Session
+        connection: Connection | None = None
     ):
         """
         描画更新メッセージを処理
@@ -59,25 +388,28 @@ class MessageHandler:
             message: 描画更新メッセージ
             whiteboard_id: ホワイトボードID
             user_id: ユーザーID
-            db: データベースセッション
+            connection: 受信した接続
         """
-        print(f"Handling drawing update from user {user_id} on whiteboard {whiteboard_id}")
-        
-        # 一時的にデータベース保存をスキップし、ブロードキャストのみ行う
         await self.manager.broadcast_to_whiteboard(
             whiteboard_id, 
             message, 
             exclude_user=user_id
         )
         
-        print(f"Broadcasting drawing update to whiteboard {whiteboard_id}")
+        # メモリ上の要素一覧に反映し、データベースへはバッファしてまとめて保存
+        self.record_element_change(whiteboard_id, user_id, message, connection)
+        
+        logger.debug(
+            "Drawing update broadcast",
+            extra={"whiteboard_id": whiteboard_id, "user_id": user_id, "sample_key": "ws.draw"}
+        )
     
     async def handle_erase(
         self, 
         message: dict, 
         whiteboard_id: str, 
         user_id: str,
-        db: Session
+        connection: Connection | None = None
     ):
         """
         消去メッセージを処理
@@ -86,18 +418,21 @@ class MessageHandler:
             message: 消去メッセージ
             whiteboard_id: ホワイトボードID
             user_id: ユーザーID
-            db: データベースセッション
+            connection: 受信した接続
         """
-        print(f"Handling erase from user {user_id} on whiteboard {whiteboard_id}")
-        
-        # 一時的にデータベース削除をスキップし、ブロードキャストのみ行う
         await self.manager.broadcast_to_whiteboard(
             whiteboard_id, 
             message, 
             exclude_user=user_id
         )
         
-        print(f"Broadcasting erase to whiteboard {whiteboard_id}")
+        # メモリ上の要素一覧に反映し、データベースからはバッファしてまとめて削除
+        self.record_element_change(whiteboard_id, user_id, message, connection)
+        
+        logger.debug(
+            "Erase broadcast",
+            extra={"whiteboard_id": whiteboard_id, "user_id": user_id, "sample_key": "ws.erase"}
+        )
     
     async def handle_cursor_update(
         self, 
@@ -108,23 +443,36 @@ class MessageHandler:
         """
         カーソル位置更新メッセージを処理（保存なし、リアルタイム配信のみ）
         
+        集約が有効な場合は最新位置のみを保持し、tickごとにまとめて配信する。
+        
         Args:
             message: カーソル位置メッセージ
             whiteboard_id: ホワイトボードID
             user_id: ユーザーID
         """
-        # 他のユーザーにブロードキャスト
+        if self.cursor_aggregator is not None:
+            data = message.get("data")
+            self.cursor_aggregator.update(
+                whiteboard_id,
+                user_id,
+                data if isinstance(data, dict) else {}
+            )
+            return
+        
+        # 他のユーザーにブロードキャスト（表示範囲外のユーザーには送らない）
         await self.manager.broadcast_to_whiteboard(
             whiteboard_id, 
             message, 
-            exclude_user=user_id
+            exclude_user=user_id,
+            bounds=self.spatial_bounds(message, whiteboard_id)
         )
     
     async def handle_ping(
         self, 
         message: dict, 
         whiteboard_id: str, 
-        user_id: str
+        user_id: str,
+        websocket: WebSocket | None = None
     ):
         """
         Pingメッセージを処理（接続維持用）
@@ -133,6 +481,7 @@ class MessageHandler:
             message: Pingメッセージ
             whiteboard_id: ホワイトボードID
             user_id: ユーザーID
+            websocket: Pingを受信したWebSocket
         """
         # Pongを返す
         pong_message = {
@@ -141,16 +490,10 @@ class MessageHandler:
         }
         
         # 送信者にのみ返す
-        connections = self.manager.active_connections.get(whiteboard_id, [])
-        for connection in connections:
-            if connection in self.manager.connection_info:
-                conn_user_id, _ = self.manager.connection_info[connection]
-                if conn_user_id == user_id:
-                    await self.manager.send_personal_message(
-                        json.dumps(pong_message), 
-                        connection
-                    )
-                    break
+        if websocket is not None:
+            await self.manager.send_personal_message(json.dumps(pong_message), websocket)
+        else:
+            await self.manager.send_to_user(whiteboard_id, user_id, pong_message)
     
     async def handle_drawing_event(
         self, 
@@ -166,9 +509,233 @@ class MessageHandler:
             whiteboard_id: ホワイトボードID
             user_id: ユーザーID
         """
-        # 他のユーザーにブロードキャスト（描画中のプレビュー用）
+        bounds = self.spatial_bounds(message, whiteboard_id)
+        if self.drawing_batcher is not None:
+            await self.drawing_batcher.add(whiteboard_id, user_id, OutgoingMessage(message), bounds)
+            return
+        
+        # 他のユーザーにブロードキャスト（描画中のプレビュー用、表示範囲外のユーザーには送らない）
         await self.manager.broadcast_to_whiteboard(
             whiteboard_id, 
             message, 
+            exclude_user=user_id,
+            bounds=bounds
+        )
+    
+    async def handle_stroke(
+        self, 
+        message: dict, 
+        whiteboard_id: str, 
+        user_id: str,
+        websocket: WebSocket | None = None
+    ):
+        """
+        ストロークの差分配信メッセージを処理（app.websocket.stroke_stream 参照）
+        
+        stroke_begin / stroke_append は組み立てに反映して他のユーザーへそのまま配信し、
+        stroke_end は点列全体を持つ draw として配信・保存する。
+        
+        Args:
+            message: ストロークメッセージ
+            whiteboard_id: ホワイトボードID
+            user_id: ユーザーID
+            websocket: 受信したWebSocket
+        """
+        connection = self.manager.get_connection(websocket) if websocket is not None else None
+        if connection is None:
+            return
+        
+        message_type = message.get("type")
+        data = message.get("data")
+        if message_type == "stroke_end":
+            element = self.stroke_assembler.end(connection, data)
+            if element is not None:
+                await self.commit_stroke(element, data["strokeId"], whiteboard_id, user_id, connection)
+            return
+        
+        try:
+            if message_type == "stroke_begin":
+                accepted = self.stroke_assembler.begin(connection, data)
+            else:
+                accepted = self.stroke_assembler.append(connection, data)
+        except StrokeTooLong:
+            await self.end_long_stroke(connection, data["strokeId"], whiteboard_id, user_id)
+            return
+        if not accepted:
+            logger.debug(
+                "Stroke message rejected",
+                extra={"message_type": message_type, "user_id": user_id, "sample_key": "ws.stroke_rejected"}
+            )
+            return
+        
+        # 受信側は senderId と strokeId の組でストロークを特定する
+        # （表示範囲外のユーザーには送らず、確定時の draw だけを受け取る）
+        await self.manager.broadcast_to_whiteboard(
+            whiteboard_id,
+            {**message, "senderId": user_id},
+            exclude_user=user_id,
+            bounds=self.spatial_bounds(message, whiteboard_id)
+        )
+    
+    async def handle_chunk(
+        self,
+        connection: Connection,
+        message: dict,
+        whiteboard_id: str,
+        user_id: str,
+        text: str | None = None
+    ):
+        """
+        分割転送のチャンクを処理（app.websocket.chunking 参照）
+        
+        チャンクは受信した時点で他のユーザーへ中継する。
+        draw / erase は最後のチャンクで組み立てて保存し、seq 付きの chunk_commit を配信する。
+        
+        Args:
+            connection: 受信した接続
+            message: チャンクメッセージ
+            whiteboard_id: ホワイトボードID
+            user_id: ユーザーID
+            text: 受信したJSONテキスト（ある場合はデコードせずに中継する）
+        
+        Raises:
+            MessageTooLarge: 分割したメッセージ全体が上限を超えた場合
+        """
+        stream = self.chunk_assembler.accept(connection, message.get("data"))
+        if stream is None:
+            logger.debug(
+                "Chunk rejected",
+                extra={"whiteboard_id": whiteboard_id, "user_id": user_id, "sample_key": "ws.chunk_rejected"}
+            )
+            return
+        
+        stamped = stamp_envelope(text, user_id) if text is not None else None
+        outgoing = (
+            OutgoingMessage(message_type="chunk", text=stamped)
+            if stamped is not None else OutgoingMessage({**message, "senderId": user_id})
+        )
+        await self.manager.broadcast_to_whiteboard(whiteboard_id, outgoing, exclude_user=user_id)
+        
+        if stream.next_index < stream.count or stream.parts is None:
+            return
+        assembled = self.chunk_assembler.assemble(stream)
+        if assembled is None:
+            # 保存できないため送信者の状態とずれる
+            self.manager.send_to_connection(connection, {
+                "type": "resync",
+                "data": {"reason": "invalid_chunk"},
+                "userId": "",
+                "timestamp": ""
+            })
+            return
+        self.record_element_change(whiteboard_id, user_id, assembled, connection)
+        await self.manager.broadcast_to_whiteboard(
+            whiteboard_id,
+            {
+                "type": "chunk_commit",
+                "data": {"id": stream.id, "messageType": stream.message_type},
+                "userId": user_id,
+                "senderId": user_id,
+                "timestamp": ""
+            },
             exclude_user=user_id
-        )
\ No newline at end of file
+        )
+    
+    def handle_viewport(self, message: dict, websocket: WebSocket | None = None):
+        """
+        表示範囲の登録メッセージを処理（app.websocket.interest 参照）
+        
+        Args:
+            message: 表示範囲メッセージ
+            websocket: 受信したWebSocket
+        """
+        connection = self.manager.get_connection(websocket) if websocket is not None else None
+        if connection is not None:
+            self.manager.set_viewport(connection, parse_viewport(message.get("data")))
+    
+    def spatial_bounds(self, message: dict, whiteboard_id: str):
+        """
+        表示範囲で配信先を絞り込むための座標の外接矩形を取得
+        
+        Args:
+            message: 受信したメッセージ
+            whiteboard_id: ホワイトボードID
+        
+        Returns:
+            外接矩形（ルームに表示範囲を登録した接続がない場合はNone）
+        """
+        if not self.manager.has_viewports(whiteboard_id):
+            return None
+        return message_bounds(message)
+    
+    async def commit_stroke(
+        self,
+        element: dict,
+        stroke_id: Any,
+        whiteboard_id: str,
+        user_id: str,
+        connection: Connection | None = None
+    ):
+        """
+        組み立てたストロークを draw として配信・保存
+        
+        Args:
+            element: 点列全体を持つ描画要素
+            stroke_id: ストロークID（受信側で描画中のストロークを置き換えるため）
+            whiteboard_id: ホワイトボードID
+            user_id: ユーザーID
+            connection: ストロークを送信した接続（要素を変更できない場合は配信・保存しない）
+        """
+        if not self.can_edit(connection):
+            return
+        await self.handle_drawing_update(
+            {
+                "type": "draw",
+                "data": {"element": element, "strokeId": stroke_id},
+                "userId": user_id,
+                "senderId": user_id,
+                "timestamp": ""
+            },
+            whiteboard_id,
+            user_id,
+            connection
+        )
+    
+    async def end_long_stroke(self, connection: Connection, stroke_id: Any, whiteboard_id: str, user_id: str):
+        """
+        点数の上限を超えたストロークを受け付けた点までで確定し、送信者に終了を通知
+        
+        送信者はそれ以降の点を送らず、描き終えた要素を draw で送り直す。
+        
+        Args:
+            connection: 受信した接続
+            stroke_id: ストロークID
+            whiteboard_id: ホワイトボードID
+            user_id: ユーザーID
+        """
+        element = self.stroke_assembler.end(connection, {"strokeId": stroke_id})
+        if element is not None:
+            await self.commit_stroke(element, stroke_id, whiteboard_id, user_id, connection)
+        self.manager.send_to_connection(connection, {
+            "type": "stroke_end",
+            "data": {"strokeId": stroke_id, "reason": "max_points"},
+            "userId": "",
+            "timestamp": ""
+        })
+        logger.debug(
+            "Stroke ended at point limit",
+            extra={"whiteboard_id": whiteboard_id, "user_id": user_id, "sample_key": "ws.stroke_too_long"}
+        )
+    
+    async def end_strokes(self, connection: Connection):
+        """
+        切断した接続の描画中のストロークを確定（要素を変更できない接続の場合は破棄）
+        
+        Args:
+            connection: 切断した接続
+        """
+        elements = self.stroke_assembler.end_all(connection)
+        if not self.can_edit(connection):
+            return
+        for element in elements:
+            await self.commit_stroke(element, None, connection.whiteboard_id, connection.user_id, connection)
@@ -0,0 +1,195 @@
+"""
+リアルタイム共同編集のメトリクス
+
+メッセージタイプ別の送受信数・バイト数、ブロードキャストの配信処理時間、
+ソケット書き込み時間、接続の増減、破棄したフレーム数を記録する。
+記録はすべてイベントループ上で行われるため、ロックは使わず整数の加算だけにする
+（カウンターとヒストグラムのバケットは事前に確保する）。
+ルームの人数や送信キューの長さなどのゲージは、取得時に接続マネージャーから集計する。
+"""
+from bisect import bisect_left
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional
+
+if TYPE_CHECKING:
+    # 送信キューから記録するため、実行時には読み込まない（循環インポート回避）
+    from app.websocket.connection import Connection
+
+
+# 記録するメッセージタイプ（それ以外は "other" にまとめる）
+KNOWN_MESSAGE_TYPES = (
+    "draw", "erase", "clear", "cursor", "cursors", "drawing_event", "drawing_events",
+    "stroke_begin", "stroke_append", "stroke_end", "viewport", "chunk", "chunk_commit",
+    "ping", "pong", "user_join", "user_leave", "connection_success", "snapshot", "resync", "reconnect",
+)
+
+# 処理時間のヒストグラムのバケット上限（秒）
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class Histogram:
+    """固定バケットのヒストグラム"""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Iterable[float]):
+        self.bounds = tuple(bounds)
+        # 最後のバケットは上限超過分
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """q 分位点が含まれるバケットの上限（上限超過の場合は最後のバケット上限）"""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.bounds[-1]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": dict(zip([*map(str, self.bounds), "+Inf"], self.counts)),
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+        }
+
+
+class TypeCounter:
+    """メッセージタイプ別のカウンター（件数とバイト数）"""
+
+    __slots__ = ("messages", "bytes")
+
+    def __init__(self):
+        self.messages: Dict[str, int] = dict.fromkeys((*KNOWN_MESSAGE_TYPES, "other"), 0)
+        self.bytes: Dict[str, int] = dict.fromkeys((*KNOWN_MESSAGE_TYPES, "other"), 0)
+
+    def add(self, message_type: Optional[str], size: int):
+        if message_type not in self.messages:
+            message_type = "other"
+        self.messages[message_type] += 1
+        self.bytes[message_type] += size
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "messages": {t: n for t, n in self.messages.items() if n},
+            "bytes": {t: n for t, n in self.bytes.items() if n},
+            "total_messages": sum(self.messages.values()),
+            "total_bytes": sum(self.bytes.values()),
+        }
+
+
+class WebSocketMetrics:
+    """WebSocketサブシステムのメトリクス"""
+
+    def __init__(self):
+        self.inbound = TypeCounter()
+        self.outbound = TypeCounter()
+        # ブロードキャスト1回あたりの送信キューへの積み込み時間
+        self.fanout_seconds = Histogram(LATENCY_BUCKETS)
+        # ブロードキャスト1回あたりの配信先の接続数
+        self.fanout_recipients = 0
+        # 表示範囲外のため配信を省略した接続数
+        self.viewport_skipped = 0
+        # ソケットへの書き込み1回あたりの時間（遅いクライアントの検出用）
+        self.send_seconds = Histogram(LATENCY_BUCKETS)
+        # 接続の増減
+        self.connections_opened = 0
+        self.connections_closed = 0
+        # クローズコード別の切断数（1013: 遅いクライアント、1001: 応答なし）
+        self.closes_by_code: Dict[str, int] = {}
+        # 切断済みの接続の送信キューで破棄したフレーム数
+        self.closed_frames_dropped = 0
+        # Redisへの発行待ちが溢れて破棄したメッセージ数
+        self.redis_outbox_dropped = 0
+
+    def record_inbound(self, message_type: Optional[str], size: int):
+        self.inbound.add(message_type, size)
+
+    def record_outbound(self, message_type: Optional[str], size: int):
+        self.outbound.add(message_type, size)
+
+    def record_fanout(self, seconds: float, recipients: int, skipped: int = 0):
+        self.fanout_seconds.observe(seconds)
+        self.fanout_recipients += recipients
+        self.viewport_skipped += skipped
+
+    def record_redis_outbox_drop(self):
+        self.redis_outbox_dropped += 1
+
+    def record_connect(self):
+        self.connections_opened += 1
+
+    def record_disconnect(self, connection: "Connection"):
+        self.connections_closed += 1
+        self.closed_frames_dropped += connection.queue.dropped
+        code = str(connection.queue.close_code or "normal")
+        self.closes_by_code[code] = self.closes_by_code.get(code, 0) + 1
+
+    def snapshot(
+        self,
+        rooms: Dict[str, Dict[str, Any]],
+        connections: List["Connection"],
+        top_rooms: int = 20
+    ) -> Dict[str, Any]:
+        """
+        メトリクスを取得
+
+        Args:
+            rooms: whiteboard_id -> user_id -> 接続のセット（接続マネージャーのルーム）
+            connections: 現在の接続
+            top_rooms: 人数の多い順に出力するルーム数
+
+        Returns:
+            メトリクス
+        """
+        depths = [len(connection.queue) for connection in connections]
+        members = sorted(
+            (
+                (whiteboard_id, sum(len(c) for c in room.values()))
+                for whiteboard_id, room in rooms.items()
+            ),
+            key=lambda item: item[1],
+            reverse=True
+        )
+        return {
+            "inbound": self.inbound.to_dict(),
+            "outbound": self.outbound.to_dict(),
+            "fanout_seconds": self.fanout_seconds.to_dict(),
+            "fanout_recipients": self.fanout_recipients,
+            "viewport_skipped": self.viewport_skipped,
+            "send_seconds": self.send_seconds.to_dict(),
+            "connections": {
+                "current": len(connections),
+                "viewers": sum(1 for connection in connections if connection.viewer),
+                "opened": self.connections_opened,
+                "closed": self.connections_closed,
+                "closes_by_code": dict(self.closes_by_code),
+            },
+            "rooms": {
+                "current": len(rooms),
+                "members": dict(members[:top_rooms]),
+            },
+            "queues": {
+                "total_depth": sum(depths),
+                "max_depth": max(depths, default=0),
+                "frames_dropped": self.closed_frames_dropped + sum(
+                    connection.queue.dropped for connection in connections
+                ),
+                "redis_outbox_dropped": self.redis_outbox_dropped,
+            },
+        }
+
+
+# グローバルメトリクス
+metrics = WebSocketMetrics()
@@ -0,0 +1,80 @@
+"""
+ルームごとの操作ログ（再接続時の差分再送用）
+
+描画要素を変更するメッセージに、ルーム内で単調増加するシーケンス番号（seq）を付けて配信し、
+直近の操作をリングバッファに保持する。再接続したクライアントが最後に受信した seq を送ると、
+その後の操作だけを再送する。バッファから溢れている場合は全体の再同期（resync）を要求する。
+
+seq はプロセスごとのログで採番するため、ログを識別する epoch と組で扱う。
+別のワーカーに再接続した場合やログが作り直された場合は epoch が一致せず、全体の再同期になる。
+"""
+from collections import deque
+from typing import Deque, FrozenSet, List, Optional, Tuple
+from uuid import uuid4
+
+from app.websocket.codec import OutgoingMessage
+
+
+# seq を付けて操作ログに残すメッセージタイプ（カーソルやプレビューは次の更新で上書きされるため対象外）
+# chunk_commit は分割転送した draw / erase の確定（app.websocket.chunking 参照）
+SEQUENCED_MESSAGE_TYPES = frozenset({"draw", "erase", "clear", "chunk_commit"})
+
+# (seq, seq付きメッセージ, 配信から除外したユーザーID)
+LogEntry = Tuple[int, OutgoingMessage, FrozenSet[str]]
+
+
+class RoomOpLog:
+    """ルーム1つ分の操作ログ"""
+
+    __slots__ = ("epoch", "seq", "_entries")
+
+    def __init__(self, max_size: int):
+        """
+        操作ログを初期化
+
+        Args:
+            max_size: 保持する操作の最大数
+        """
+        self.epoch = uuid4().hex
+        self.seq = 0
+        self._entries: Deque[LogEntry] = deque(maxlen=max_size)
+
+    def append(self, outgoing: OutgoingMessage, excluded: FrozenSet[str]) -> OutgoingMessage:
+        """
+        seq を付けてログに追加
+
+        Args:
+            outgoing: 配信するメッセージ
+            excluded: 配信から除外したユーザーID
+
+        Returns:
+            seq を付けたメッセージ
+        """
+        self.seq += 1
+        sequenced = outgoing.with_fields(seq=self.seq)
+        sequenced.seq = self.seq
+        self._entries.append((self.seq, sequenced, excluded))
+        return sequenced
+
+    def since(self, last_seq: int, user_id: str) -> Optional[List[OutgoingMessage]]:
+        """
+        指定した seq より後の操作を取得
+
+        Args:
+            last_seq: クライアントが最後に受信した seq
+            user_id: 再接続したユーザーID（このユーザーを除外して配信した操作は含めない）
+
+        Returns:
+            再送する操作（ログから溢れていて差分を作れない場合はNone）
+        """
+        if last_seq > self.seq:
+            return None
+        if last_seq == self.seq:
+            return []
+        oldest = self._entries[0][0] if self._entries else self.seq + 1
+        if last_seq + 1 < oldest:
+            return None
+        return [
+            message for seq, message, excluded in self._entries
+            if seq > last_seq and user_id not in excluded
+        ]
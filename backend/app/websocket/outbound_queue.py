@@ -0,0 +1,329 @@
+from collections import deque
+from typing import Awaitable, Callable, Deque, List, Optional, Tuple
+from fastapi import WebSocket
+import asyncio
+import json
+import logging
+import time
+
+from app.websocket.codec import Frame, OutgoingMessage
+from app.websocket.metrics import metrics
+from app.websocket.op_log import SEQUENCED_MESSAGE_TYPES
+
+
+logger = logging.getLogger(__name__)
+
+
+# 溢れた時に古いものから捨ててよいメッセージタイプ（最新の状態で上書きされるもの）
+DROPPABLE_MESSAGE_TYPES = frozenset({"cursor", "cursors", "drawing_event", "drawing_events"})
+
+# 送信キューの要素 (message_type, frame, 元のメッセージ)
+QueuedFrame = Tuple[Optional[str], Frame, Optional[OutgoingMessage]]
+
+# 送信の優先度クラス（小さいほど先に送る）
+PRIORITY_STATE = 0  # 盤面を変更するメッセージ・制御メッセージ
+PRIORITY_PRESENCE = 1  # 入退室・描画プレビュー
+PRIORITY_CURSOR = 2  # カーソル
+
+# メッセージタイプごとの優先度（未登録のタイプは PRIORITY_STATE）
+# stroke_* は確定時の draw と順序が入れ替わらないよう PRIORITY_STATE のまま送る
+MESSAGE_PRIORITIES = {
+    "user_join": PRIORITY_PRESENCE,
+    "user_leave": PRIORITY_PRESENCE,
+    "drawing_event": PRIORITY_PRESENCE,
+    "drawing_events": PRIORITY_PRESENCE,
+    "cursor": PRIORITY_CURSOR,
+    "cursors": PRIORITY_CURSOR,
+}
+
+# 送信者の古いカーソル・描画プレビューより後に届く必要があるメッセージタイプ
+# （優先度の高いクラスで追い越すため、積んだ時点で同じ送信者の破棄可能なフレームを捨てる）
+SUPERSEDING_MESSAGE_TYPES = SEQUENCED_MESSAGE_TYPES | {"user_leave"}
+
+# 送信キュー溢れ時のポリシー
+OVERFLOW_POLICY_DROP_STALE = "drop_stale"
+OVERFLOW_POLICY_DISCONNECT = "disconnect"
+
+# 遅いクライアントを切断する際のクローズコード（1013: Try Again Later）
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+# ハートビートに応答しない接続を切断する際のクローズコード（1001: Going Away）
+IDLE_CLOSE_CODE = 1001
+
+# 上限を超えるメッセージを受信した接続を切断する際のクローズコード（1009: Message Too Big）
+MESSAGE_TOO_BIG_CLOSE_CODE = 1009
+
+
+class OutboundQueue:
+    """
+    接続ごとの送信キュー
+
+    ブロードキャストはキューに積むだけで即座に戻り、
+    接続ごとの書き込みタスクがソケットへ順番に送信する。
+    フレームは優先度クラスごとのキューに積み、盤面の変更 → 入退室・描画プレビュー → カーソルの順に送る。
+    同じクラス内の順序は保たれる（seq 付きのメッセージはすべて PRIORITY_STATE）。
+    退室・確定した操作を積んだ時点で、同じ送信者の古いカーソル・描画プレビューは捨て、
+    退室後のカーソルや確定後のプレビューが届かないようにする。
+    キューは上限付きで、溢れた場合はポリシーに従って
+    優先度の低いクラスの古いカーソル・描画プレビューから捨てるか、接続を切断する。
+    カーソルは上限に達する前でも cursor_queue_size を超えた分を古いものから捨て、最新の位置だけを送る。
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        max_size: int,
+        send_timeout: float,
+        overflow_policy: str = OVERFLOW_POLICY_DROP_STALE,
+        on_failure: Optional[Callable[[], Awaitable[None]]] = None,
+        cursor_queue_size: Optional[int] = None,
+    ):
+        """
+        送信キューを初期化
+
+        Args:
+            websocket: 送信先のWebSocket
+            max_size: キューに保持できる最大フレーム数
+            send_timeout: 1送信あたりのタイムアウト（秒）
+            overflow_policy: キュー溢れ時のポリシー（drop_stale / disconnect）
+            on_failure: 送信失敗・切断時に呼ばれるコールバック
+            cursor_queue_size: 溜めておくカーソルフレームの上限（Noneの場合は max_size まで）
+        """
+        self.websocket = websocket
+        self.max_size = max_size
+        self.send_timeout = send_timeout
+        self.overflow_policy = overflow_policy
+        self.on_failure = on_failure
+        self.cursor_queue_size = cursor_queue_size
+
+        # 優先度クラスごとの (message_type, frame, 元のメッセージ) のキュー
+        self._queues: List[Deque[QueuedFrame]] = [
+            deque() for _ in range(PRIORITY_CURSOR + 1)
+        ]
+        # seq を受け取れる送信先の書き込み関数（SSE、app.websocket.event_stream 参照）
+        self._send_sequenced = getattr(websocket, "send_sequenced", None)
+        self._ready = asyncio.Event()
+        self._closing = False
+        self._close_code: Optional[int] = None
+        self._writer_task: Optional[asyncio.Task] = None
+
+        # 捨てたフレーム数
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return sum(len(frames) for frames in self._queues)
+
+    @property
+    def is_closing(self) -> bool:
+        return self._closing
+
+    @property
+    def close_code(self) -> Optional[int]:
+        """サーバーから切断した場合のクローズコード"""
+        return self._close_code
+
+    def start(self):
+        """書き込みタスクを開始"""
+        if self._writer_task is None:
+            self._writer_task = asyncio.create_task(self._writer())
+
+    def put(
+        self,
+        message_type: Optional[str],
+        frame: Frame,
+        message: Optional[OutgoingMessage] = None
+    ) -> bool:
+        """
+        フレームを送信キューに積む
+
+        Args:
+            message_type: メッセージタイプ（溢れ時の破棄判定に使用）
+            frame: 送信するフレーム（テキストはstr、バイナリはbytes）
+            message: 元のメッセージ（送信者ごとの順序の判定と、seq を受け取れる送信先への受け渡しに使用）
+
+        Returns:
+            キューに積めたかどうか（Falseの場合は切断が必要）
+        """
+        if self._closing:
+            return False
+
+        priority = MESSAGE_PRIORITIES.get(message_type, PRIORITY_STATE)
+        if message is not None and message_type in SUPERSEDING_MESSAGE_TYPES:
+            self._drop_superseded(priority, message)
+        frames = self._queues[priority]
+        if (
+            priority == PRIORITY_CURSOR and self.cursor_queue_size is not None
+            and len(frames) >= self.cursor_queue_size
+        ):
+            # 古いカーソル位置は新しいもので上書きされるため、溜まりすぎた分を捨てる
+            frames.popleft()
+            self.dropped += 1
+        elif len(self) >= self.max_size:
+            if not self._make_room(message_type):
+                self.disconnect_slow_consumer()
+                return False
+            if len(self) >= self.max_size:
+                # 新しいフレーム自体を捨てた
+                return True
+
+        frames.append((message_type, frame, message))
+        self._ready.set()
+        return True
+
+    def _drop_superseded(self, priority: int, message: OutgoingMessage):
+        """
+        優先度の低いクラスに残っている、同じ送信者の破棄可能なフレームを捨てる
+
+        Args:
+            priority: 積もうとしているメッセージの優先度クラス
+            message: 積もうとしているメッセージ
+        """
+        lower = [frames for frames in self._queues[priority + 1:] if frames]
+        if not lower:
+            return
+        senders = message.senders
+        if not senders:
+            return
+        for frames in lower:
+            kept = [
+                entry for entry in frames
+                if entry[0] not in DROPPABLE_MESSAGE_TYPES or entry[2] is None
+                or not (entry[2].senders & senders)
+            ]
+            if len(kept) < len(frames):
+                self.dropped += len(frames) - len(kept)
+                frames.clear()
+                frames.extend(kept)
+
+    def _make_room(self, message_type: Optional[str]) -> bool:
+        """
+        キュー溢れ時に空きを作る
+
+        Args:
+            message_type: 追加しようとしているメッセージタイプ
+
+        Returns:
+            フレームを破棄して処理を継続できるかどうか
+        """
+        if self.overflow_policy != OVERFLOW_POLICY_DROP_STALE:
+            return False
+
+        # 優先度の低いクラスから、最も古い破棄可能フレームを捨てる
+        for frames in reversed(self._queues):
+            for index, (queued_type, _, _) in enumerate(frames):
+                if queued_type in DROPPABLE_MESSAGE_TYPES:
+                    del frames[index]
+                    self.dropped += 1
+                    return True
+
+        # 破棄できるものがなく、追加しようとしているのが破棄可能なら新しい方を捨てる
+        if message_type in DROPPABLE_MESSAGE_TYPES:
+            self.dropped += 1
+            return True
+
+        return False
+
+    def disconnect_slow_consumer(self):
+        """
+        追いつけないクライアントを切断する
+
+        溜まっているフレームを破棄し、再接続を促すメッセージを送ってからクローズする。
+        """
+        if self._closing:
+            return
+        self.dropped += len(self)
+        self._clear()
+        self._queues[PRIORITY_STATE].append((
+            "reconnect",
+            json.dumps({
+                "type": "reconnect",
+                "data": {"reason": "slow_consumer"},
+                "userId": "",
+                "timestamp": ""
+            }),
+            None
+        ))
+        self._closing = True
+        self._close_code = SLOW_CONSUMER_CLOSE_CODE
+        self._ready.set()
+
+    def disconnect_idle(self):
+        """
+        ハートビートに応答しないクライアントを切断する
+
+        応答がない相手に溜まっているフレームは送らずに破棄してクローズする。
+        """
+        if self._closing:
+            return
+        self.dropped += len(self)
+        self._clear()
+        self._closing = True
+        self._close_code = IDLE_CLOSE_CODE
+        self._ready.set()
+
+    async def _writer(self):
+        """キューからフレームを取り出してソケットへ送信する"""
+        try:
+            while True:
+                frames = next((frames for frames in self._queues if frames), None)
+                if frames is None:
+                    if self._closing:
+                        break
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+
+                _, frame, message = frames.popleft()
+                if isinstance(frame, bytes):
+                    send = self.websocket.send_bytes(frame)
+                elif message is not None and message.seq is not None and self._send_sequenced is not None:
+                    send = self._send_sequenced(frame, message.seq)
+                else:
+                    send = self.websocket.send_text(frame)
+                started = time.perf_counter()
+                try:
+                    await asyncio.wait_for(send, timeout=self.send_timeout)
+                    metrics.send_seconds.observe(time.perf_counter() - started)
+                except asyncio.TimeoutError:
+                    logger.warning("Send timed out, dropping slow connection", extra={"timeout": self.send_timeout})
+                    self._close_code = SLOW_CONSUMER_CLOSE_CODE
+                    self._closing = True
+                    break
+                except Exception as e:
+                    logger.info("Error sending queued message", extra={"error": str(e)})
+                    self._closing = True
+                    break
+
+            if self._close_code is not None:
+                try:
+                    await asyncio.wait_for(
+                        self.websocket.close(code=self._close_code),
+                        timeout=self.send_timeout
+                    )
+                except Exception:
+                    pass
+        except asyncio.CancelledError:
+            return
+
+        self._clear()
+        if self.on_failure is not None:
+            await self.on_failure()
+
+    def close(self, close_code: Optional[int] = None):
+        """
+        書き込みタスクを停止してキューを破棄（ソケット自体はクローズしない）
+
+        Args:
+            close_code: 呼び出し側がソケットをクローズする場合のクローズコード（メトリクス用）
+        """
+        self._closing = True
+        self._close_code = close_code
+        self._clear()
+        self._ready.set()
+        if self._writer_task is not None and self._writer_task is not asyncio.current_task():
+            self._writer_task.cancel()
+
+    def _clear(self):
+        """すべての優先度クラスのフレームを破棄"""
+        for frames in self._queues:
+            frames.clear()
@@ -0,0 +1,117 @@
+"""
+WebSocket受信メッセージのレート制限（トークンバケット）
+
+接続ごと・ルームごとに、メッセージタイプ別のトークンバケットで受信レートを制限する。
+受信したメッセージはルーム全体に配信されるため、1クライアントの過剰な送信が
+ルームの人数倍の負荷にならないよう、配信前に上限を超えた分を破棄する。
+"""
+from collections import Counter
+from typing import Dict, Mapping
+import time
+
+from app.websocket.connection import Connection
+
+
+class TokenBucket:
+    """トークンバケット（rate 毎秒で補充、capacity まで連続して取得可能）"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, now: float) -> bool:
+        """トークンを1つ取得（不足している場合はFalse）"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def refund(self):
+        """取得したトークンを戻す"""
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+
+class RateLimiter:
+    """接続ごと・ルームごとの受信レート制限"""
+
+    def __init__(
+        self,
+        connection_rates: Mapping[str, float],
+        room_rates: Mapping[str, float],
+        burst_seconds: float
+    ):
+        """
+        レート制限を初期化
+
+        Args:
+            connection_rates: メッセージタイプ -> 接続ごとの上限（毎秒）
+            room_rates: メッセージタイプ -> ルーム全体の上限（毎秒）
+            burst_seconds: 上限の何秒分まで連続した受信を許容するか
+        """
+        self.connection_rates = {t: r for t, r in connection_rates.items() if r > 0}
+        self.room_rates = {t: r for t, r in room_rates.items() if r > 0}
+        self.burst_seconds = burst_seconds
+        # whiteboard_id -> メッセージタイプ -> バケット
+        self._room_buckets: Dict[str, Dict[str, TokenBucket]] = {}
+        # メッセージタイプごとの破棄数
+        self.dropped_by_connection: Counter = Counter()
+        self.dropped_by_room: Counter = Counter()
+
+    def allow(self, connection: Connection, message_type: str | None) -> bool:
+        """
+        受信したメッセージを処理してよいか判定（超過した場合は破棄数を記録）
+
+        Args:
+            connection: 受信した接続
+            message_type: メッセージタイプ
+
+        Returns:
+            処理してよいかどうか
+        """
+        connection_rate = self.connection_rates.get(message_type)
+        room_rate = self.room_rates.get(message_type)
+        if connection_rate is None and room_rate is None:
+            return True
+        now = time.monotonic()
+
+        bucket = None
+        if connection_rate is not None:
+            bucket = connection.rate_buckets.get(message_type)
+            if bucket is None:
+                bucket = connection.rate_buckets[message_type] = self._bucket(connection_rate, now)
+            if not bucket.take(now):
+                self.dropped_by_connection[message_type] += 1
+                connection.messages_dropped += 1
+                return False
+
+        if room_rate is not None:
+            room = self._room_buckets.setdefault(connection.whiteboard_id, {})
+            room_bucket = room.get(message_type)
+            if room_bucket is None:
+                room_bucket = room[message_type] = self._bucket(room_rate, now)
+            if not room_bucket.take(now):
+                # ルームの上限で破棄した分は接続の上限に数えない
+                if bucket is not None:
+                    bucket.refund()
+                self.dropped_by_room[message_type] += 1
+                connection.messages_dropped += 1
+                return False
+        return True
+
+    def _bucket(self, rate: float, now: float) -> TokenBucket:
+        return TokenBucket(rate, max(1.0, rate * self.burst_seconds), now)
+
+    def discard_room(self, whiteboard_id: str):
+        """
+        ルームのバケットを破棄（ルームの接続がなくなった場合）
+
+        Args:
+            whiteboard_id: ホワイトボードID
+        """
+        self._room_buckets.pop(whiteboard_id, None)
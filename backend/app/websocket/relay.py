@@ -0,0 +1,83 @@
+"""
+中継専用メッセージの高速パス
+
+cursor / draw / erase / drawing_event はサーバーで内容を解釈せず中継するだけなので、
+受信したJSONテキストを全体デコード・再エンコードせずにそのまま転送する。
+メッセージタイプは先頭の "type" キーだけを読み取り、
+サーバーが付与する送信者IDと受信時刻は末尾に追記する（同じキーがあってもサーバーの値が優先される）。
+
+ただし draw / erase は seq を付けて操作ログに残り、永続化もされるため、中継前に1回だけデコードして
+JSONとして正しいことを確認する（不正なフレームを配信・再送しないように）。
+デコードしないのは cursor など次のメッセージで置き換わるものだけ。
+"""
+from typing import Any, Dict, Optional
+import json
+import re
+import time
+
+
+# 中継のみで処理できるメッセージタイプ
+RELAY_MESSAGE_TYPES = frozenset({"cursor", "draw", "erase", "drawing_event"})
+
+# 中継前にデコードして検証するメッセージタイプ（seq を付けて記録・永続化されるもの）
+VALIDATED_RELAY_TYPES = frozenset({"draw", "erase"})
+
+# 先頭の {"type": "..."} を読み取る
+_TYPE_PREFIX = re.compile(r'\s*\{\s*"type"\s*:\s*"([A-Za-z_]+)"')
+
+
+def peek_message_type(text: str) -> Optional[str]:
+    """
+    JSONテキストの先頭からメッセージタイプだけを読み取る
+
+    Args:
+        text: 受信したJSONテキスト
+
+    Returns:
+        メッセージタイプ（先頭が "type" キーでない場合はNone）
+    """
+    match = _TYPE_PREFIX.match(text)
+    return match.group(1) if match else None
+
+
+def decode_relayed(text: str, message_type: str) -> Optional[Dict[str, Any]]:
+    """
+    中継するJSONテキストをデコードして検証する
+
+    Args:
+        text: 受信したJSONテキスト
+        message_type: 先頭から読み取ったメッセージタイプ
+
+    Returns:
+        デコードしたメッセージ（JSONとして不正、data がオブジェクトでない、
+        またはタイプが先頭から読み取ったものと異なる場合はNone）
+    """
+    try:
+        message = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(message, dict) or message.get("type") != message_type:
+        return None
+    if not isinstance(message.get("data"), dict):
+        return None
+    return message
+
+
+def stamp_envelope(text: str, sender_id: str, server_timestamp: Optional[int] = None) -> Optional[str]:
+    """
+    元のテキストを変更せず、末尾にサーバー側の送信者IDと受信時刻を追記する
+
+    Args:
+        text: 受信したJSONテキスト
+        sender_id: 接続から特定した送信者のユーザーID
+        server_timestamp: 受信時刻（ミリ秒、省略時は現在時刻）
+
+    Returns:
+        追記後のJSONテキスト（オブジェクトとして閉じていない場合はNone）
+    """
+    body = text.rstrip()
+    if not body.endswith("}"):
+        return None
+    if server_timestamp is None:
+        server_timestamp = int(time.time() * 1000)
+    return f'{body[:-1]},"senderId":{json.dumps(sender_id)},"serverTimestamp":{server_timestamp}}}'
@@ -0,0 +1,270 @@
+"""
+編集中のボードの要素一覧をメモリに保持するキャッシュ
+
+WebSocketで参加があったボードをDBから読み込み（warm）、以降はWebSocketの操作と
+REST APIの変更を反映し続ける。warm なボードの GET /whiteboards/{id}/elements はDBを使わずに返す。
+メモリ上限（要素のJSONサイズの合計）を超えた場合は、最も長く使われていないボードから破棄する。
+
+WebSocketの操作をすべてこのプロセスで受け取る必要があるため、
+複数ワーカー構成（REDIS_URL設定時）では使用しない。
+"""
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+import json
+import threading
+
+from app.core.config import settings
+from app.schemas.element import DrawingElement as DrawingElementSchema
+from app.websocket.element_persister import element_to_columns, element_uuid, parse_uuid
+
+
+class _RoomState:
+    """ボード1つ分の要素一覧"""
+
+    __slots__ = ("elements", "sizes", "size", "encoded")
+
+    def __init__(self):
+        # 要素ID -> REST APIと同じ形式の要素（作成順）
+        self.elements: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # 要素ID -> JSONサイズ
+        self.sizes: Dict[str, int] = {}
+        self.size = 0
+        # 要素一覧のJSON（変更時に破棄）
+        self.encoded: Optional[bytes] = None
+
+    def put(self, element: Dict[str, Any]):
+        element_id = element["id"]
+        size = len(json.dumps(element))
+        self.size += size - self.sizes.get(element_id, 0)
+        self.sizes[element_id] = size
+        self.elements[element_id] = element
+        self.encoded = None
+
+    def remove(self, element_id: str):
+        if self.elements.pop(element_id, None) is not None:
+            self.size -= self.sizes.pop(element_id)
+            self.encoded = None
+
+
+class RoomStateCache:
+    """編集中のボードの要素一覧のキャッシュ"""
+
+    def __init__(self, memory_budget: int):
+        """
+        キャッシュを初期化
+
+        Args:
+            memory_budget: 保持する要素のJSONサイズの合計の上限（バイト）
+        """
+        self.memory_budget = memory_budget
+        # whiteboard_id -> 要素一覧（最近使ったものほど後ろ）
+        self._rooms: "OrderedDict[str, _RoomState]" = OrderedDict()
+        self._size = 0
+        # whiteboard_id -> REST APIでの変更回数（読み込み中の変更を検出するため）
+        self._generations: Dict[str, int] = {}
+        # REST APIはスレッドプールで実行されるため排他する
+        self._lock = threading.Lock()
+
+    def is_warm(self, whiteboard_id: str) -> bool:
+        return str(whiteboard_id) in self._rooms
+
+    def generation(self, whiteboard_id: str) -> int:
+        """読み込み開始時に取得し、load() に渡す"""
+        return self._generations.get(str(whiteboard_id), 0)
+
+    def load(self, whiteboard_id: str, elements: List[Dict[str, Any]], generation: int) -> bool:
+        """
+        DBから読み込んだ要素一覧で warm にする
+
+        Args:
+            whiteboard_id: ホワイトボードID
+            elements: REST APIと同じ形式の要素一覧
+            generation: 読み込み開始時の generation()
+
+        Returns:
+            warm にできたかどうか（読み込み中にREST APIで変更された場合はFalse）
+        """
+        whiteboard_id = str(whiteboard_id)
+        with self._lock:
+            if self._generations.get(whiteboard_id, 0) != generation:
+                return False
+            state = _RoomState()
+            for element in elements:
+                state.put(element)
+            self._replace(whiteboard_id, state)
+            return True
+
+    def get_encoded(self, whiteboard_id: str, skip: int = 0, limit: Optional[int] = None) -> Optional[bytes]:
+        """
+        要素一覧のJSONを取得
+
+        Args:
+            whiteboard_id: ホワイトボードID
+            skip: スキップする要素数
+            limit: 最大要素数
+
+        Returns:
+            要素一覧のJSON（warm でない場合はNone）
+        """
+        whiteboard_id = str(whiteboard_id)
+        with self._lock:
+            state = self._rooms.get(whiteboard_id)
+            if state is None:
+                return None
+            self._rooms.move_to_end(whiteboard_id)
+            if skip == 0 and (limit is None or limit >= len(state.elements)):
+                if state.encoded is None:
+                    state.encoded = json.dumps(list(state.elements.values())).encode()
+                return state.encoded
+            elements = list(state.elements.values())
+            end = None if limit is None else skip + limit
+            return json.dumps(elements[skip:end]).encode()
+
+    def get_elements(self, whiteboard_id: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        要素一覧を取得
+
+        Args:
+            whiteboard_id: ホワイトボードID
+
+        Returns:
+            要素一覧（warm でない場合はNone）
+        """
+        whiteboard_id = str(whiteboard_id)
+        with self._lock:
+            state = self._rooms.get(whiteboard_id)
+            if state is None:
+                return None
+            self._rooms.move_to_end(whiteboard_id)
+            return list(state.elements.values())
+
+    def apply_message(self, whiteboard_id: str, user_id: str, message: Dict[str, Any]):
+        """
+        WebSocketの draw / erase メッセージを反映（warm でないボードは何もしない）
+
+        Args:
+            whiteboard_id: ホワイトボードID
+            user_id: 送信したユーザーID
+            message: 受信したメッセージ
+        """
+        whiteboard_id = str(whiteboard_id)
+        data = message.get("data")
+        if whiteboard_id not in self._rooms or not isinstance(data, dict):
+            return
+        board_id = parse_uuid(whiteboard_id)
+        if board_id is None:
+            return
+
+        message_type = message.get("type")
+        with self._lock:
+            state = self._rooms.get(whiteboard_id)
+            if state is None:
+                return
+            before = state.size
+            if message_type == "draw":
+                element = data.get("element")
+                if not isinstance(element, dict) or element.get("id") is None:
+                    return
+                values = element_to_columns(element)
+                if values is None:
+                    return
+                element_id = str(element_uuid(board_id, element["id"]))
+                now = datetime.now(timezone.utc)
+                existing = state.elements.get(element_id)
+                state.put(DrawingElementSchema(
+                    **values,
+                    id=element_id,
+                    whiteboard_id=board_id,
+                    # 作成者は既存の要素のまま（DBへの書き込みと同じ）
+                    user_id=existing.get("user_id") if existing else parse_uuid(user_id),
+                    created_at=existing["created_at"] if existing else now,
+                    updated_at=now
+                ).model_dump(mode="json"))
+            elif message_type == "erase":
+                if data.get("action") == "clear":
+                    self._replace(whiteboard_id, _RoomState())
+                    return
+                if data.get("elementId") is None:
+                    return
+                state.remove(str(element_uuid(board_id, data["elementId"])))
+            else:
+                return
+            self._resized(whiteboard_id, state.size - before)
+
+    def put_elements(self, whiteboard_id: str, elements: List[Dict[str, Any]], replace: bool = False):
+        """
+        REST APIで作成・更新した要素を反映
+
+        Args:
+            whiteboard_id: ホワイトボードID
+            elements: REST APIと同じ形式の要素
+            replace: 既存の要素をすべて置き換えるか（一括保存・全削除）
+        """
+        whiteboard_id = str(whiteboard_id)
+        with self._lock:
+            self._generations[whiteboard_id] = self._generations.get(whiteboard_id, 0) + 1
+            state = self._rooms.get(whiteboard_id)
+            if state is None:
+                return
+            if replace:
+                state = _RoomState()
+                for element in elements:
+                    state.put(element)
+                self._replace(whiteboard_id, state)
+                return
+            before = state.size
+            for element in elements:
+                state.put(element)
+            self._resized(whiteboard_id, state.size - before)
+
+    def remove_element(self, whiteboard_id: str, element_id: str):
+        """
+        REST APIで削除した要素を反映
+
+        Args:
+            whiteboard_id: ホワイトボードID
+            element_id: 要素ID
+        """
+        whiteboard_id = str(whiteboard_id)
+        with self._lock:
+            self._generations[whiteboard_id] = self._generations.get(whiteboard_id, 0) + 1
+            state = self._rooms.get(whiteboard_id)
+            if state is None:
+                return
+            before = state.size
+            state.remove(str(element_id))
+            self._resized(whiteboard_id, state.size - before)
+
+    def _replace(self, whiteboard_id: str, state: _RoomState):
+        """ボードの要素一覧を置き換える（ロック内で呼ぶ）"""
+        previous = self._rooms.pop(whiteboard_id, None)
+        if previous is not None:
+            self._size -= previous.size
+        self._rooms[whiteboard_id] = state
+        self._size += state.size
+        self._evict()
+
+    def _resized(self, whiteboard_id: str, delta: int):
+        """ボードの変更を集計に反映（ロック内で呼ぶ）"""
+        self._size += delta
+        self._rooms.move_to_end(whiteboard_id)
+        self._evict()
+
+    def _evict(self):
+        """メモリ上限を超えた分を、最も長く使われていないボードから破棄（ロック内で呼ぶ）"""
+        while self._size > self.memory_budget and self._rooms:
+            _, state = self._rooms.popitem(last=False)
+            self._size -= state.size
+
+    @property
+    def size(self) -> int:
+        """保持している要素のJSONサイズの合計（バイト）"""
+        return self._size
+
+
+# グローバルキャッシュ（複数ワーカー構成・上限0の場合は無効）
+room_states: Optional[RoomStateCache] = (
+    RoomStateCache(settings.WS_ROOM_STATE_MEMORY_MB * 1024 * 1024)
+    if settings.WS_ROOM_STATE_MEMORY_MB > 0 and not settings.REDIS_URL else None
+)
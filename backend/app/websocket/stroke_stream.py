@@ -0,0 +1,164 @@
+"""
+ペンのストロークの差分配信
+
+描画中のストロークを stroke_begin / stroke_append / stroke_end の3種類のメッセージで送り、
+点列全体を送り直さずに追加された点だけを配信する（長いストロークでも合計の通信量は点数に比例）。
+
+- stroke_begin : {"strokeId": ..., "element": {...描画要素, "points": [最初の点]}}
+- stroke_append: {"strokeId": ..., "x": 最初の点のx, "y": 最初の点のy, "d": [dx1, dy1, dx2, dy2, ...]}
+  d は直前の点からの差分。バッチごとに最初の点を絶対座標で送るため、
+  途中のバッチが欠けても以降の点はずれない。
+- stroke_end   : {"strokeId": ...}
+
+サーバーは接続ごとに描画中のストロークを組み立て、stroke_end で点列全体を持つ1つの描画要素として
+draw と同じように配信・保存する（op log にも draw として残るため再接続時の差分再送にも使える）。
+点数が上限（max_points）を超えるとサーバーがそこまでの点でストロークを確定し、送信者に
+stroke_end {"strokeId": ..., "reason": "max_points"} を返す（送信者は描き終えた要素を draw で送り直す）。
+"""
+from typing import Any, Dict, List, Optional
+
+from app.websocket.connection import Connection
+from app.websocket.validation import is_number, is_point
+
+
+# ストロークのメッセージタイプ
+STROKE_MESSAGE_TYPES = frozenset({"stroke_begin", "stroke_append", "stroke_end"})
+
+
+class StrokeTooLong(Exception):
+    """ストロークの点数が上限を超えた場合の例外（受け付けた点までで確定し、送信者に通知する）"""
+
+
+class Stroke:
+    """描画中のストローク1本分"""
+
+    __slots__ = ("element", "points")
+
+    def __init__(self, element: Dict[str, Any], points: List[Dict[str, float]]):
+        self.element = element
+        self.points = points
+
+
+class StrokeAssembler:
+    """接続ごとに描画中のストロークを組み立てるクラス"""
+
+    def __init__(self, max_points: int, max_open: int):
+        """
+        組み立てを初期化
+
+        Args:
+            max_points: 1ストロークあたりの点数の上限
+            max_open: 1接続で同時に描画中にできるストローク数
+        """
+        self.max_points = max_points
+        self.max_open = max_open
+
+    def begin(self, connection: Connection, data: Any) -> bool:
+        """
+        ストロークを開始
+
+        Args:
+            connection: 受信した接続
+            data: stroke_begin のデータ
+
+        Returns:
+            受け付けたかどうか（Falseの場合は配信しない）
+
+        Raises:
+            StrokeTooLong: 最初の点列が点数の上限を超えた場合
+        """
+        if not isinstance(data, dict) or not _is_id(data.get("strokeId")):
+            return False
+        element = data.get("element")
+        if not isinstance(element, dict) or element.get("id") is None:
+            return False
+        if not is_number(element.get("x")) or not is_number(element.get("y")):
+            return False
+        strokes = connection.strokes
+        if data["strokeId"] not in strokes and len(strokes) >= self.max_open:
+            return False
+
+        points = element.get("points")
+        if isinstance(points, list) and points and all(is_point(p) for p in points):
+            if len(points) > self.max_points:
+                raise StrokeTooLong(f"Stroke exceeds {self.max_points} points")
+            points = [{"x": p["x"], "y": p["y"]} for p in points]
+        else:
+            points = [{"x": element["x"], "y": element["y"]}]
+        strokes[data["strokeId"]] = Stroke(
+            {k: v for k, v in element.items() if k != "points"}, points
+        )
+        return True
+
+    def append(self, connection: Connection, data: Any) -> bool:
+        """
+        描画中のストロークに点を追加
+
+        Args:
+            connection: 受信した接続
+            data: stroke_append のデータ
+
+        Returns:
+            受け付けたかどうか（開始していないストロークの場合はFalse）
+
+        Raises:
+            StrokeTooLong: 追加すると点数の上限を超える場合（追加前の点列はそのまま残る）
+        """
+        if not isinstance(data, dict) or not _is_id(data.get("strokeId")):
+            return False
+        stroke = connection.strokes.get(data["strokeId"])
+        if stroke is None:
+            return False
+        x, y, deltas = data.get("x"), data.get("y"), data.get("d", [])
+        if not is_number(x) or not is_number(y) or not isinstance(deltas, list) or len(deltas) % 2:
+            return False
+        if not all(is_number(v) for v in deltas):
+            return False
+        if len(stroke.points) + 1 + len(deltas) // 2 > self.max_points:
+            raise StrokeTooLong(f"Stroke exceeds {self.max_points} points")
+
+        points = stroke.points
+        points.append({"x": x, "y": y})
+        for i in range(0, len(deltas), 2):
+            x += deltas[i]
+            y += deltas[i + 1]
+            points.append({"x": x, "y": y})
+        return True
+
+    def end(self, connection: Connection, data: Any) -> Optional[Dict[str, Any]]:
+        """
+        ストロークを終了
+
+        Args:
+            connection: 受信した接続
+            data: stroke_end のデータ
+
+        Returns:
+            点列全体を持つ描画要素（開始していないストロークの場合はNone）
+        """
+        if not isinstance(data, dict) or not _is_id(data.get("strokeId")):
+            return None
+        stroke = connection.strokes.pop(data["strokeId"], None)
+        if stroke is None:
+            return None
+        return {**stroke.element, "points": stroke.points}
+
+    def end_all(self, connection: Connection) -> List[Dict[str, Any]]:
+        """
+        描画中のストロークをすべて終了（切断時、描いた分までを要素として確定する）
+
+        Args:
+            connection: 切断した接続
+
+        Returns:
+            点列全体を持つ描画要素
+        """
+        elements = [{**s.element, "points": s.points} for s in connection.strokes.values()]
+        connection.strokes.clear()
+        return elements
+
+
+# ヘルパー関数
+
+def _is_id(value: Any) -> bool:
+    return isinstance(value, (str, int)) and not isinstance(value, bool)
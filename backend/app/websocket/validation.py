@@ -0,0 +1,21 @@
+"""
+受信したメッセージの値の検証
+
+コーデック・表示範囲・ストローク・永続化で同じ基準を使うため、ここで定義して共有する。
+"""
+from typing import Any
+import math
+
+
+def is_number(value: Any) -> bool:
+    """有限の数値かどうか（JSONの true / false、NaN・Infinity は数値として扱わない）"""
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, int):
+        return True
+    return isinstance(value, float) and math.isfinite(value)
+
+
+def is_point(value: Any) -> bool:
+    """x, y に数値の座標を持つ辞書かどうか"""
+    return isinstance(value, dict) and is_number(value.get("x")) and is_number(value.get("y"))
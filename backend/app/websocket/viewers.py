@@ -0,0 +1,165 @@
+"""
+閲覧専用接続（viewer）の配信
+
+発表などで1人の発表者に数千人の閲覧者が付くボードでは、閲覧者をメンバー（rooms）とは別の
+ルームごとの集合で管理する。閲覧者には入退室の通知・除外ユーザー・表示範囲の判定を行わず、
+コーデックごとに1回だけエンコードしたフレームをそのまま全員の送信キューに積む。
+閲覧者から受信したメッセージはハートビートの応答以外処理しない（app.websocket.websocket 参照）。
+
+カーソルは受信ごとに配信せず、ユーザーごとの最新位置だけを保持して cursor_hz の間隔で
+1つの "cursors" フレームにまとめて配信する。
+"""
+from typing import Any, Callable, Dict, Optional, Set
+import asyncio
+
+from app.websocket.codec import OutgoingMessage
+from app.websocket.connection import Connection
+
+
+# 間引いて配信するメッセージタイプ
+THINNED_MESSAGE_TYPES = frozenset({"cursor", "cursors"})
+
+# 閲覧専用接続から受け付けるメッセージタイプ（ハートビートのみ）
+VIEWER_MESSAGE_TYPES = frozenset({"ping", "pong"})
+
+
+class ViewerTier:
+    """ルームごとの閲覧専用接続の集合と配信"""
+
+    def __init__(self, cursor_hz: float, enqueue: Callable[[Connection, OutgoingMessage], None]):
+        """
+        閲覧専用接続の配信を初期化
+
+        Args:
+            cursor_hz: 1秒あたりのカーソル配信回数（0の場合はカーソルを配信しない）
+            enqueue: 接続の送信キューにメッセージを積む関数
+        """
+        self.cursor_interval = 1.0 / cursor_hz if cursor_hz > 0 else None
+        self.enqueue = enqueue
+        # whiteboard_id -> 閲覧専用接続
+        self.rooms: Dict[str, Set[Connection]] = {}
+        # whiteboard_id -> user_id -> 配信待ちの最新カーソル情報
+        self._cursors: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # whiteboard_id -> カーソルの配信待ちタスク
+        self._flush_tasks: Dict[str, asyncio.Task] = {}
+
+    def count(self, whiteboard_id: str) -> int:
+        """ルームの閲覧専用接続数"""
+        return len(self.rooms.get(whiteboard_id, ()))
+
+    def add(self, connection: Connection):
+        """
+        閲覧専用接続を登録
+
+        Args:
+            connection: 接続
+        """
+        self.rooms.setdefault(connection.whiteboard_id, set()).add(connection)
+
+    def remove(self, connection: Connection):
+        """
+        閲覧専用接続を削除（ルームの最後の接続なら配信待ちのカーソルも破棄）
+
+        Args:
+            connection: 接続
+        """
+        whiteboard_id = connection.whiteboard_id
+        viewers = self.rooms.get(whiteboard_id)
+        if viewers is None:
+            return
+        viewers.discard(connection)
+        if not viewers:
+            del self.rooms[whiteboard_id]
+            self._cursors.pop(whiteboard_id, None)
+            task = self._flush_tasks.pop(whiteboard_id, None)
+            if task is not None:
+                task.cancel()
+
+    def deliver(self, whiteboard_id: str, outgoing: OutgoingMessage) -> int:
+        """
+        ルームの閲覧専用接続にメッセージを配信
+
+        Args:
+            whiteboard_id: ホワイトボードID
+            outgoing: 配信するメッセージ
+
+        Returns:
+            送信キューに積んだ接続数（カーソルは次の配信まで保持するため0）
+        """
+        viewers = self.rooms.get(whiteboard_id)
+        if not viewers:
+            return 0
+
+        if outgoing.type in THINNED_MESSAGE_TYPES:
+            try:
+                self._collect_cursors(whiteboard_id, outgoing.message)
+            except ValueError:
+                # デコードせずに中継したカーソルがJSONとして不正
+                pass
+            return 0
+        if outgoing.type == "user_leave":
+            # 離脱したユーザーのカーソルは配信しない
+            self._cursors.get(whiteboard_id, {}).pop(outgoing.message.get("userId"), None)
+
+        for connection in viewers:
+            self.enqueue(connection, outgoing)
+        return len(viewers)
+
+    def _collect_cursors(self, whiteboard_id: str, message: Dict[str, Any]):
+        """カーソル位置をユーザーごとの最新値として保持し、次の配信を予約"""
+        if self.cursor_interval is None:
+            return
+        data = message.get("data")
+        if not isinstance(data, dict):
+            return
+        if message.get("type") == "cursors":
+            cursors = data.get("cursors") or []
+        else:
+            cursors = [{**data, "userId": message.get("senderId") or message.get("userId")}]
+
+        pending = self._cursors.setdefault(whiteboard_id, {})
+        for cursor in cursors:
+            if isinstance(cursor, dict) and cursor.get("userId"):
+                pending[cursor["userId"]] = cursor
+
+        if pending and whiteboard_id not in self._flush_tasks:
+            self._flush_tasks[whiteboard_id] = asyncio.create_task(self._flush_after_tick(whiteboard_id))
+
+    async def _flush_after_tick(self, whiteboard_id: str):
+        """1tick待ってからルームの閲覧専用接続にカーソルを配信"""
+        try:
+            await asyncio.sleep(self.cursor_interval)
+        finally:
+            self._flush_tasks.pop(whiteboard_id, None)
+        self.flush_cursors(whiteboard_id)
+
+    def flush_cursors(self, whiteboard_id: str) -> Optional[OutgoingMessage]:
+        """
+        保持しているカーソル位置を1フレームにまとめて閲覧専用接続へ配信
+
+        Args:
+            whiteboard_id: ホワイトボードID
+
+        Returns:
+            配信したフレーム（配信するものがない場合はNone）
+        """
+        pending = self._cursors.pop(whiteboard_id, None)
+        viewers = self.rooms.get(whiteboard_id)
+        if not pending or not viewers:
+            return None
+        outgoing = OutgoingMessage({
+            "type": "cursors",
+            "data": {"cursors": list(pending.values())},
+            "userId": "",
+            "timestamp": ""
+        })
+        for connection in viewers:
+            self.enqueue(connection, outgoing)
+        return outgoing
+
+    def stop(self):
+        """配信待ちのタスクを停止"""
+        for task in self._flush_tasks.values():
+            task.cancel()
+        self._flush_tasks.clear()
+        self._cursors.clear()
@@ -1,12 +1,23 @@
 from fastapi import WebSocket, WebSocketDisconnect, status
 import json
+import logging
 
-from app.core.database import get_db
+from app.core.config import settings
+from app.websocket.broadcast_backend import create_broadcast_backend
+from app.websocket.chunking import MessageTooLarge
+from app.websocket.codec import negotiate_codec
 from app.websocket.connection_manager import ConnectionManager
+from app.websocket.handshake_auth import READ_ONLY_PERMISSIONS, handshake_auth
 from app.websocket.message_handler import MessageHandler
+from app.websocket.metrics import metrics
+from app.websocket.outbound_queue import MESSAGE_TOO_BIG_CLOSE_CODE
+from app.websocket.relay import peek_message_type
+from app.websocket.viewers import VIEWER_MESSAGE_TYPES
 
-# グローバル接続マネージャー
-manager = ConnectionManager()
+logger = logging.getLogger(__name__)
+
+# グローバル接続マネージャー（REDIS_URL設定時は全ワーカー間でルームを共有）
+manager = ConnectionManager(backend=create_broadcast_backend())
 message_handler = MessageHandler(manager)
 
 
@@ -22,72 +33,191 @@ async def websocket_endpoint(
         whiteboard_id: ホワイトボードID
     
     クエリパラメータ:
-        userId: ユーザーID
-        token: JWTトークン
-    """
-    # データベースセッションを取得
-    db_generator = get_db()
-    db = next(db_generator)
+        userId: ユーザーID（省略可、指定した場合はトークンのユーザーと一致する必要がある）
+        token: JWTトークン（必須、ボードの閲覧権限がない場合は 1008 で切断）
+        lastSeq: 再接続時、最後に受信した操作の seq（取りこぼした操作だけが再送される）
+        epoch: lastSeq を受信した操作ログの epoch（connection_success で通知される）
+        snapshot: 1 の場合、参加直後にボードの要素一覧を snapshot メッセージで送信
+            （再接続で差分を再送できた場合は送らない）
+        mode: viewer の場合、編集権限があっても閲覧専用接続として参加
+            （閲覧権限・公開ボードのみのユーザーは常に閲覧専用、app.websocket.viewers 参照）
     
+    サブプロトコル:
+        whiteboard.bin.v1: カーソル・点列をバイナリフレームで送受信（app.websocket.codec 参照）
+        whiteboard.json: JSONテキストフレーム（指定なしの場合も同じ）
+    """
+    # DBセッションは接続中保持せず、DB処理ごとにDB用スレッドプールで作成する
+    # （app.core.database.run_in_db_executor 参照）
     try:
         # WebSocketクエリパラメータを手動で解析
         query_params = websocket.query_params
         user_id_param = query_params.get('userId')
         token = query_params.get('token')
         
-        print(f"WebSocket connection attempt: whiteboard_id={whiteboard_id}, user_id={user_id_param}, token={token[:50] if token else None}...")
-        print(f"Query params - user_id type: {type(user_id_param)}, token type: {type(token)}")
+        logger.debug(
+            "WebSocket connection attempt",
+            extra={"whiteboard_id": whiteboard_id, "user_id": user_id_param, "has_token": bool(token)}
+        )
         
-        # user_idの型チェックとバリデーション
-        if not user_id_param:
-            print("Error: user_id is required")
+        # トークンを検証し、ボードへの権限を確認（権限はキャッシュから解決）
+        authorized = await handshake_auth.authorize(whiteboard_id, token, user_id_param)
+        if authorized is None:
+            logger.info(
+                "Unauthorized WebSocket connection",
+                extra={"whiteboard_id": whiteboard_id, "user_id": user_id_param}
+            )
             await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
             return
         
-        # str型に変換
-        user_id_str = str(user_id_param)
+        # トークンのユーザーIDを使用し、閲覧のみの権限なら閲覧専用接続にする
+        user_id_str, permission = authorized
+        viewer = permission in READ_ONLY_PERMISSIONS or query_params.get('mode') == 'viewer'
+        
+        logger.info("WebSocket accepted", extra={"whiteboard_id": whiteboard_id, "user_id": user_id_str})
         
-        print(f"WebSocket accepted for user {user_id_str} on whiteboard {whiteboard_id}")
+        # サブプロトコルからエンコード方式を決定
+        codec, subprotocol = negotiate_codec(websocket.scope.get("subprotocols", []))
+        
+        # 再接続の場合は最後に受信した seq から再開
+        last_seq_param = query_params.get('lastSeq')
+        last_seq = int(last_seq_param) if last_seq_param and last_seq_param.isdigit() else None
+        snapshot_requested = query_params.get('snapshot') == '1'
         
         # 接続マネージャーを使用して接続を管理
-        await manager.connect(websocket, whiteboard_id, user_id_str)
+        connection = await manager.connect(
+            websocket, whiteboard_id, user_id_str, codec=codec, subprotocol=subprotocol,
+            last_seq=last_seq, epoch=query_params.get('epoch'),
+            send_resync=not snapshot_requested,
+            viewer=viewer,
+            permission=permission
+        )
         
-        # 簡単なテストメッセージを送信
+        # 接続成功と、再接続時に使う操作ログの位置を送信
+        op_log = manager.get_op_log(whiteboard_id)
         test_message = {
             "type": "connection_success",
-            "data": {"message": "Connected successfully"},
+            "data": {
+                "message": "Connected successfully",
+                "epoch": op_log.epoch,
+                "seq": op_log.seq,
+                "viewer": viewer
+            },
             "userId": user_id_str,
             "timestamp": ""
         }
-        await websocket.send_text(json.dumps(test_message))
+        await manager.send_personal_message(json.dumps(test_message), websocket)
+        
+        # ボードの現在の状態を送信（REST APIでの取得を省略できる）
+        if snapshot_requested and not connection.resumed:
+            await message_handler.send_snapshot(connection)
+        else:
+            # 編集中のボードとして要素一覧をメモリに読み込む（REST APIの取得をメモリから返す）
+            try:
+                await message_handler.warm_room_state(whiteboard_id)
+            except Exception as e:
+                logger.warning(
+                    "Error loading room state", extra={"whiteboard_id": whiteboard_id, "error": str(e)}
+                )
         
         # 接続を維持
         try:
             while True:
-                data = await websocket.receive_text()
-                message = json.loads(data)
-                print(f"Received message: {message}")
+                frame = await websocket.receive()
+                if frame["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(frame.get("code", status.WS_1000_NORMAL_CLOSURE))
+                connection.messages_in += 1
+                
+                # 1フレームの上限を超えるメッセージは分割（chunk）して送る必要がある
+                # テキストフレームはUTF-8のバイト数で数える（ASCIIのみなら文字数と同じ）
+                if frame.get("bytes") is not None:
+                    size = len(frame["bytes"])
+                else:
+                    text = frame.get("text") or ""
+                    size = len(text) if text.isascii() else len(text.encode())
+                if size > settings.WS_FRAME_SIZE_LIMIT:
+                    raise MessageTooLarge(f"Frame exceeds {settings.WS_FRAME_SIZE_LIMIT} bytes")
+                
+                # バイナリフレームはコーデックで、テキストフレームはJSONとしてデコード
+                if frame.get("bytes") is not None:
+                    message = codec.decode(frame["bytes"])
+                    message_type = message.get("type")
+                    metrics.record_inbound(message_type, size)
+                else:
+                    message = None
+                    message_type = peek_message_type(text)
+                    if message_type is None:
+                        message = json.loads(text)
+                        message_type = message.get("type")
+                    metrics.record_inbound(message_type, size)
+                
+                # 閲覧専用接続はハートビートの応答以外を処理しない
+                if connection.viewer and message_type not in VIEWER_MESSAGE_TYPES:
+                    continue
+                
+                # レート制限を超えたメッセージは配信せずに破棄
+                if not message_handler.admit(connection, message_type):
+                    continue
+                
+                if message is None:
+                    # 中継のみのメッセージはデコードせずに転送
+                    if await message_handler.relay_text(text, whiteboard_id, user_id_str, connection):
+                        continue
+                    message = json.loads(text)
+                logger.debug(
+                    "Received message",
+                    extra={
+                        "whiteboard_id": whiteboard_id,
+                        "user_id": user_id_str,
+                        "message_type": message_type,
+                        "sample_key": "ws.message"
+                    }
+                )
                 
                 # メッセージハンドラーで処理
-                await message_handler.handle_message(message, whiteboard_id, user_id_str, db)
+                await message_handler.handle_message(message, whiteboard_id, user_id_str, websocket)
                 
         except WebSocketDisconnect:
-            print(f"WebSocket disconnected for user {user_id_str} on whiteboard {whiteboard_id}")
-        except Exception as e:
-            print(f"Message handling error: {e}")
+            logger.info("WebSocket disconnected", extra={"whiteboard_id": whiteboard_id, "user_id": user_id_str})
+        except MessageTooLarge as e:
+            logger.info(
+                "WebSocket message too large",
+                extra={"whiteboard_id": whiteboard_id, "user_id": user_id_str, "error": str(e)}
+            )
+            connection.queue.close(MESSAGE_TOO_BIG_CLOSE_CODE)
+            await websocket.close(code=MESSAGE_TOO_BIG_CLOSE_CODE)
+        except Exception:
+            logger.exception(
+                "Message handling error", extra={"whiteboard_id": whiteboard_id, "user_id": user_id_str}
+            )
             # WebSocket接続を終了
         finally:
+            # 描画中のストロークは描いた分までを要素として確定
+            try:
+                await message_handler.end_strokes(connection)
+            except Exception as e:
+                logger.warning(
+                    "Error ending strokes", extra={"whiteboard_id": whiteboard_id, "error": str(e)}
+                )
+            # 配信待ちのカーソルを破棄
+            if message_handler.cursor_aggregator is not None:
+                message_handler.cursor_aggregator.discard_user(whiteboard_id, user_id_str)
             # 接続マネージャーから切断
             await manager.disconnect(websocket, whiteboard_id, user_id_str)
+            # 接続がなくなったルームのレート制限を破棄
+            if message_handler.rate_limiter is not None and not manager.rooms.get(whiteboard_id):
+                message_handler.rate_limiter.discard_room(whiteboard_id)
+            # バッファ中の描画要素をDBへ反映
+            if message_handler.element_persister is not None:
+                await message_handler.element_persister.flush(whiteboard_id)
         
         return
     
-    except Exception as e:
-        print(f"WebSocket error: {e}")
+    except Exception:
+        logger.exception("WebSocket error", extra={"whiteboard_id": whiteboard_id})
         try:
             await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
         except Exception as close_error:
-            print(f"Error closing WebSocket: {close_error}")
+            logger.info("Error closing WebSocket", extra={"error": str(close_error)})
     
     finally:
         # 切断処理
@@ -96,14 +226,7 @@ async def websocket_endpoint(
             if 'user_id_str' in locals():
                 await manager.disconnect(websocket, whiteboard_id, user_id_str)
         except Exception as e:
-            print(f"Error during disconnect: {e}")
-        
-        # データベースセッションをクローズ
-        try:
-            if hasattr(db, 'close'):
-                db.close()
-        except Exception as db_error:
-            print(f"Error closing database session: {db_error}")
+            logger.warning("Error during disconnect", extra={"error": str(e)})
 
 
 def get_connection_manager() -> ConnectionManager:
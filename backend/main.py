@@ -1,22 +1,32 @@
 """Whiteboard API main application module."""
 from contextlib import asynccontextmanager
+import logging
 from fastapi import FastAPI, Request, WebSocket
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
+from app.core.database import db_executor
+from app.core.logging import setup_logging
 from app.api.v1.api import api_router
-from app.websocket.websocket import websocket_endpoint
+from app.websocket.websocket import get_connection_manager, get_message_handler, websocket_endpoint
+
+# ログ出力をキュー経由にする（標準出力への書き込みでイベントループを止めない）
+setup_logging()
+logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """アプリケーションのライフサイクル管理"""
     # startup
-    print(f"Starting {settings.PROJECT_NAME} in {settings.ENVIRONMENT} mode")
+    logger.info("Starting application", extra={"project": settings.PROJECT_NAME, "environment": settings.ENVIRONMENT})
     yield
     # shutdown
-    print(f"Shutting down {settings.PROJECT_NAME}")
+    logger.info("Shutting down application", extra={"project": settings.PROJECT_NAME})
+    await get_message_handler().shutdown()
+    await get_connection_manager().shutdown()
+    db_executor.shutdown(wait=True)
     _ = app  # 型チェッカーを満足させるための行
 
 
@@ -40,15 +50,17 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
     
     # 開発環境でのみ詳細な情報をログ出力
     if settings.ENVIRONMENT == "development":
-        print(f"DEBUG: Validation error on {request.method} {request.url}")
-        print(f"DEBUG: Validation error details: {exc.errors()}")
+        logger.warning(
+            "Validation error",
+            extra={"method": request.method, "url": str(request.url), "errors": exc.errors()}
+        )
         
         # デバッグ用にリクエスト本文を取得を試行
         try:
             body = await request.body()
-            print(f"DEBUG: Request body: {body.decode()}")
+            logger.debug("Validation error request body", extra={"body": body.decode()})
         except Exception as e:
-            print(f"DEBUG: Could not read request body: {e}")
+            logger.debug("Could not read request body", extra={"error": str(e)})
     
     # 標準的な422レスポンスを返す
     return JSONResponse(
@@ -107,5 +119,6 @@ async def websocket_route(
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # 1フレームの上限を超えるWebSocketメッセージは受信時点で 1009 で切断する
+    uvicorn.run(app, host="0.0.0.0", port=8000, ws_max_size=settings.WS_FRAME_SIZE_LIMIT)
 
@@ -0,0 +1,296 @@
+"""
+WebSocketの負荷生成ツール
+
+N ルーム × M ユーザーの疑似クライアントで /ws/{whiteboard_id} に接続し、
+cursor / drawing_event / draw を指定したレートで送信して、
+送信から他メンバーが受信するまでの遅延（パーセンタイル）、スループット、サーバーのCPU使用率を出力する。
+送信者・受信者は同じプロセス内のため、遅延は time.perf_counter() の差で測る。
+
+準備として REST API でユーザー（M人、全ルームで共通）を登録・ログインし、
+1人目のユーザーが N 個のボードを作成して他のユーザーに編集権限で共有する。
+
+使用例（ローカルで起動したサーバーに対して実行）:
+    python scripts/ws_loadgen.py --rooms 20 --users 10 --duration 60 --server-pid $(pgrep -f uvicorn | head -1)
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+
+import httpx
+import websockets
+
+
+# 遅延のサンプルを保持する上限（メッセージタイプごと、超えた分はリザーバーサンプリング）
+MAX_SAMPLES = 200_000
+
+
+@dataclass
+class Stats:
+    """集計結果"""
+
+    sent: Dict[str, int] = field(default_factory=dict)
+    received: Dict[str, int] = field(default_factory=dict)
+    latencies: Dict[str, List[float]] = field(default_factory=dict)
+    seen: Dict[str, int] = field(default_factory=dict)
+    connect_failures: int = 0
+    disconnects: int = 0
+
+    def count_sent(self, message_type: str):
+        self.sent[message_type] = self.sent.get(message_type, 0) + 1
+
+    def record(self, message_type: str, latency: float):
+        self.received[message_type] = self.received.get(message_type, 0) + 1
+        samples = self.latencies.setdefault(message_type, [])
+        seen = self.seen.get(message_type, 0) + 1
+        self.seen[message_type] = seen
+        if len(samples) < MAX_SAMPLES:
+            samples.append(latency)
+        else:
+            index = random.randrange(seen)
+            if index < MAX_SAMPLES:
+                samples[index] = latency
+
+
+@dataclass
+class LoadUser:
+    """負荷生成に使うユーザー"""
+
+    email: str
+    user_id: str
+    token: str
+
+
+async def prepare(args: argparse.Namespace) -> tuple[List[LoadUser], List[str]]:
+    """REST APIでユーザーとボードを準備"""
+    api = f"{args.base_url}/api/v1"
+    password = "loadgen-password"
+    users: List[LoadUser] = []
+    async with httpx.AsyncClient(timeout=30) as client:
+        for i in range(args.users):
+            email = f"{args.email_prefix}-{i}@example.com"
+            await client.post(f"{api}/auth/register", json={
+                "email": email, "name": f"loadgen {i}", "password": password
+            })
+            login = await client.post(f"{api}/auth/login", json={"email": email, "password": password})
+            login.raise_for_status()
+            token = login.json()["access_token"]
+            me = await client.get(f"{api}/auth/me", headers={"Authorization": f"Bearer {token}"})
+            me.raise_for_status()
+            users.append(LoadUser(email, me.json()["id"], token))
+
+        owner = {"Authorization": f"Bearer {users[0].token}"}
+        boards: List[str] = []
+        for i in range(args.rooms):
+            created = await client.post(f"{api}/whiteboards/", headers=owner, json={
+                "title": f"loadgen room {i}", "is_public": False
+            })
+            created.raise_for_status()
+            board_id = created.json()["id"]
+            if len(users) > 1:
+                shared = await client.post(f"{api}/whiteboards/{board_id}/share", headers=owner, json={
+                    "user_emails": [user.email for user in users[1:]], "permission": "edit"
+                })
+                shared.raise_for_status()
+            boards.append(board_id)
+    return users, boards
+
+
+def make_message(message_type: str, user: LoadUser, index: int, counter: int) -> dict:
+    """送信時刻を埋め込んだメッセージを作成"""
+    sent_at = time.perf_counter()
+    x, y = random.uniform(0, 1600), random.uniform(0, 900)
+    if message_type == "cursor":
+        data = {"x": x, "y": y, "loadgenSentAt": sent_at}
+    elif message_type == "drawing_event":
+        data = {"type": "drawing", "point": {"x": x, "y": y}, "loadgenSentAt": sent_at}
+    else:
+        # 同じ要素を更新し続け、DBの要素数が増え続けないようにする
+        data = {
+            "element": {
+                "id": f"loadgen-{index}-{counter % 20}",
+                "type": "pen",
+                "x": x,
+                "y": y,
+                "color": "#1f77b4",
+                "strokeWidth": 2,
+                "points": [{"x": x + i, "y": y + i} for i in range(16)],
+            },
+            "loadgenSentAt": sent_at,
+        }
+    return {"type": message_type, "data": data, "userId": user.user_id, "timestamp": ""}
+
+
+def record_received(message: dict, user_id: str, stats: Stats):
+    """受信したメッセージに埋め込まれた送信時刻から遅延を記録（自分の送信分は除く）"""
+    now = time.perf_counter()
+    message_type = message.get("type")
+    data = message.get("data") or {}
+    if message_type == "cursors":
+        for cursor in data.get("cursors", []):
+            if "loadgenSentAt" in cursor and cursor.get("userId") != user_id:
+                stats.record("cursor", now - cursor["loadgenSentAt"])
+    elif message_type == "drawing_events":
+        for event in data.get("events", []):
+            record_received(event, user_id, stats)
+    elif isinstance(data, dict) and "loadgenSentAt" in data and message.get("userId") != user_id:
+        stats.record(message_type, now - data["loadgenSentAt"])
+
+
+async def run_client(
+    args: argparse.Namespace,
+    user: LoadUser,
+    board_id: str,
+    index: int,
+    stop_at: float,
+    stats: Stats
+):
+    """疑似クライアント1つ分（送信と受信を並行に実行）"""
+    url = f"{args.ws_url}/ws/{board_id}?userId={user.user_id}&token={user.token}"
+    try:
+        websocket = await websockets.connect(url, max_size=None)
+    except Exception:
+        stats.connect_failures += 1
+        return
+
+    rates = {"cursor": args.cursor_hz, "drawing_event": args.drawing_event_hz, "draw": args.draw_hz}
+    total_rate = sum(rates.values())
+    types = list(rates)
+    weights = [rates[t] for t in types]
+
+    async def sender():
+        counter = 0
+        while time.perf_counter() < stop_at and total_rate > 0:
+            # ポアソン到着（ユーザー操作のばらつきを模擬）
+            await asyncio.sleep(random.expovariate(total_rate))
+            message_type = random.choices(types, weights)[0]
+            await websocket.send(json.dumps(make_message(message_type, user, index, counter)))
+            stats.count_sent(message_type)
+            counter += 1
+
+    async def receiver():
+        async for raw in websocket:
+            if isinstance(raw, str):
+                record_received(json.loads(raw), user.user_id, stats)
+
+    receive_task = asyncio.create_task(receiver())
+    try:
+        await sender()
+        # 送信終了後、配信中のメッセージを受け取る
+        await asyncio.sleep(args.drain)
+    except websockets.ConnectionClosed:
+        stats.disconnects += 1
+    finally:
+        receive_task.cancel()
+        await websocket.close()
+
+
+def read_cpu_seconds(pid: Optional[int]) -> Optional[float]:
+    """プロセスのCPU時間（user + system、Linuxの /proc から取得）"""
+    if pid is None:
+        return None
+    try:
+        with open(f"/proc/{pid}/stat") as stat:
+            fields = stat.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def percentile(samples: List[float], q: float) -> float:
+    index = min(len(samples) - 1, int(q * len(samples)))
+    return samples[index]
+
+
+def report(stats: Stats, elapsed: float, server_cpu: Optional[float], client_cpu: float):
+    """集計結果を出力"""
+    print(f"\nduration: {elapsed:.1f}s")
+    print(f"connect failures: {stats.connect_failures}, disconnects: {stats.disconnects}")
+    print(f"{'type':<15}{'sent/s':>10}{'recv/s':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for message_type in sorted(set(stats.sent) | set(stats.received)):
+        samples = sorted(stats.latencies.get(message_type, []))
+        row = f"{message_type:<15}{stats.sent.get(message_type, 0) / elapsed:>10.1f}"
+        row += f"{stats.received.get(message_type, 0) / elapsed:>10.1f}"
+        if samples:
+            row += "".join(
+                f"{percentile(samples, q) * 1000:>10.2f}" for q in (0.5, 0.9, 0.99)
+            ) + f"{samples[-1] * 1000:>10.2f}"
+        print(row)
+    if server_cpu is not None:
+        print(f"server CPU: {server_cpu / elapsed * 100:.1f}% of one core")
+    print(f"load generator CPU: {client_cpu / elapsed * 100:.1f}% of one core"
+          " (100% に近い場合は負荷生成側が律速）")
+
+
+async def fetch_server_metrics(args: argparse.Namespace, token: str):
+    """サーバーのメトリクス（配信処理時間・破棄数）を出力"""
+    async with httpx.AsyncClient(timeout=10) as client:
+        response = await client.get(
+            f"{args.base_url}/api/v1/metrics/websocket", headers={"Authorization": f"Bearer {token}"}
+        )
+    if response.status_code != 200:
+        return
+    metrics = response.json()
+    print(f"server fan-out p99: {metrics['fanout_seconds']['p99']}s, "
+          f"socket write p99: {metrics['send_seconds']['p99']}s, "
+          f"frames dropped: {metrics['queues']['frames_dropped']}, "
+          f"rate limited: {metrics.get('rate_limited', {})}")
+
+
+async def main(args: argparse.Namespace):
+    users, boards = await prepare(args)
+    print(f"prepared {len(boards)} rooms x {len(users)} users")
+
+    stats = Stats()
+    cpu_before = read_cpu_seconds(args.server_pid)
+    client_cpu_before = time.process_time()
+    started = time.perf_counter()
+    stop_at = started + args.ramp + args.duration
+
+    tasks = []
+    for room_index, board_id in enumerate(boards):
+        for user_index, user in enumerate(users):
+            index = room_index * len(users) + user_index
+            tasks.append(asyncio.create_task(run_client(args, user, board_id, index, stop_at, stats)))
+            # 接続を ramp 秒に分散
+            await asyncio.sleep(args.ramp / (len(boards) * len(users)))
+    await asyncio.gather(*tasks)
+
+    elapsed = time.perf_counter() - started - args.drain
+    cpu_after = read_cpu_seconds(args.server_pid)
+    server_cpu = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+    report(stats, elapsed, server_cpu, time.process_time() - client_cpu_before)
+    await fetch_server_metrics(args, users[0].token)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="WebSocket load generator")
+    parser.add_argument("--base-url", default="http://localhost:8000", help="REST APIのURL")
+    parser.add_argument("--ws-url", default=None, help="WebSocketのURL（省略時は base-url から作成）")
+    parser.add_argument("--rooms", type=int, default=10, help="ルーム数")
+    parser.add_argument("--users", type=int, default=5, help="ルームあたりのユーザー数")
+    parser.add_argument("--duration", type=float, default=30.0, help="送信する秒数")
+    parser.add_argument("--ramp", type=float, default=5.0, help="全接続を開始するまでの秒数")
+    parser.add_argument("--drain", type=float, default=1.0, help="送信終了後に受信を待つ秒数")
+    parser.add_argument("--cursor-hz", type=float, default=20.0, help="ユーザーあたりの cursor 送信レート")
+    parser.add_argument("--drawing-event-hz", type=float, default=10.0,
+                        help="ユーザーあたりの drawing_event 送信レート")
+    parser.add_argument("--draw-hz", type=float, default=0.5, help="ユーザーあたりの draw 送信レート")
+    parser.add_argument("--server-pid", type=int, default=None, help="CPU使用率を測るサーバーのPID")
+    parser.add_argument("--email-prefix", default=f"loadgen-{uuid.uuid4().hex[:8]}",
+                        help="登録するユーザーのメールアドレスの接頭辞（同じ値で再実行するとユーザーを再利用）")
+    args = parser.parse_args()
+    if args.users < 1 or args.rooms < 1:
+        parser.error("--rooms and --users must be at least 1")
+    if args.ws_url is None:
+        args.ws_url = args.base_url.replace("https://", "wss://").replace("http://", "ws://")
+    return args
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,139 @@
+"""Tests for persisting drawing elements from the REST batch save and the WebSocket write-behind buffer."""
+from uuid import uuid4
+
+import httpx
+import pytest
+from sqlalchemy.orm import Session
+
+from app.core.database import get_db
+from app.core.security import create_access_token
+from app.models.user import User
+from app.models.whiteboard import DrawingElement, Whiteboard
+from app.websocket.element_persister import ElementPersister, element_uuid
+from app.websocket.websocket import get_message_handler
+from main import app
+from tests.conftest import TestingSessionLocal
+
+
+def draw(element_id: str, x: float) -> dict:
+    """WebSocketの描画メッセージ"""
+    return {"type": "draw", "data": {"element": {"id": element_id, "type": "pen", "x": x, "y": 0}}}
+
+
+def batch_element(element_id: str, x: float) -> dict:
+    """一括保存APIの要素"""
+    return {"id": element_id, "type": "pen", "x": x, "y": 0, "color": "#000000"}
+
+
+@pytest.fixture
+def board(db: Session) -> Whiteboard:
+    """Create a whiteboard owned by a test user."""
+    user = User(email="batch@example.com", name="Batch User", password_hash="unused")
+    db.add(user)
+    db.commit()
+    whiteboard = Whiteboard(title="Batch Board", owner_id=user.id)
+    db.add(whiteboard)
+    db.commit()
+    db.refresh(whiteboard)
+    return whiteboard
+
+
+@pytest.fixture
+def persister(monkeypatch) -> ElementPersister:
+    """Replace the WebSocket persister with one bound to the test database."""
+    persister = ElementPersister(flush_interval_ms=60_000, batch_size=1000, session_factory=TestingSessionLocal)
+    monkeypatch.setattr(get_message_handler(), "element_persister", persister)
+    return persister
+
+
+class TestBatchSaveWithWriteBehind:
+    """Test that the REST batch save and buffered WebSocket changes hit the same rows."""
+
+    @pytest.mark.asyncio
+    async def test_buffered_changes_do_not_duplicate_or_resurrect(self, db: Session, board: Whiteboard, persister):
+        """Buffered WS changes are superseded by the batch save, and later WS changes update its rows."""
+        app.dependency_overrides[get_db] = lambda: db
+        user_id = str(board.owner_id)
+        board_id = str(board.id)
+        headers = {"Authorization": f"Bearer {create_access_token(user_id)}"}
+
+        def rows() -> dict:
+            db.expire_all()
+            return {
+                element.id: element.x
+                for element in db.query(DrawingElement).filter(DrawingElement.whiteboard_id == board.id)
+            }
+
+        try:
+            # WebSocketの描画・消去がバッファされたまま一括保存される
+            persister.add_message(board_id, user_id, draw("el-a", 1))
+            persister.add_message(board_id, user_id, {"type": "erase", "data": {"elementId": "el-c"}})
+            async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+                response = await client.post(
+                    f"/api/v1/whiteboards/{board_id}/elements/batch",
+                    headers=headers,
+                    json={"elements": [batch_element("el-a", 5), batch_element("el-c", 7)]}
+                )
+            assert response.status_code == 200
+            await persister.flush_all()
+
+            el_a, el_c = element_uuid(board.id, "el-a"), element_uuid(board.id, "el-c")
+            assert rows() == {el_a: 5, el_c: 7}
+
+            # 保存後の操作は保存された行に反映される
+            persister.add_message(board_id, user_id, draw("el-a", 9))
+            persister.add_message(board_id, user_id, {"type": "erase", "data": {"elementId": "el-c"}})
+            await persister.flush_all()
+
+            assert rows() == {el_a: 9}
+        finally:
+            app.dependency_overrides.clear()
+
+
+class TestWriteBehindIsolation:
+    """Test that one bad element does not roll back the rest of a board's batch."""
+
+    @pytest.mark.asyncio
+    async def test_foreign_and_failing_elements_are_skipped(self, db: Session, board: Whiteboard, persister):
+        """Elements owned by another board or violating constraints are dropped alone."""
+        other = Whiteboard(title="Other Board", owner_id=board.owner_id)
+        db.add(other)
+        db.commit()
+        foreign = DrawingElement(whiteboard_id=other.id, type="pen", x=1, y=1, color="#000000")
+        db.add(foreign)
+        db.commit()
+        foreign_id = foreign.id
+        board_id, user_id = str(board.id), str(board.owner_id)
+
+        # 他のボードの要素ID、存在しないユーザー（外部キー違反）、正常な要素を同じバッチで書き込む
+        persister.add_message(board_id, user_id, draw(str(foreign_id), 100))
+        persister.add_message(board_id, str(uuid4()), draw("el-ghost", 2))
+        persister.add_message(board_id, user_id, draw("el-ok", 3))
+        await persister.flush_all()
+
+        db.expire_all()
+        assert db.get(DrawingElement, foreign_id).x == 1
+        saved = db.query(DrawingElement).filter(DrawingElement.whiteboard_id == board.id).all()
+        assert [(element.id, element.x) for element in saved] == [(element_uuid(board.id, "el-ok"), 3)]
+        assert persister._pending == {}
+
+    @pytest.mark.asyncio
+    async def test_editing_keeps_element_creator(self, db: Session, board: Whiteboard, persister):
+        """Editing an element over the WebSocket does not change who created it."""
+        editor = User(email="editor@example.com", name="Editor", password_hash="unused")
+        db.add(editor)
+        db.commit()
+        board_id, owner_id, editor_id = str(board.id), str(board.owner_id), str(editor.id)
+
+        persister.add_message(board_id, owner_id, draw("el-a", 1))
+        await persister.flush_all()
+        persister.add_message(board_id, editor_id, draw("el-a", 2))
+        # 同じバッチ内で追加と編集が続いた場合も最初に描いたユーザーが作成者
+        persister.add_message(board_id, owner_id, draw("el-b", 1))
+        persister.add_message(board_id, editor_id, draw("el-b", 2))
+        await persister.flush_all()
+
+        db.expire_all()
+        for client_id in ("el-a", "el-b"):
+            element = db.get(DrawingElement, element_uuid(board.id, client_id))
+            assert (element.x, element.user_id) == (2, board.owner_id)
@@ -0,0 +1,40 @@
+"""
+ログ設定のユニットテスト
+"""
+import logging
+
+from app.core.logging import KeyValueFormatter, SamplingFilter, parse_log_levels
+
+
+def record(msg: str, **extra) -> logging.LogRecord:
+    """テスト用のログレコード"""
+    log_record = logging.LogRecord("app.test", logging.DEBUG, __file__, 1, msg, None, None)
+    for key, value in extra.items():
+        setattr(log_record, key, value)
+    return log_record
+
+
+class TestLogging:
+    """ログ設定のテストクラス"""
+
+    def test_key_value_output(self):
+        """extra の項目が key=value で出力されることのテスト"""
+        line = KeyValueFormatter().format(record("Received message", whiteboard_id="wb1", sample_key="ws"))
+
+        assert 'msg="Received message"' in line
+        assert "whiteboard_id=wb1" in line
+        assert "sample_key" not in line
+
+    def test_sampled_logs_are_limited_per_key(self):
+        """sample_key ごとに1秒あたりの件数で間引かれることのテスト"""
+        sampling = SamplingFilter(per_second=2)
+
+        emitted = [sampling.filter(record("draw", sample_key="ws.draw")) for _ in range(5)]
+
+        assert emitted == [True, True, False, False, False]
+        assert sampling.filter(record("erase", sample_key="ws.erase"))
+        assert sampling.filter(record("connected"))
+
+    def test_parse_log_levels(self):
+        """モジュールごとのログレベル指定が解析されることのテスト"""
+        assert parse_log_levels("warning, app.websocket=debug") == ("WARNING", {"app.websocket": "DEBUG"})
@@ -0,0 +1 @@
+"""WebSocket test module."""
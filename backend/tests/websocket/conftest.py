@@ -0,0 +1,26 @@
+"""
+WebSocketのテストで共通して使うフィクスチャ
+"""
+import pytest_asyncio
+
+from app.websocket.connection_manager import ConnectionManager
+from app.websocket.message_handler import MessageHandler
+from tests.websocket.helpers import close_queues
+
+
+@pytest_asyncio.fixture
+async def manager():
+    """テスト用ConnectionManagerインスタンス（終了時に書き込みタスクを停止）"""
+    manager = ConnectionManager(send_timeout=0.05)
+    yield manager
+    await close_queues(manager)
+
+
+@pytest_asyncio.fixture
+async def handler(manager):
+    """DB・Redisを使わないMessageHandlerインスタンス"""
+    handler = MessageHandler(manager)
+    handler.element_persister = None
+    handler.room_states = None
+    handler.rate_limiter = None
+    return handler
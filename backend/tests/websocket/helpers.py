@@ -0,0 +1,80 @@
+"""
+WebSocketのテストで共通して使うヘルパー
+"""
+import asyncio
+import json
+
+from app.websocket.connection import Connection
+from app.websocket.connection_manager import ConnectionManager
+
+
+DRAW = {"type": "draw", "data": {"element": {"id": "el-1", "type": "pen", "x": 0, "y": 0}}}
+
+
+async def drain(timeout: float = 0.5):
+    """送信キューの書き込みタスクに処理を進めさせる"""
+    await asyncio.sleep(timeout)
+
+
+async def close_queues(manager: ConnectionManager):
+    """残っている書き込みタスクとハートビートを停止する"""
+    for queue in [c.queue for c in manager.connections.values()]:
+        queue.close()
+    if manager.heartbeat is not None:
+        manager.heartbeat.stop()
+    await asyncio.sleep(0)
+
+
+def connection(user_id: str = "user-a", whiteboard_id: str = "wb1") -> Connection:
+    """テスト用の接続（送信しないためWebSocket・キューは不要）"""
+    return Connection(None, user_id, whiteboard_id, None, None)
+
+
+def chunks(message: dict, size: int, stream_id: str = "c1") -> list[dict]:
+    """メッセージのJSONテキストを size 文字ずつのチャンクに分割"""
+    text = json.dumps(message)
+    parts = [text[i:i + size] for i in range(0, len(text), size)]
+    return [
+        {
+            "type": "chunk",
+            "data": {
+                "id": stream_id, "index": i, "count": len(parts),
+                "messageType": message["type"], "payload": part
+            }
+        }
+        for i, part in enumerate(parts)
+    ]
+
+
+def begin_data(stroke_id: str = "s1") -> dict:
+    """stroke_begin のデータ"""
+    return {"strokeId": stroke_id, "element": {"id": "el-1", "type": "pen", "x": 10, "y": 20, "color": "#000000"}}
+
+
+class FakeWebSocket:
+    """テスト用のWebSocketモック"""
+
+    def __init__(self, delay: float = 0.0, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.sent: list[str] = []
+        self.closed_code: int | None = None
+
+    async def accept(self, subprotocol: str | None = None):
+        self.subprotocol = subprotocol
+
+    async def send_text(self, text: str):
+        if self.fail:
+            raise RuntimeError("socket is broken")
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.sent.append(text)
+
+    async def send_bytes(self, data: bytes):
+        await self.send_text(data)
+
+    async def close(self, code: int = 1000):
+        self.closed_code = code
+
+    def messages(self) -> list[dict]:
+        return [json.loads(text) for text in self.sent]
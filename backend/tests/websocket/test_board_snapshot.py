@@ -0,0 +1,62 @@
+"""
+BoardSnapshotCacheのユニットテスト
+"""
+import pytest
+
+from app.websocket.board_snapshot import BoardSnapshotCache
+
+
+class CountingSnapshotCache(BoardSnapshotCache):
+    """DBの代わりに固定の要素一覧を返し、読み込み回数を数えるキャッシュ"""
+
+    def __init__(self, elements, **kwargs):
+        super().__init__(**kwargs)
+        self.elements = elements
+        self.loads = 0
+
+    def load_elements(self, whiteboard_id):
+        self.loads += 1
+        return self.elements
+
+
+class TestBoardSnapshotCache:
+    """BoardSnapshotCacheのテストクラス"""
+
+    @pytest.mark.asyncio
+    async def test_snapshot_is_split_into_chunks(self):
+        """要素一覧がチャンクに分けて送られることのテスト"""
+        elements = [{"id": str(i)} for i in range(5)]
+        cache = CountingSnapshotCache(elements, chunk_size=2, ttl_seconds=60)
+
+        chunks = await cache.get("wb1", ("epoch", 0))
+
+        assert [c.message["data"]["chunk"] for c in chunks] == [0, 1, 2]
+        assert all(c.message["data"]["chunks"] == 3 for c in chunks)
+        assert [e for c in chunks for e in c.message["data"]["elements"]] == elements
+
+    @pytest.mark.asyncio
+    async def test_empty_board_sends_one_chunk(self):
+        """要素がない場合も1チャンク送られることのテスト"""
+        cache = CountingSnapshotCache([], chunk_size=2, ttl_seconds=60)
+
+        chunks = await cache.get("wb1", ("epoch", 0))
+
+        assert len(chunks) == 1
+        assert chunks[0].message["data"] == {"elements": [], "chunk": 0, "chunks": 1}
+
+    @pytest.mark.asyncio
+    async def test_snapshot_is_reused_until_board_changes(self):
+        """操作ログの位置が同じ間はキャッシュが使われることのテスト"""
+        cache = CountingSnapshotCache([{"id": "1"}], chunk_size=10, ttl_seconds=60)
+
+        first = await cache.get("wb1", ("epoch", 3))
+        second = await cache.get("wb1", ("epoch", 3))
+        assert second is first
+        assert cache.loads == 1
+
+        await cache.get("wb1", ("epoch", 4))
+        assert cache.loads == 2
+
+        cache.invalidate("wb1")
+        await cache.get("wb1", ("epoch", 4))
+        assert cache.loads == 3
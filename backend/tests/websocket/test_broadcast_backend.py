@@ -0,0 +1,189 @@
+"""
+ブロードキャストバックエンドのユニットテスト
+"""
+import asyncio
+import json
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app.websocket.broadcast_backend import InMemoryBroadcastBackend, RedisBroadcastBackend
+from app.websocket.codec import OutgoingMessage
+from app.websocket.connection_manager import ConnectionManager
+from app.websocket.metrics import metrics
+from tests.websocket.helpers import FakeWebSocket, close_queues, drain
+
+
+class TestCrossWorkerBroadcast:
+    """複数ワーカー間配信のテストクラス（同じバックエンドを共有する2つのマネージャーで模擬）"""
+
+    @pytest.mark.asyncio
+    async def test_message_reaches_members_on_other_worker(self):
+        """別ワーカーのメンバーにもメッセージが届くことのテスト"""
+        backend = InMemoryBroadcastBackend()
+        worker_a = ConnectionManager(backend=backend)
+        worker_b = ConnectionManager(backend=backend)
+        alice, bob, carol = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        await worker_a.connect(alice, "wb1", "alice")
+        await worker_b.connect(bob, "wb1", "bob")
+        await worker_b.connect(carol, "wb2", "carol")
+
+        await worker_a.broadcast_to_whiteboard("wb1", {"type": "draw"}, exclude_user="alice")
+        await drain(0.01)
+
+        assert {"type": "draw", "seq": 1} in bob.messages()
+        assert {"type": "draw", "seq": 1} not in alice.messages()
+        assert {"type": "draw", "seq": 1} not in carol.messages()
+        await close_queues(worker_a)
+        await close_queues(worker_b)
+
+    @pytest.mark.asyncio
+    async def test_exclusion_applies_on_other_worker(self):
+        """除外ユーザーが別ワーカーに接続していても除外されることのテスト"""
+        backend = InMemoryBroadcastBackend()
+        worker_a = ConnectionManager(backend=backend)
+        worker_b = ConnectionManager(backend=backend)
+        alice_tab1, alice_tab2 = FakeWebSocket(), FakeWebSocket()
+        await worker_a.connect(alice_tab1, "wb1", "alice")
+        await worker_b.connect(alice_tab2, "wb1", "alice")
+
+        await worker_a.broadcast_to_whiteboard("wb1", {"type": "draw"}, exclude_user="alice")
+        await drain(0.01)
+
+        assert {"type": "draw", "seq": 1} not in alice_tab2.messages()
+        await close_queues(worker_a)
+        await close_queues(worker_b)
+
+    @pytest.mark.asyncio
+    async def test_leave_is_announced_to_other_worker(self):
+        """最後のローカルメンバーが抜けても他ワーカーに離脱が通知されることのテスト"""
+        backend = InMemoryBroadcastBackend()
+        worker_a = ConnectionManager(backend=backend)
+        worker_b = ConnectionManager(backend=backend)
+        alice, bob = FakeWebSocket(), FakeWebSocket()
+        await worker_a.connect(alice, "wb1", "alice")
+        await worker_b.connect(bob, "wb1", "bob")
+
+        await worker_a.disconnect(alice, "wb1", "alice")
+        await drain(0.01)
+
+        assert "user_leave" in [m["type"] for m in bob.messages()]
+        assert set(backend._subscribers["wb1"]) == {worker_b.instance_id}
+        await close_queues(worker_b)
+
+
+class FakePubSub:
+    """テスト用のRedis Pub/Subモック（受信する項目を順に返し、例外は送出する）"""
+
+    def __init__(self, items: list):
+        self.items = items
+        self.channels: list[str] = []
+        self.closed = False
+
+    async def subscribe(self, *channels: str):
+        self.channels.extend(channels)
+
+    async def close(self):
+        self.closed = True
+
+    async def listen(self):
+        for item in self.items:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+class FakeRedis:
+    """テスト用のRedisクライアントモック（pubsub() を呼ぶたびに次の接続を返す）"""
+
+    def __init__(self, *pubsubs: FakePubSub):
+        self.pubsubs = list(pubsubs)
+
+    def pubsub(self) -> FakePubSub:
+        return self.pubsubs.pop(0)
+
+
+class TestRedisBroadcastBackend:
+    """RedisBroadcastBackendのテストクラス（Redisサーバーなしでペイロード形式を検証）"""
+
+    @pytest.mark.asyncio
+    async def test_published_payload_is_dispatched_on_other_process(self):
+        """発行したペイロードが別プロセスで元のメッセージに戻ることのテスト"""
+        sender = RedisBroadcastBackend("redis://localhost:6379/0")
+        receiver = RedisBroadcastBackend("redis://localhost:6379/0")
+        handler = AsyncMock()
+        receiver._subscribers["wb1"] = {"manager-b": handler}
+        sender._publisher_task = asyncio.get_running_loop().create_future()
+
+        text = '{"type":"draw","data":{"id":"e1"}}'
+        await sender.publish("wb1", OutgoingMessage(message_type="draw", text=text), {"alice"}, "manager-a")
+        channel, payload = sender._outbox.get_nowait()
+        await receiver._dispatch(channel.encode(), payload)
+
+        whiteboard_id, message, exclude_users = handler.await_args.args
+        assert whiteboard_id == "wb1"
+        assert message.type == "draw"
+        assert message.message == json.loads(text)
+        assert exclude_users == {"alice"}
+        sender._publisher_task.cancel()
+
+    @pytest.mark.asyncio
+    async def test_own_messages_are_ignored(self):
+        """自プロセスが発行したメッセージは無視されることのテスト"""
+        backend = RedisBroadcastBackend("redis://localhost:6379/0")
+        handler = AsyncMock()
+        backend._subscribers["wb1"] = {"manager-a": handler}
+        backend._publisher_task = asyncio.get_running_loop().create_future()
+
+        await backend.publish("wb1", OutgoingMessage({"type": "draw"}), set(), "manager-a")
+        channel, payload = backend._outbox.get_nowait()
+        await backend._dispatch(channel, payload)
+
+        handler.assert_not_awaited()
+        backend._publisher_task.cancel()
+
+    @pytest.mark.asyncio
+    async def test_outbox_is_bounded_while_publisher_is_stalled(self):
+        """発行が止まっている間、発行待ちが上限を超えず溢れた分が破棄・記録されることのテスト"""
+        backend = RedisBroadcastBackend("redis://localhost:6379/0", outbox_limit=2)
+        backend._publisher_task = asyncio.get_running_loop().create_future()
+        before = metrics.redis_outbox_dropped
+
+        for i in range(5):
+            await backend.publish("wb1", OutgoingMessage({"type": "draw", "data": {"i": i}}), set(), "manager-a")
+
+        assert backend._outbox.qsize() == 2
+        assert metrics.redis_outbox_dropped - before == 3
+        payload = backend._outbox.get_nowait()[1]
+        assert json.loads(payload.decode().partition("\n")[2])["data"] == {"i": 0}
+        backend._publisher_task.cancel()
+
+    @pytest.mark.asyncio
+    async def test_listener_skips_bad_items_and_resubscribes(self):
+        """不正なメッセージを読み飛ばし、接続が切れた場合は購読し直して受信を続けることのテスト"""
+        sender = RedisBroadcastBackend("redis://localhost:6379/0")
+        sender._publisher_task = asyncio.get_running_loop().create_future()
+        await sender.publish("wb1", OutgoingMessage({"type": "draw", "data": {"i": 1}}), set(), "manager-a")
+        await sender.publish("wb1", OutgoingMessage({"type": "draw", "data": {"i": 2}}), set(), "manager-a")
+        payloads = [sender._outbox.get_nowait()[1] for _ in range(2)]
+        sender._publisher_task.cancel()
+
+        def item(data: bytes) -> dict:
+            return {"type": "message", "channel": b"whiteboard:wb1", "data": data}
+
+        first = FakePubSub([item(b"not json\n{}"), item(payloads[0]), ConnectionError("connection lost")])
+        second = FakePubSub([item(payloads[1])])
+        backend = RedisBroadcastBackend("redis://localhost:6379/0")
+        backend.reconnect_delay = 0.01
+        backend._redis, backend._pubsub = FakeRedis(second), first
+        handler = AsyncMock()
+        backend._subscribers["wb1"] = {"manager-b": handler}
+
+        listener = asyncio.create_task(backend._listen())
+        await asyncio.sleep(0.05)
+
+        assert [call.args[1].message["data"]["i"] for call in handler.await_args_list] == [1, 2]
+        assert first.closed
+        assert second.channels == ["whiteboard:wb1"]
+        assert not listener.done()
+        listener.cancel()
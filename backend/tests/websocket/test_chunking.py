@@ -0,0 +1,69 @@
+"""
+大きなメッセージの分割転送のユニットテスト
+"""
+import json
+
+import pytest
+
+from app.websocket.chunking import ChunkAssembler, MessageTooLarge
+from tests.websocket.helpers import DRAW, FakeWebSocket, chunks, connection, drain
+
+
+class TestChunkAssembler:
+    """ChunkAssemblerのテストクラス"""
+
+    def test_draw_is_assembled_in_order(self):
+        """draw はすべてのチャンクを受信した時点で組み立てられることのテスト"""
+        assembler = ChunkAssembler(max_message_size=1000)
+        conn = connection()
+
+        streams = [assembler.accept(conn, chunk["data"]) for chunk in chunks(DRAW, 10)]
+
+        assert all(stream is not None for stream in streams)
+        assert assembler.assemble(streams[-1]) == DRAW
+        assert conn.chunks is None
+
+    def test_relay_only_types_are_not_buffered(self):
+        """中継のみのメッセージは payload を保持しないことのテスト"""
+        assembler = ChunkAssembler(max_message_size=1000)
+        conn = connection()
+        event = {"type": "drawing_event", "data": {"point": {"x": 1, "y": 2}}}
+
+        stream = assembler.accept(conn, chunks(event, 10)[0]["data"])
+
+        assert stream.parts is None
+
+    def test_out_of_order_and_oversized_streams_are_rejected(self):
+        """順序が飛んだチャンクは破棄され、上限を超えると例外になることのテスト"""
+        assembler = ChunkAssembler(max_message_size=30)
+        conn = connection()
+        parts = chunks(DRAW, 10)
+
+        assert assembler.accept(conn, parts[0]["data"]) is not None
+        assert assembler.accept(conn, parts[2]["data"]) is None
+        assert conn.chunks is None
+        with pytest.raises(MessageTooLarge):
+            for part in parts:
+                assembler.accept(conn, part["data"])
+
+
+class TestChunkMessages:
+    """チャンクの中継のテストクラス"""
+
+    @pytest.mark.asyncio
+    async def test_chunks_are_relayed_and_committed(self, manager, handler):
+        """チャンクが受信順に中継され、最後に seq 付きの chunk_commit が配信されることのテスト"""
+        sender, peer = FakeWebSocket(), FakeWebSocket()
+        await manager.connect(sender, "wb-chunk", "user-a")
+        await manager.connect(peer, "wb-chunk", "user-b")
+        conn = manager.get_connection(sender)
+
+        for chunk in chunks(DRAW, 16):
+            assert await handler.relay_text(json.dumps(chunk), "wb-chunk", "user-a", conn)
+        await drain(0.01)
+
+        received = [m for m in peer.messages() if m["type"] != "user_join"]
+        assert {m["type"] for m in received[:-1]} == {"chunk"}
+        assert json.loads("".join(m["data"]["payload"] for m in received[:-1])) == DRAW
+        assert received[-1]["type"] == "chunk_commit"
+        assert received[-1]["seq"] == 1
@@ -0,0 +1,90 @@
+"""
+WebSocketコーデックのユニットテスト
+"""
+import json
+
+import pytest
+
+from app.websocket.codec import (
+    BINARY_CODEC,
+    JSON_CODEC,
+    CodecError,
+    negotiate_codec,
+)
+
+
+class TestBinaryCodec:
+    """BinaryCodecのテストクラス"""
+
+    def test_cursor_round_trip(self):
+        """カーソルがバイナリで往復できることのテスト"""
+        message = {"type": "cursor", "data": {"x": 120.5, "y": 48.25}, "userId": "user-a", "timestamp": ""}
+
+        frame = BINARY_CODEC.encode(message)
+
+        assert isinstance(frame, bytes)
+        assert BINARY_CODEC.decode(frame) == message
+
+    def test_cursors_round_trip(self):
+        """集約カーソルがバイナリで往復できることのテスト"""
+        message = {
+            "type": "cursors",
+            "data": {"cursors": [{"x": 1.0, "y": 2.0, "userId": "a"}, {"x": 3.0, "y": 4.0, "userId": "b"}]},
+            "userId": "",
+            "timestamp": "",
+        }
+
+        assert BINARY_CODEC.decode(BINARY_CODEC.encode(message)) == message
+
+    def test_points_are_packed_and_restored(self):
+        """点列がバイナリブロックに詰められ、元に戻ることのテスト"""
+        points = [{"x": float(i), "y": float(i * 2)} for i in range(500)]
+        message = {
+            "type": "draw",
+            "data": {"element": {"id": "el-1", "type": "pen", "color": "#000000", "points": points}},
+            "userId": "user-a",
+            "timestamp": "2025-01-01T00:00:00Z",
+        }
+
+        frame = BINARY_CODEC.encode(message)
+
+        assert isinstance(frame, bytes)
+        assert BINARY_CODEC.decode(frame) == message
+        assert len(json.dumps(message)) / len(frame) >= 3
+
+    def test_message_without_coordinates_falls_back_to_json(self):
+        """バイナリレイアウトに当てはまらないメッセージはJSONで送られることのテスト"""
+        message = {"type": "user_join", "data": {"userId": "a"}, "userId": "a", "timestamp": ""}
+
+        frame = BINARY_CODEC.encode(message)
+
+        assert isinstance(frame, str)
+        assert BINARY_CODEC.decode(frame) == message
+
+    def test_out_of_range_coordinates_fall_back_to_json(self):
+        """float32に収まらない座標はJSONで送られることのテスト"""
+        message = {"type": "cursor", "data": {"x": 1e300, "y": 0}, "userId": "a", "timestamp": ""}
+
+        assert isinstance(BINARY_CODEC.encode(message), str)
+
+    @pytest.mark.parametrize("frame", [b"\x01\x05ab", b"\x03\xff\xff\xff\xff", b"\x7f"])
+    def test_malformed_frame_raises(self, frame):
+        """不正なバイナリフレームでCodecErrorが送出されることのテスト"""
+        with pytest.raises(CodecError):
+            BINARY_CODEC.decode(frame)
+
+
+class TestNegotiateCodec:
+    """サブプロトコルネゴシエーションのテストクラス"""
+
+    def test_binary_is_preferred(self):
+        """バイナリが提示されればバイナリを選ぶことのテスト"""
+        assert negotiate_codec(["whiteboard.json", "whiteboard.bin.v1"]) == (BINARY_CODEC, "whiteboard.bin.v1")
+
+    def test_json_subprotocol_is_echoed(self):
+        """JSONのサブプロトコルが返されることのテスト"""
+        assert negotiate_codec(["whiteboard.json"]) == (JSON_CODEC, "whiteboard.json")
+
+    def test_no_subprotocol_defaults_to_json(self):
+        """指定なしの場合はJSONでサブプロトコルを返さないことのテスト"""
+        assert negotiate_codec([]) == (JSON_CODEC, None)
@@ -0,0 +1,270 @@
+"""
+ConnectionManagerのユニットテスト
+"""
+import asyncio
+import json
+
+import pytest
+
+from app.websocket.codec import BINARY_CODEC, JSON_CODEC, OutgoingMessage
+from app.websocket.connection_manager import ConnectionManager
+from app.websocket.outbound_queue import PRIORITY_STATE, OutboundQueue
+from tests.websocket.helpers import FakeWebSocket, close_queues, drain
+
+
+class TestConnectionManager:
+    """ConnectionManagerのテストクラス"""
+
+    @pytest.mark.asyncio
+    async def test_broadcast_excludes_sender(self, manager):
+        """送信者には配信されないことのテスト"""
+        sender = FakeWebSocket()
+        receiver = FakeWebSocket()
+        await manager.connect(sender, "wb1", "user-a")
+        await manager.connect(receiver, "wb1", "user-b")
+
+        await manager.broadcast_to_whiteboard("wb1", {"type": "cursor"}, exclude_user="user-a")
+        await drain(0.01)
+
+        assert {"type": "cursor"} in receiver.messages()
+        assert {"type": "cursor"} not in sender.messages()
+
+    @pytest.mark.asyncio
+    async def test_broadcast_is_concurrent(self, manager):
+        """送信が並行に行われ、合計時間が各送信時間の和にならないことのテスト"""
+        manager.send_timeout = 1.0
+        sockets = [FakeWebSocket() for _ in range(10)]
+        for i, ws in enumerate(sockets):
+            await manager.connect(ws, "wb1", f"user-{i}")
+        await drain(0.01)
+        for ws in sockets:
+            ws.delay = 0.05
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await manager.broadcast_to_whiteboard("wb1", {"type": "draw"})
+        elapsed = loop.time() - started
+        await drain(0.2)
+
+        assert elapsed < 0.05
+        assert all({"type": "draw", "seq": 1} in ws.messages() for ws in sockets)
+
+    @pytest.mark.asyncio
+    async def test_slow_connection_is_dropped(self, manager):
+        """タイムアウトした接続が切断されることのテスト"""
+        fast = FakeWebSocket()
+        slow = FakeWebSocket()
+        await manager.connect(fast, "wb1", "user-fast")
+        await manager.connect(slow, "wb1", "user-slow")
+        slow.delay = 1.0
+
+        await manager.broadcast_to_whiteboard("wb1", {"type": "draw"})
+        await drain(0.2)
+
+        assert manager.get_whiteboard_users("wb1") == ["user-fast"]
+        assert {"type": "draw", "seq": 1} in fast.messages()
+        assert slow.closed_code == 1013
+
+    @pytest.mark.asyncio
+    async def test_broken_connection_is_removed(self, manager):
+        """送信エラーの接続が削除されることのテスト"""
+        healthy = FakeWebSocket()
+        broken = FakeWebSocket()
+        await manager.connect(healthy, "wb1", "user-a")
+        await manager.connect(broken, "wb1", "user-b")
+        broken.fail = True
+
+        await manager.broadcast_to_whiteboard("wb1", {"type": "draw"})
+        await drain(0.05)
+
+        assert manager.get_whiteboard_users("wb1") == ["user-a"]
+        assert manager.get_user_whiteboards("user-b") == set()
+
+    @pytest.mark.asyncio
+    async def test_user_with_multiple_tabs(self, manager):
+        """同じユーザーの複数接続が1ユーザーとして管理されることのテスト"""
+        tab1 = FakeWebSocket()
+        tab2 = FakeWebSocket()
+        await manager.connect(tab1, "wb1", "user-a")
+        await manager.connect(tab2, "wb1", "user-a")
+
+        await manager.send_to_user("wb1", "user-a", {"type": "pong"})
+        await drain(0.01)
+
+        assert manager.get_whiteboard_users("wb1") == ["user-a"]
+        assert {"type": "pong"} in tab1.messages()
+        assert {"type": "pong"} in tab2.messages()
+
+        await manager.disconnect(tab1, "wb1", "user-a")
+        assert manager.get_user_whiteboards("user-a") == {"wb1"}
+        await manager.disconnect(tab2, "wb1", "user-a")
+        assert manager.get_user_whiteboards("user-a") == set()
+        assert "wb1" not in manager.rooms
+
+    @pytest.mark.asyncio
+    async def test_reconnect_replays_missed_operations(self, manager):
+        """再接続時に取りこぼした操作だけが再送されることのテスト"""
+        drawer = FakeWebSocket()
+        await manager.connect(drawer, "wb1", "user-a")
+        await manager.broadcast_to_whiteboard("wb1", {"type": "draw", "data": {"index": 0}})
+        op_log = manager.get_op_log("wb1")
+        await manager.broadcast_to_whiteboard("wb1", {"type": "draw", "data": {"index": 1}})
+        await manager.broadcast_to_whiteboard("wb1", {"type": "cursor", "data": {"x": 0, "y": 0}})
+
+        resumed = FakeWebSocket()
+        await manager.connect(resumed, "wb1", "user-b", last_seq=1, epoch=op_log.epoch)
+        stale = FakeWebSocket()
+        await manager.connect(stale, "wb1", "user-c", last_seq=1, epoch="other-worker")
+        await drain(0.01)
+
+        assert [m for m in resumed.messages() if m["type"] == "draw"] == [
+            {"type": "draw", "data": {"index": 1}, "seq": 2}
+        ]
+        assert stale.messages()[0]["type"] == "resync"
+
+    @pytest.mark.asyncio
+    async def test_idle_connection_is_evicted(self):
+        """ハートビートに応答しない接続だけが切断されることのテスト"""
+        manager = ConnectionManager(send_timeout=0.05, heartbeat_interval=0.08)
+        idle = FakeWebSocket()
+        active = FakeWebSocket()
+        await manager.connect(idle, "wb1", "user-idle")
+        active_connection = await manager.connect(active, "wb1", "user-active")
+
+        for _ in range(8):
+            await drain(0.05)
+            active_connection.messages_in += 1
+
+        assert idle.closed_code == 1001
+        assert "ping" in [m["type"] for m in idle.messages()]
+        assert manager.get_whiteboard_users("wb1") == ["user-active"]
+        assert active.closed_code is None
+        await close_queues(manager)
+
+    @pytest.mark.asyncio
+    async def test_broadcast_uses_each_connection_codec(self, manager):
+        """接続ごとのコーデックでエンコードされることのテスト"""
+        json_client = FakeWebSocket()
+        binary_client = FakeWebSocket()
+        await manager.connect(json_client, "wb1", "user-a")
+        await manager.connect(
+            binary_client, "wb1", "user-b", codec=BINARY_CODEC, subprotocol=BINARY_CODEC.subprotocol
+        )
+        await drain(0.01)
+
+        cursor = {"type": "cursor", "data": {"x": 1.5, "y": 2.5}, "userId": "user-c", "timestamp": ""}
+        await manager.broadcast_to_whiteboard("wb1", cursor)
+        await drain(0.01)
+
+        assert binary_client.subprotocol == "whiteboard.bin.v1"
+        assert json.loads(json_client.sent[-1]) == cursor
+        assert isinstance(binary_client.sent[-1], bytes)
+        assert BINARY_CODEC.decode(binary_client.sent[-1]) == cursor
+
+
+class TestOutboundQueue:
+    """OutboundQueueのテストクラス"""
+
+    def test_overflow_drops_stale_cursor_first(self):
+        """キュー溢れ時に古いカーソルから破棄されることのテスト"""
+        queue = OutboundQueue(FakeWebSocket(), max_size=3, send_timeout=1.0)
+        queue.put("draw", "draw-1")
+        queue.put("cursor", "cursor-1")
+        queue.put("draw", "draw-2")
+
+        assert queue.put("draw", "draw-3") is True
+        assert [text for _, text, _ in queue._queues[PRIORITY_STATE]] == ["draw-1", "draw-2", "draw-3"]
+        assert queue.dropped == 1
+
+    def test_overflow_drops_new_droppable_frame(self):
+        """破棄可能なフレームがない場合に新しいカーソルが捨てられることのテスト"""
+        queue = OutboundQueue(FakeWebSocket(), max_size=2, send_timeout=1.0)
+        queue.put("draw", "draw-1")
+        queue.put("erase", "erase-1")
+
+        assert queue.put("cursor", "cursor-1") is True
+        assert len(queue) == 2
+        assert queue.dropped == 1
+
+    def test_overflow_disconnects_with_reconnect_hint(self):
+        """状態変更フレームで溢れた場合に再接続指示付きで切断されることのテスト"""
+        queue = OutboundQueue(FakeWebSocket(), max_size=2, send_timeout=1.0)
+        queue.put("draw", "draw-1")
+        queue.put("draw", "draw-2")
+
+        assert queue.put("draw", "draw-3") is False
+        assert queue.is_closing
+        assert len(queue) == 1
+        assert json.loads(queue._queues[PRIORITY_STATE][0][1])["type"] == "reconnect"
+
+    def test_disconnect_policy(self):
+        """disconnectポリシーではカーソルも破棄せず切断されることのテスト"""
+        queue = OutboundQueue(FakeWebSocket(), max_size=1, send_timeout=1.0, overflow_policy="disconnect")
+        queue.put("cursor", "cursor-1")
+
+        assert queue.put("cursor", "cursor-2") is False
+        assert queue.is_closing
+
+    @pytest.mark.asyncio
+    async def test_state_changes_are_sent_before_cosmetic_frames(self):
+        """盤面の変更が描画プレビュー・カーソルより先に送られ、溜まったカーソルは古いものから捨てられることのテスト"""
+        ws = FakeWebSocket()
+        queue = OutboundQueue(ws, max_size=16, send_timeout=1.0, cursor_queue_size=2)
+        for i in range(3):
+            queue.put("cursors", f"cursors-{i}")
+        queue.put("drawing_event", "preview-1")
+        queue.put("draw", "draw-1")
+        queue.put("erase", "erase-1")
+
+        queue.start()
+        await drain(0.01)
+
+        assert ws.sent == ["draw-1", "erase-1", "preview-1", "cursors-1", "cursors-2"]
+        assert queue.dropped == 1
+        queue.close()
+
+    @pytest.mark.asyncio
+    async def test_leave_and_commit_are_not_overtaken_by_sender_frames(self):
+        """退室・確定した操作より前に積んだ同じ送信者のカーソル・プレビューが後から届かないことのテスト"""
+        ws = FakeWebSocket()
+        queue = OutboundQueue(ws, max_size=16, send_timeout=1.0)
+
+        def put(message: dict):
+            outgoing = OutgoingMessage(message)
+            queue.put(outgoing.type, outgoing.encode(JSON_CODEC), outgoing)
+
+        put({"type": "cursor", "data": {"x": 1, "y": 1}, "senderId": "user-a"})
+        put({"type": "cursor", "data": {"x": 2, "y": 2}, "senderId": "user-b"})
+        put({"type": "cursors", "data": {"cursors": [{"userId": "user-a", "x": 3, "y": 3}]}})
+        put({"type": "drawing_event", "data": {"i": 1}, "senderId": "user-b"})
+        put({"type": "drawing_event", "data": {"i": 2}, "senderId": "user-c"})
+        put({"type": "user_leave", "data": {"userId": "user-a"}, "userId": "user-a"})
+        put({"type": "draw", "data": {"element": {"id": "el-1"}}, "senderId": "user-b"})
+
+        queue.start()
+        await drain(0.01)
+
+        sent = [(m["type"], m.get("senderId") or m.get("userId")) for m in ws.messages()]
+        assert sent == [
+            ("draw", "user-b"), ("drawing_event", "user-c"), ("user_leave", "user-a"),
+        ]
+        assert queue.dropped == 4
+        queue.close()
+
+    @pytest.mark.asyncio
+    async def test_slow_consumer_is_closed_and_removed(self):
+        """溢れた接続がクローズされ、ルームから削除されることのテスト"""
+        manager = ConnectionManager(send_timeout=1.0, queue_size=2)
+        stuck = FakeWebSocket()
+        await manager.connect(stuck, "wb1", "user-stuck")
+        await drain(0.01)
+        stuck.delay = 0.1
+
+        for i in range(5):
+            await manager.broadcast_to_whiteboard("wb1", {"type": "draw", "data": {"i": i}})
+        await drain(0.5)
+
+        assert stuck.closed_code == 1013
+        assert stuck.messages()[-1]["type"] == "reconnect"
+        assert manager.get_whiteboard_users("wb1") == []
+        await close_queues(manager)
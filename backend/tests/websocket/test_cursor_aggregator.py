@@ -0,0 +1,72 @@
+"""
+CursorAggregatorのユニットテスト
+"""
+import asyncio
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from app.websocket.cursor_aggregator import CursorAggregator
+
+
+class TestCursorAggregator:
+    """CursorAggregatorのテストクラス"""
+
+    @pytest.fixture
+    def mock_manager(self):
+        """モック接続マネージャー"""
+        manager = Mock()
+        manager.broadcast_to_whiteboard = AsyncMock()
+        manager.has_viewports = Mock(return_value=False)
+        return manager
+
+    @pytest.mark.asyncio
+    async def test_keeps_only_latest_position_per_user(self, mock_manager):
+        """1tick内の更新がユーザーごとの最新位置1件にまとまることのテスト"""
+        aggregator = CursorAggregator(mock_manager, flush_hz=50)
+
+        for x in range(10):
+            aggregator.update("wb1", "user-a", {"x": x, "y": 0})
+        aggregator.update("wb1", "user-b", {"x": 5, "y": 5})
+        await asyncio.sleep(0.05)
+
+        mock_manager.broadcast_to_whiteboard.assert_awaited_once()
+        whiteboard_id, frame = mock_manager.broadcast_to_whiteboard.await_args.args
+        assert whiteboard_id == "wb1"
+        assert frame["type"] == "cursors"
+        assert frame["data"]["cursors"] == [
+            {"x": 9, "y": 0, "userId": "user-a"},
+            {"x": 5, "y": 5, "userId": "user-b"},
+        ]
+
+    @pytest.mark.asyncio
+    async def test_rooms_flush_independently(self, mock_manager):
+        """ルームごとに別のフレームとして配信されることのテスト"""
+        aggregator = CursorAggregator(mock_manager, flush_hz=50)
+
+        aggregator.update("wb1", "user-a", {"x": 1, "y": 1})
+        aggregator.update("wb2", "user-b", {"x": 2, "y": 2})
+        await asyncio.sleep(0.05)
+
+        rooms = {call.args[0] for call in mock_manager.broadcast_to_whiteboard.await_args_list}
+        assert rooms == {"wb1", "wb2"}
+
+    @pytest.mark.asyncio
+    async def test_idle_room_does_not_flush(self, mock_manager):
+        """更新がなければ配信されないことのテスト"""
+        aggregator = CursorAggregator(mock_manager, flush_hz=50)
+
+        aggregator.update("wb1", "user-a", {"x": 1, "y": 1})
+        aggregator.discard_user("wb1", "user-a")
+        await asyncio.sleep(0.05)
+
+        mock_manager.broadcast_to_whiteboard.assert_not_awaited()
+
+    def test_sender_cannot_spoof_user_id(self, mock_manager):
+        """userIdはサーバー側の値で上書きされることのテスト"""
+        aggregator = CursorAggregator(mock_manager, flush_hz=50)
+        aggregator._flush_tasks["wb1"] = Mock()
+
+        aggregator.update("wb1", "user-a", {"x": 1, "y": 1, "userId": "user-z"})
+
+        assert aggregator._pending["wb1"]["user-a"]["userId"] == "user-a"
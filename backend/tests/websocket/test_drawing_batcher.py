@@ -0,0 +1,69 @@
+"""
+DrawingEventBatcherのユニットテスト
+"""
+import asyncio
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from app.websocket.codec import OutgoingMessage
+from app.websocket.drawing_batcher import MAX_BATCH_EVENTS, DrawingEventBatcher
+
+
+def drawing_event(user_id: str, index: int) -> OutgoingMessage:
+    """テスト用の描画イベント"""
+    return OutgoingMessage({"type": "drawing_event", "data": {"index": index}, "userId": user_id, "timestamp": ""})
+
+
+class TestDrawingEventBatcher:
+    """DrawingEventBatcherのテストクラス"""
+
+    @pytest.fixture
+    def mock_manager(self):
+        """モック接続マネージャー"""
+        manager = Mock()
+        manager.broadcast_to_whiteboard = AsyncMock()
+        manager.has_viewports = Mock(return_value=False)
+        manager.send_to_user = AsyncMock()
+        return manager
+
+    @pytest.mark.asyncio
+    async def test_events_are_sent_as_one_frame_in_order(self, mock_manager):
+        """バッチ期間内のイベントが受信順に1フレームで配信されることのテスト"""
+        batcher = DrawingEventBatcher(mock_manager, window_ms=10)
+
+        for i in range(5):
+            await batcher.add("wb1", "user-a", drawing_event("user-a", i))
+        await asyncio.sleep(0.03)
+
+        mock_manager.broadcast_to_whiteboard.assert_awaited_once()
+        args, kwargs = mock_manager.broadcast_to_whiteboard.await_args
+        assert args[1].type == "drawing_events"
+        assert [e["data"]["index"] for e in args[1].message["data"]["events"]] == [0, 1, 2, 3, 4]
+        assert kwargs["exclude_users"] == {"user-a"}
+        mock_manager.send_to_user.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_senders_receive_only_other_users_events(self, mock_manager):
+        """送信者には自分以外のイベントのみが送られることのテスト"""
+        batcher = DrawingEventBatcher(mock_manager, window_ms=10)
+
+        await batcher.add("wb1", "user-a", drawing_event("user-a", 0))
+        await batcher.add("wb1", "user-b", drawing_event("user-b", 1))
+        await batcher.add("wb1", "user-a", drawing_event("user-a", 2))
+        await asyncio.sleep(0.03)
+
+        frames = {call.args[1]: call.args[2].message for call in mock_manager.send_to_user.await_args_list}
+        assert [e["data"]["index"] for e in frames["user-a"]["data"]["events"]] == [1]
+        assert [e["data"]["index"] for e in frames["user-b"]["data"]["events"]] == [0, 2]
+
+    @pytest.mark.asyncio
+    async def test_full_batch_is_flushed_immediately(self, mock_manager):
+        """上限に達したバッチが待たずに配信されることのテスト"""
+        batcher = DrawingEventBatcher(mock_manager, window_ms=1000)
+
+        for i in range(MAX_BATCH_EVENTS):
+            await batcher.add("wb1", "user-a", drawing_event("user-a", i))
+
+        mock_manager.broadcast_to_whiteboard.assert_awaited_once()
+        assert batcher._flush_tasks == {}
@@ -0,0 +1,141 @@
+"""
+ElementPersisterのユニットテスト
+"""
+import asyncio
+import threading
+from uuid import UUID, uuid4
+
+import pytest
+
+from app.models.whiteboard import DrawingType
+from app.websocket.element_persister import ElementPersister, element_to_columns, element_uuid
+
+
+BOARD_ID = str(uuid4())
+USER_ID = str(uuid4())
+
+
+def draw(element_id: str, x: float = 10) -> dict:
+    """テスト用の描画メッセージ"""
+    return {
+        "type": "draw",
+        "data": {"element": {"id": element_id, "type": "pen", "x": x, "y": 20, "color": "#ff0000"}},
+        "userId": USER_ID,
+        "timestamp": ""
+    }
+
+
+def erase(element_id: str) -> dict:
+    """テスト用の消去メッセージ"""
+    return {"type": "erase", "data": {"elementId": element_id}, "userId": USER_ID, "timestamp": ""}
+
+
+class RecordingPersister(ElementPersister):
+    """DBの代わりに書き込み内容を記録する永続化"""
+
+    def __init__(self, *args, fail_times: int = 0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fail_times = fail_times
+        self.writes = []
+        self.threads = set()
+
+    def _write(self, board_id, pending):
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            raise RuntimeError("database unavailable")
+        self.threads.add(threading.current_thread().name)
+        self.writes.append((board_id, pending.clear, dict(pending.ops)))
+
+
+class TestElementPersister:
+    """ElementPersisterのテストクラス"""
+
+    @pytest.mark.asyncio
+    async def test_changes_are_coalesced_per_element(self):
+        """同じ要素への操作が最新の1件にまとめられることのテスト"""
+        persister = RecordingPersister(flush_interval_ms=10, batch_size=100)
+
+        persister.add_message(BOARD_ID, USER_ID, draw("element_a", x=1))
+        persister.add_message(BOARD_ID, USER_ID, draw("element_a", x=2))
+        persister.add_message(BOARD_ID, USER_ID, draw("element_b"))
+        persister.add_message(BOARD_ID, USER_ID, erase("element_b"))
+        await asyncio.sleep(0.05)
+
+        assert len(persister.writes) == 1
+        board_id, clear, ops = persister.writes[0]
+        assert board_id == UUID(BOARD_ID) and not clear
+        kind, values = ops[element_uuid(board_id, "element_a")]
+        assert kind == "upsert" and values["x"] == 2
+        assert ops[element_uuid(board_id, "element_b")] == ("delete", None)
+        # DB用スレッドプールで書き込まれる
+        assert all(name.startswith("ws-db") for name in persister.threads)
+
+    @pytest.mark.asyncio
+    async def test_full_batch_is_flushed_without_waiting(self):
+        """件数に達したら待ち時間を待たずに反映されることのテスト"""
+        persister = RecordingPersister(flush_interval_ms=10_000, batch_size=3)
+
+        for i in range(3):
+            persister.add_message(BOARD_ID, USER_ID, draw(f"element_{i}"))
+        await asyncio.sleep(0.01)
+
+        assert len(persister.writes) == 1
+        assert len(persister.writes[0][2]) == 3
+        assert persister._flush_tasks == {}
+
+    @pytest.mark.asyncio
+    async def test_clear_discards_earlier_changes(self):
+        """クリアでそれ以前の操作が破棄されることのテスト"""
+        persister = RecordingPersister(flush_interval_ms=10_000, batch_size=100)
+
+        persister.add_message(BOARD_ID, USER_ID, draw("element_a"))
+        persister.add_message(BOARD_ID, USER_ID, {"type": "erase", "data": {"action": "clear"}})
+        persister.add_message(BOARD_ID, USER_ID, draw("element_b"))
+        await persister.flush_all()
+
+        _, clear, ops = persister.writes[0]
+        assert clear
+        assert list(ops) == [element_uuid(UUID(BOARD_ID), "element_b")]
+
+    @pytest.mark.asyncio
+    async def test_failed_flush_is_retried(self):
+        """書き込みに失敗した操作が再試行されることのテスト"""
+        persister = RecordingPersister(flush_interval_ms=10, batch_size=100, fail_times=1)
+
+        persister.add_message(BOARD_ID, USER_ID, draw("element_a"))
+        await asyncio.sleep(0.05)
+
+        assert len(persister.writes) == 1
+        assert element_uuid(UUID(BOARD_ID), "element_a") in persister.writes[0][2]
+
+    def test_element_to_columns(self):
+        """クライアントの要素がカラム値に変換されることのテスト"""
+        values = element_to_columns({
+            "id": "element_1", "type": "text", "x": 1, "y": 2, "color": "#000000",
+            "fill": "transparent", "text": "hello", "fontSize": 16, "strokeWidth": 2
+        })
+
+        assert values["type"] == DrawingType.TEXT
+        assert values["text_content"] == "hello"
+        assert values["font_size"] == 16.0
+        assert values["stroke_width"] == 2.0
+        assert values["fill_color"] is None
+        assert element_to_columns({"type": "eraser", "x": 1, "y": 2}) is None
+
+    def test_non_finite_coordinates_are_rejected(self):
+        """NaN・Infinity の座標が保存されないことのテスト"""
+        assert element_to_columns({"type": "pen", "x": float("nan"), "y": 2}) is None
+        values = element_to_columns({
+            "type": "pen", "x": 1, "y": 2,
+            "points": [{"x": 1, "y": 2}, {"x": float("inf"), "y": 3}, {"x": True, "y": 4}]
+        })
+        assert values["points"] == [{"x": 1.0, "y": 2.0}]
+
+    def test_element_uuid(self):
+        """クライアント生成IDが決定的なUUIDになることのテスト"""
+        board_id = UUID(BOARD_ID)
+        element_id = uuid4()
+
+        assert element_uuid(board_id, str(element_id)) == element_id
+        assert element_uuid(board_id, "element_1") == element_uuid(board_id, "element_1")
+        assert element_uuid(board_id, "element_1") != element_uuid(uuid4(), "element_1")
@@ -0,0 +1,75 @@
+"""
+Server-Sent Events による配信のユニットテスト
+"""
+import asyncio
+
+import pytest
+
+from app.websocket.codec import OutgoingMessage
+from app.websocket.event_stream import EventStreamSocket, parse_last_event_id
+from tests.websocket.helpers import FakeWebSocket, drain
+
+
+async def next_events(events, timeout: float = 0.5) -> str:
+    """ストリームから次の書き込みを取り出す"""
+    return await asyncio.wait_for(events.__anext__(), timeout)
+
+
+class TestEventStream:
+    """SSEストリームのテストクラス"""
+
+    def test_parse_last_event_id(self):
+        """Last-Event-ID から epoch と seq を取り出すことのテスト"""
+        assert parse_last_event_id("abc:12") == ("abc", 12)
+        assert parse_last_event_id("abc") == (None, None)
+        assert parse_last_event_id(None) == (None, None)
+
+    @pytest.mark.asyncio
+    async def test_stream_receives_room_broadcasts_and_resumes(self, manager):
+        """ルームの配信がまとめて書き込まれ、Last-Event-ID から取りこぼした操作だけが再送されることのテスト"""
+        op_log = manager.get_op_log("wb-sse")
+        stream = EventStreamSocket(lambda: op_log.epoch)
+        await manager.connect(FakeWebSocket(), "wb-sse", "presenter")
+        await manager.connect(stream, "wb-sse", "follower", viewer=True, heartbeat=False)
+        events = stream.events(interval=0.01, keepalive=1.0)
+
+        for i in range(2):
+            await manager.broadcast_to_whiteboard("wb-sse", {"type": "draw", "data": {"i": i}})
+        await drain(0.01)
+        batch = await next_events(events)
+
+        assert f"id: {op_log.epoch}:1\n" in batch and f"id: {op_log.epoch}:2\n" in batch
+        assert batch.count("data: ") == 2
+        await manager.disconnect(stream, "wb-sse", "follower")
+        await events.aclose()
+
+        # 切断中の操作だけが再送される
+        await manager.broadcast_to_whiteboard("wb-sse", {"type": "erase", "data": {"i": 2}})
+        resumed = EventStreamSocket(lambda: op_log.epoch)
+        epoch, last_seq = parse_last_event_id(f"{op_log.epoch}:2")
+        await manager.connect(
+            resumed, "wb-sse", "follower", last_seq=last_seq, epoch=epoch, viewer=True, heartbeat=False
+        )
+        batch = await next_events(resumed.events(interval=0.01, keepalive=1.0))
+
+        assert batch.startswith(f"id: {op_log.epoch}:3\n")
+        assert '"erase"' in batch
+
+    @pytest.mark.asyncio
+    async def test_event_id_does_not_decode_relayed_text(self, manager):
+        """中継したJSONテキストはデコードせずに、配信時の seq からイベントIDを付けることのテスト"""
+        op_log = manager.get_op_log("wb-sse")
+        streams = [EventStreamSocket(lambda: op_log.epoch) for _ in range(3)]
+        for i, stream in enumerate(streams):
+            await manager.connect(stream, "wb-sse", f"follower-{i}", viewer=True, heartbeat=False)
+
+        await manager.broadcast_to_whiteboard(
+            "wb-sse", OutgoingMessage(message_type="draw", text='{"type":"draw","data":{}}')
+        )
+        await drain(0.01)
+
+        for stream in streams:
+            batch = await next_events(stream.events(interval=0.01, keepalive=1.0))
+            assert batch.startswith(f"id: {op_log.epoch}:1\n")
+        (sequenced,) = op_log.since(0, "")
+        assert sequenced.seq == 1 and sequenced._message is None
@@ -0,0 +1,68 @@
+"""
+HandshakeAuthorizerのユニットテスト
+"""
+from datetime import timedelta
+from uuid import uuid4
+
+import pytest
+
+from app.core.security import create_access_token
+from app.websocket.handshake_auth import HandshakeAuthorizer
+
+
+BOARD_ID = str(uuid4())
+USER_ID = str(uuid4())
+
+
+class CountingAuthorizer(HandshakeAuthorizer):
+    """DBの代わりに固定の権限を返し、問い合わせ回数を数える権限チェック"""
+
+    def __init__(self, permissions, **kwargs):
+        super().__init__(**kwargs)
+        self.permissions = permissions
+        self.queries = 0
+
+    def resolve_permission(self, whiteboard_id, user_id):
+        self.queries += 1
+        return self.permissions.get((whiteboard_id, user_id))
+
+
+class TestHandshakeAuthorizer:
+    """HandshakeAuthorizerのテストクラス"""
+
+    @pytest.mark.asyncio
+    async def test_permission_is_cached(self):
+        """再接続時にDBへ問い合わせずに権限が解決されることのテスト"""
+        auth = CountingAuthorizer({(BOARD_ID, USER_ID): "edit"}, ttl_seconds=60, max_entries=100)
+        token = create_access_token(USER_ID)
+
+        for _ in range(5):
+            assert await auth.authorize(BOARD_ID, token, USER_ID) == (USER_ID, "edit")
+
+        assert auth.queries == 1
+
+    @pytest.mark.asyncio
+    async def test_invalid_token_is_rejected(self):
+        """無効・期限切れ・別ユーザーのトークンが拒否されることのテスト"""
+        auth = CountingAuthorizer({(BOARD_ID, USER_ID): "owner"}, ttl_seconds=60, max_entries=100)
+        expired = create_access_token(USER_ID, expires_delta=timedelta(minutes=-1))
+
+        assert await auth.authorize(BOARD_ID, None) is None
+        assert await auth.authorize(BOARD_ID, "not-a-jwt") is None
+        assert await auth.authorize(BOARD_ID, expired) is None
+        assert await auth.authorize(BOARD_ID, create_access_token(USER_ID), str(uuid4())) is None
+        assert auth.queries == 0
+
+    @pytest.mark.asyncio
+    async def test_invalidate_reflects_permission_change(self):
+        """権限なしのキャッシュが共有時の破棄で解消されることのテスト"""
+        auth = CountingAuthorizer({}, ttl_seconds=60, max_entries=100)
+        token = create_access_token(USER_ID)
+
+        assert await auth.authorize(BOARD_ID, token) is None
+        auth.permissions[(BOARD_ID, USER_ID)] = "view"
+        assert await auth.authorize(BOARD_ID, token) is None
+
+        auth.invalidate(BOARD_ID, USER_ID)
+        assert await auth.authorize(BOARD_ID, token) == (USER_ID, "view")
+        assert auth.queries == 2
@@ -0,0 +1,74 @@
+"""
+表示範囲による配信先の絞り込みのユニットテスト
+"""
+import asyncio
+
+import pytest
+
+from app.websocket.cursor_aggregator import CursorAggregator
+from app.websocket.interest import intersects, message_bounds, parse_viewport
+from tests.websocket.helpers import FakeWebSocket, drain
+
+
+class TestInterest:
+    """表示範囲による絞り込みのテストクラス"""
+
+    def test_bounds_and_intersection(self):
+        """表示範囲・メッセージの外接矩形の取得と重なり判定のテスト"""
+        viewport = parse_viewport({"x": 0, "y": 0, "width": 100, "height": 50})
+        stroke = {"type": "stroke_append", "data": {"strokeId": "s1", "x": 200, "y": 10, "d": [-20, 5, -30, -10]}}
+
+        assert viewport == (0, 0, 100, 50)
+        assert parse_viewport(None) is None
+        assert parse_viewport({"x": 0, "y": 0, "width": -1, "height": 1}) is None
+        assert message_bounds(stroke) == (150, 5, 200, 15)
+        assert message_bounds({"type": "draw", "data": {}}) is None
+        assert not intersects(viewport, (150, 5, 200, 15), margin=0)
+        assert intersects(viewport, (150, 5, 200, 15), margin=50)
+
+    @pytest.mark.asyncio
+    async def test_broadcast_skips_members_outside_viewport(self, manager):
+        """表示範囲外のメンバーには送らず、範囲未登録のメンバーには送ることのテスト"""
+        manager.viewport_margin = 0
+        near, far, unset = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        for ws, user_id in [(near, "near"), (far, "far"), (unset, "unset")]:
+            await manager.connect(ws, "wb-interest", user_id)
+        manager.set_viewport(manager.get_connection(near), (0, 0, 100, 100))
+        manager.set_viewport(manager.get_connection(far), (1000, 1000, 1100, 1100))
+
+        await manager.broadcast_to_whiteboard(
+            "wb-interest", {"type": "cursor", "data": {"x": 50, "y": 50}}, bounds=(50, 50, 50, 50)
+        )
+        await drain(0.01)
+
+        def cursors(ws):
+            return [m for m in ws.messages() if m["type"] == "cursor"]
+
+        assert len(cursors(near)) == 1 and len(cursors(unset)) == 1
+        assert cursors(far) == []
+        await manager.disconnect(near, "wb-interest", "near")
+        await manager.disconnect(far, "wb-interest", "far")
+        assert not manager.has_viewports("wb-interest")
+
+    @pytest.mark.asyncio
+    async def test_cursor_frames_are_filtered_per_viewport(self, manager):
+        """集約したカーソルが接続ごとに表示範囲内のものだけ配信されることのテスト"""
+        manager.viewport_margin = 0
+        left, right = FakeWebSocket(), FakeWebSocket()
+        await manager.connect(left, "wb-cursors", "left")
+        await manager.connect(right, "wb-cursors", "right")
+        manager.set_viewport(manager.get_connection(left), (0, 0, 100, 100))
+        manager.set_viewport(manager.get_connection(right), (500, 0, 600, 100))
+        aggregator = CursorAggregator(manager, flush_hz=100)
+
+        aggregator.update("wb-cursors", "left", {"x": 10, "y": 10})
+        aggregator.update("wb-cursors", "right", {"x": 550, "y": 10})
+        await asyncio.sleep(0.03)
+        await drain(0.01)
+
+        def cursor_users(ws):
+            frames = [m for m in ws.messages() if m["type"] == "cursors"]
+            return [c["userId"] for frame in frames for c in frame["data"]["cursors"]]
+
+        assert cursor_users(left) == ["left"]
+        assert cursor_users(right) == ["right"]
@@ -0,0 +1,46 @@
+"""
+MessageHandlerのユニットテスト
+"""
+from uuid import uuid4
+import json
+
+import pytest
+
+from app.websocket.element_persister import ElementPersister
+from tests.websocket.helpers import DRAW, FakeWebSocket, begin_data, chunks, drain
+
+
+class TestEditPermission:
+    """閲覧のみの権限の接続から要素を変更できないことのテストクラス"""
+
+    @pytest.mark.asyncio
+    async def test_view_only_member_cannot_change_elements(self, manager, handler):
+        """閲覧のみの権限のメンバーの draw・分割した draw・ストロークが配信も保存もされないことのテスト"""
+        persister = ElementPersister(60_000, 1000)
+        handler.element_persister = persister
+        whiteboard_id = str(uuid4())
+        member, peer = FakeWebSocket(), FakeWebSocket()
+        # 閲覧専用接続として登録されていないメンバーでも権限で拒否する
+        await manager.connect(member, whiteboard_id, "user-a", permission="view")
+        await manager.connect(peer, whiteboard_id, "user-b", permission="edit")
+        conn = manager.get_connection(member)
+
+        await handler.handle_message(DRAW, whiteboard_id, "user-a", member)
+        assert await handler.relay_text(json.dumps(DRAW), whiteboard_id, "user-a", conn)
+        for chunk in chunks(DRAW, 16):
+            assert await handler.relay_text(json.dumps(chunk), whiteboard_id, "user-a", conn)
+        await handler.handle_message({"type": "stroke_begin", "data": begin_data()}, whiteboard_id, "user-a", member)
+        await handler.handle_message({"type": "stroke_end", "data": {"strokeId": "s1"}}, whiteboard_id, "user-a", member)
+        # 権限の確認を通らずに組み立て途中になったストロークも切断時に確定しない
+        handler.stroke_assembler.begin(conn, begin_data("s2"))
+        await handler.end_strokes(conn)
+        await drain(0.01)
+
+        assert not persister._pending
+        assert peer.messages() == []
+        assert manager.get_op_log(whiteboard_id).seq == 0
+
+        # 編集権限のあるメンバーの draw は保存される
+        await handler.handle_message(DRAW, whiteboard_id, "user-b", peer)
+        assert len(persister._pending) == 1
+        await persister.discard(whiteboard_id)
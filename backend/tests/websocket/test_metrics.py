@@ -0,0 +1,52 @@
+"""
+WebSocketメトリクスのユニットテスト
+"""
+import pytest
+from fastapi import HTTPException
+
+from app.core.dependencies import get_current_admin_user
+from app.models.user import User, UserRole
+from app.websocket.metrics import Histogram, metrics
+from tests.websocket.helpers import FakeWebSocket, drain
+
+
+class TestMetrics:
+    """メトリクスのテストクラス"""
+
+    def test_histogram_quantiles(self):
+        """ヒストグラムの分位点がバケット上限で返されることのテスト"""
+        histogram = Histogram((0.001, 0.01, 0.1))
+        for value in [0.0005] * 98 + [0.05, 5.0]:
+            histogram.observe(value)
+
+        assert histogram.counts == [98, 0, 1, 1]
+        assert histogram.quantile(0.5) == 0.001
+        assert histogram.quantile(0.99) == 0.1
+
+    @pytest.mark.asyncio
+    async def test_broadcast_is_recorded(self, manager):
+        """配信・接続の増減・ルーム人数が記録されることのテスト"""
+        before = metrics.snapshot({}, [])
+        sockets = [FakeWebSocket() for _ in range(3)]
+        for i, ws in enumerate(sockets):
+            await manager.connect(ws, "wb-metrics", f"user-{i}")
+
+        await manager.broadcast_to_whiteboard("wb-metrics", {"type": "draw"}, exclude_user="user-0")
+        await drain(0.01)
+        await manager.disconnect(sockets[0], "wb-metrics", "user-0")
+        after = metrics.snapshot(manager.rooms, list(manager.connections.values()))
+
+        assert after["outbound"]["messages"]["draw"] - before["outbound"]["messages"].get("draw", 0) == 2
+        assert after["connections"]["opened"] - before["connections"]["opened"] == 3
+        assert after["connections"]["closed"] - before["connections"]["closed"] == 1
+        assert after["fanout_seconds"]["count"] > before["fanout_seconds"]["count"]
+        assert after["rooms"]["members"]["wb-metrics"] == 2
+
+    def test_metrics_require_admin(self):
+        """ボードIDを含むメトリクスは管理者しか取得できないことのテスト"""
+        admin = User(email="admin@example.com", name="Admin", role=UserRole.ADMIN)
+
+        with pytest.raises(HTTPException) as error:
+            get_current_admin_user(User(email="user@example.com", name="User", role=UserRole.USER))
+        assert error.value.status_code == 403
+        assert get_current_admin_user(admin) is admin
@@ -0,0 +1,54 @@
+"""
+RoomOpLogのユニットテスト
+"""
+import json
+
+from app.websocket.codec import JSON_CODEC, OutgoingMessage
+from app.websocket.op_log import RoomOpLog
+
+
+def draw(index: int) -> OutgoingMessage:
+    """テスト用の描画メッセージ（中継時と同じくJSONテキストから作成）"""
+    return OutgoingMessage(message_type="draw", text=json.dumps({"type": "draw", "data": {"index": index}}))
+
+
+class TestRoomOpLog:
+    """RoomOpLogのテストクラス"""
+
+    def test_append_stamps_increasing_seq(self):
+        """追加した操作に連番の seq が付くことのテスト"""
+        op_log = RoomOpLog(max_size=10)
+
+        first = op_log.append(draw(0), frozenset())
+        second = op_log.append(draw(1), frozenset())
+
+        assert json.loads(first.encode(JSON_CODEC)) == {"type": "draw", "data": {"index": 0}, "seq": 1}
+        assert second.message["seq"] == 2
+        assert op_log.seq == 2
+
+    def test_since_returns_only_the_gap(self):
+        """最後に受信した seq より後の操作だけが返ることのテスト"""
+        op_log = RoomOpLog(max_size=10)
+        for i in range(5):
+            op_log.append(draw(i), frozenset())
+
+        assert [m.message["seq"] for m in op_log.since(3, "user-a")] == [4, 5]
+        assert op_log.since(5, "user-a") == []
+
+    def test_since_skips_operations_excluded_for_user(self):
+        """ユーザー自身が送った操作は再送しないことのテスト"""
+        op_log = RoomOpLog(max_size=10)
+        op_log.append(draw(0), frozenset({"user-a"}))
+        op_log.append(draw(1), frozenset({"user-b"}))
+
+        assert [m.message["seq"] for m in op_log.since(0, "user-a")] == [2]
+
+    def test_since_requires_resync_when_gap_is_evicted(self):
+        """ログから溢れた差分は全体の再同期が必要になることのテスト"""
+        op_log = RoomOpLog(max_size=3)
+        for i in range(5):
+            op_log.append(draw(i), frozenset())
+
+        assert op_log.since(1, "user-a") is None
+        assert [m.message["seq"] for m in op_log.since(2, "user-a")] == [3, 4, 5]
+        assert op_log.since(6, "user-a") is None
@@ -0,0 +1,40 @@
+"""
+RateLimiterのユニットテスト
+"""
+from app.websocket.rate_limiter import RateLimiter, TokenBucket
+from tests.websocket.helpers import connection
+
+
+class TestRateLimiter:
+    """RateLimiterのテストクラス"""
+
+    def test_bucket_refills_over_time(self):
+        """トークンが時間経過で補充されることのテスト"""
+        bucket = TokenBucket(rate=10, capacity=2, now=0.0)
+
+        assert bucket.take(0.0) and bucket.take(0.0)
+        assert not bucket.take(0.0)
+        assert bucket.take(0.1)
+
+    def test_connection_budget_is_per_message_type(self):
+        """接続ごとの上限がメッセージタイプ別に適用されることのテスト"""
+        limiter = RateLimiter({"cursor": 1, "draw": 1}, {}, burst_seconds=3)
+        conn = connection("user-a")
+
+        assert [limiter.allow(conn, "cursor") for _ in range(4)] == [True, True, True, False]
+        assert limiter.allow(conn, "draw")
+        assert limiter.allow(conn, "ping")
+        assert limiter.dropped_by_connection["cursor"] == 1
+        assert conn.messages_dropped == 1
+
+    def test_room_budget_is_shared(self):
+        """ルームの上限が参加者全体で共有されることのテスト"""
+        limiter = RateLimiter({"cursor": 10}, {"cursor": 1}, burst_seconds=2)
+        a, b, other = connection("user-a"), connection("user-b"), connection("user-c", "wb2")
+
+        assert limiter.allow(a, "cursor") and limiter.allow(b, "cursor")
+        assert not limiter.allow(a, "cursor")
+        assert limiter.allow(other, "cursor")
+        assert limiter.dropped_by_room["cursor"] == 1
+        # ルームで破棄した分は接続のトークンを消費しない
+        assert a.rate_buckets["cursor"].tokens >= 19
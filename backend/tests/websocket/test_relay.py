@@ -0,0 +1,122 @@
+"""
+中継高速パスのユニットテスト
+"""
+import json
+
+import pytest
+
+from app.websocket.codec import BINARY_CODEC, JSON_CODEC, OutgoingMessage
+from app.websocket.relay import decode_relayed, peek_message_type, stamp_envelope
+from tests.websocket.helpers import FakeWebSocket, drain
+
+
+class TestRelay:
+    """中継高速パスのテストクラス"""
+
+    @pytest.mark.parametrize(
+        "text, expected",
+        [
+            ('{"type":"draw","data":{}}', "draw"),
+            ('  { "type" : "cursor", "data": {"x": 1}}', "cursor"),
+            ('{"data":{},"type":"draw"}', None),
+            ("not json", None),
+        ],
+    )
+    def test_peek_message_type(self, text, expected):
+        """先頭のtypeキーだけが読み取られることのテスト"""
+        assert peek_message_type(text) == expected
+
+    def test_stamp_envelope_keeps_original_payload(self):
+        """元のペイロードを変えずにサーバー情報が追記されることのテスト"""
+        text = '{"type":"draw","data":{"element":{"id":"e1"}},"userId":"u1","timestamp":"t"}'
+
+        stamped = stamp_envelope(text, "u1")
+
+        assert stamped.startswith(text[:-1])
+        message = json.loads(stamped)
+        assert message["data"] == {"element": {"id": "e1"}}
+        assert message["senderId"] == "u1"
+        assert isinstance(message["serverTimestamp"], int)
+
+    def test_stamp_envelope_overrides_spoofed_sender(self):
+        """クライアントが送ったsenderIdよりサーバーの値が優先されることのテスト"""
+        stamped = stamp_envelope('{"type":"draw","senderId":"someone-else"}', "u1")
+
+        assert json.loads(stamped)["senderId"] == "u1"
+
+    @pytest.mark.parametrize(
+        "text",
+        [
+            '{"type":"draw","data": oops}',
+            '{"type":"draw","data":[1]}',
+            '{"type":"draw","data":{},"type":"erase"}',
+        ],
+    )
+    def test_decode_relayed_rejects_malformed(self, text):
+        """JSONとして不正・data がオブジェクトでない・タイプが異なるテキストが拒否されることのテスト"""
+        assert decode_relayed(text, "draw") is None
+
+    def test_stamp_envelope_rejects_non_object(self):
+        """オブジェクトとして閉じていないテキストは中継しないことのテスト"""
+        assert stamp_envelope('{"type":"draw"', "u1") is None
+
+
+class TestOutgoingMessage:
+    """OutgoingMessageのテストクラス"""
+
+    def test_relayed_text_is_sent_verbatim_to_json_clients(self):
+        """JSON接続にはテキストがそのまま送られることのテスト"""
+        text = '{"type":"cursor","data":{"x":1,"y":2},"userId":"u1"}'
+        outgoing = OutgoingMessage(message_type="cursor", text=text)
+
+        assert outgoing.encode(JSON_CODEC) is text
+        assert outgoing._message is None
+
+    def test_relayed_text_is_decoded_once_for_other_codecs(self):
+        """他のコーデックの接続がある場合のみデコードされることのテスト"""
+        outgoing = OutgoingMessage(
+            message_type="cursor", text='{"type":"cursor","data":{"x":1,"y":2},"userId":"u1","timestamp":""}'
+        )
+
+        frame = outgoing.encode(BINARY_CODEC)
+
+        assert isinstance(frame, bytes)
+        assert outgoing.encode(BINARY_CODEC) is frame
+
+
+class TestRelayText:
+    """中継高速パスの配信のテストクラス"""
+
+    @pytest.mark.asyncio
+    async def test_malformed_draw_is_not_relayed(self, manager, handler):
+        """JSONとして不正な draw が配信・記録されず、送信者も切断されないことのテスト"""
+        sender, peer, binary_peer = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        await manager.connect(sender, "wb-relay", "user-a")
+        await manager.connect(peer, "wb-relay", "user-b")
+        await manager.connect(binary_peer, "wb-relay", "user-c", codec=BINARY_CODEC)
+        conn = manager.get_connection(sender)
+
+        assert await handler.relay_text('{"type":"draw","data": oops}', "wb-relay", "user-a", conn)
+        assert await handler.relay_text('{"type":"chunk","data": oops}', "wb-relay", "user-a", conn)
+        await drain(0.01)
+
+        assert [m["type"] for m in peer.messages()] == ["user_join"]
+        assert manager.get_op_log("wb-relay").seq == 0
+        assert sender.closed_code is None
+
+    @pytest.mark.asyncio
+    async def test_malformed_cursor_is_skipped_per_recipient(self, manager, handler):
+        """デコードしない cursor が不正でも、デコードが必要な接続にだけ送られないことのテスト"""
+        handler.cursor_aggregator = None
+        sender, peer, binary_peer = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        await manager.connect(sender, "wb-relay", "user-a")
+        await manager.connect(binary_peer, "wb-relay", "user-c", codec=BINARY_CODEC)
+        await manager.connect(peer, "wb-relay", "user-b")
+        conn = manager.get_connection(sender)
+
+        assert await handler.relay_text('{"type":"cursor","data": oops}', "wb-relay", "user-a", conn)
+        await drain(0.01)
+
+        assert any(text.startswith('{"type":"cursor"') for text in peer.sent)
+        assert not any(isinstance(frame, str) and frame.startswith('{"type":"cursor"') for frame in binary_peer.sent)
+        assert sender.closed_code is None
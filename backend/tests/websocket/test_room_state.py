@@ -0,0 +1,98 @@
+"""
+RoomStateCacheのユニットテスト
+"""
+import json
+from uuid import UUID, uuid4
+
+from app.websocket.element_persister import element_uuid
+from app.websocket.room_state import RoomStateCache
+
+
+BOARD_ID = str(uuid4())
+USER_ID = str(uuid4())
+
+
+def draw(element_id: str, x: float = 10) -> dict:
+    """テスト用の描画メッセージ"""
+    return {
+        "type": "draw",
+        "data": {"element": {"id": element_id, "type": "pen", "x": x, "y": 20, "color": "#ff0000"}},
+        "userId": USER_ID,
+        "timestamp": ""
+    }
+
+
+def stored(element_id: str, board_id: str = BOARD_ID) -> dict:
+    """テスト用のREST APIと同じ形式の要素"""
+    return {
+        "id": element_id, "whiteboard_id": board_id, "type": "pen", "x": 1.0, "y": 2.0,
+        "color": "#000000", "created_at": "2024-01-01T00:00:00Z", "updated_at": "2024-01-01T00:00:00Z"
+    }
+
+
+class TestRoomStateCache:
+    """RoomStateCacheのテストクラス"""
+
+    def test_websocket_changes_are_applied_to_warm_board(self):
+        """warm なボードにWebSocketの操作が反映されることのテスト"""
+        cache = RoomStateCache(memory_budget=1024 * 1024)
+        existing_id = str(uuid4())
+        assert cache.load(BOARD_ID, [stored(existing_id)], cache.generation(BOARD_ID))
+
+        cache.apply_message(BOARD_ID, USER_ID, draw("element_a", x=5))
+        cache.apply_message(BOARD_ID, USER_ID, {"type": "erase", "data": {"elementId": existing_id}})
+
+        elements = json.loads(cache.get_encoded(BOARD_ID))
+        assert [e["id"] for e in elements] == [str(element_uuid(UUID(BOARD_ID), "element_a"))]
+        assert elements[0]["type"] == "pen"
+        assert elements[0]["x"] == 5.0
+        assert elements[0]["user_id"] == USER_ID
+
+        cache.apply_message(BOARD_ID, USER_ID, {"type": "erase", "data": {"action": "clear"}})
+        assert cache.get_elements(BOARD_ID) == []
+
+    def test_editing_keeps_element_creator(self):
+        """他のユーザーが編集しても要素の作成者が変わらないことのテスト"""
+        cache = RoomStateCache(memory_budget=1024 * 1024)
+        assert cache.load(BOARD_ID, [], cache.generation(BOARD_ID))
+
+        cache.apply_message(BOARD_ID, USER_ID, draw("element_a", x=5))
+        cache.apply_message(BOARD_ID, str(uuid4()), draw("element_a", x=6))
+
+        (element,) = cache.get_elements(BOARD_ID)
+        assert element["x"] == 6.0
+        assert element["user_id"] == USER_ID
+
+    def test_cold_board_is_not_served(self):
+        """読み込んでいないボードは返さないことのテスト"""
+        cache = RoomStateCache(memory_budget=1024 * 1024)
+
+        cache.apply_message(BOARD_ID, USER_ID, draw("element_a"))
+
+        assert cache.get_encoded(BOARD_ID) is None
+
+    def test_load_is_rejected_after_rest_change(self):
+        """読み込み中にREST APIで変更された場合は warm にしないことのテスト"""
+        cache = RoomStateCache(memory_budget=1024 * 1024)
+        generation = cache.generation(BOARD_ID)
+
+        cache.put_elements(BOARD_ID, [stored(str(uuid4()))])
+
+        assert not cache.load(BOARD_ID, [], generation)
+        assert not cache.is_warm(BOARD_ID)
+
+    def test_least_recently_used_board_is_evicted(self):
+        """メモリ上限を超えると最も使われていないボードが破棄されることのテスト"""
+        boards = [str(uuid4()) for _ in range(3)]
+        size = len(json.dumps(stored(str(uuid4()), boards[0])))
+        cache = RoomStateCache(memory_budget=size * 2)
+
+        cache.load(boards[0], [stored(str(uuid4()), boards[0])], 0)
+        cache.load(boards[1], [stored(str(uuid4()), boards[1])], 0)
+        cache.get_elements(boards[0])
+        cache.load(boards[2], [stored(str(uuid4()), boards[2])], 0)
+
+        assert cache.is_warm(boards[0])
+        assert not cache.is_warm(boards[1])
+        assert cache.is_warm(boards[2])
+        assert cache.size <= size * 2
@@ -0,0 +1,96 @@
+"""
+ストロークの差分配信のユニットテスト
+"""
+import pytest
+
+from app.websocket.stroke_stream import StrokeAssembler, StrokeTooLong
+from tests.websocket.helpers import FakeWebSocket, begin_data, connection, drain
+
+
+class TestStrokeAssembler:
+    """StrokeAssemblerのテストクラス"""
+
+    def test_deltas_are_reassembled(self):
+        """差分の点列が絶対座標に組み立てられることのテスト"""
+        assembler = StrokeAssembler(max_points=100, max_open=2)
+        conn = connection()
+
+        assert assembler.begin(conn, begin_data())
+        assert assembler.append(conn, {"strokeId": "s1", "x": 11, "y": 21, "d": [1, 1, 2, -1]})
+        # 途中のバッチが欠けても絶対座標から再開できる
+        assert assembler.append(conn, {"strokeId": "s1", "x": 30, "y": 30})
+        element = assembler.end(conn, {"strokeId": "s1"})
+
+        assert element["id"] == "el-1"
+        assert element["points"] == [
+            {"x": 10, "y": 20}, {"x": 11, "y": 21}, {"x": 12, "y": 22}, {"x": 14, "y": 21}, {"x": 30, "y": 30}
+        ]
+        assert conn.strokes == {}
+
+    def test_limits_are_enforced(self):
+        """点数・同時ストローク数の上限と、開始していないストロークが拒否されることのテスト"""
+        assembler = StrokeAssembler(max_points=3, max_open=1)
+        conn = connection()
+
+        assert assembler.begin(conn, begin_data("s1"))
+        assert not assembler.begin(conn, begin_data("s2"))
+        with pytest.raises(StrokeTooLong):
+            assembler.append(conn, {"strokeId": "s1", "x": 0, "y": 0, "d": [1, 1, 1, 1]})
+        assert not assembler.append(conn, {"strokeId": "s1", "x": 0, "y": 0, "d": [1]})
+        assert not assembler.append(conn, {"strokeId": "unknown", "x": 0, "y": 0})
+        assert assembler.end(conn, {"strokeId": "unknown"}) is None
+        assert not assembler.append(conn, {"strokeId": [], "x": 0, "y": 0})
+        assert assembler.end(conn, {"strokeId": {}}) is None
+        assert len(assembler.end(conn, {"strokeId": "s1"})["points"]) == 1
+
+
+class TestStrokeMessages:
+    """ストロークメッセージの配信のテストクラス"""
+
+    @pytest.mark.asyncio
+    async def test_only_new_points_are_forwarded(self, manager, handler):
+        """追加分だけが配信され、終了時に点列全体が draw として配信されることのテスト"""
+        sender, peer = FakeWebSocket(), FakeWebSocket()
+        await manager.connect(sender, "wb-stroke", "user-a")
+        await manager.connect(peer, "wb-stroke", "user-b")
+
+        for message in [
+            {"type": "stroke_begin", "data": begin_data()},
+            {"type": "stroke_append", "data": {"strokeId": "s1", "x": 11, "y": 21, "d": [1, 1]}},
+            {"type": "stroke_append", "data": {"strokeId": "s1", "x": 13, "y": 23, "d": [1, 1]}},
+            {"type": "stroke_end", "data": {"strokeId": "s1"}},
+        ]:
+            await handler.handle_message(message, "wb-stroke", "user-a", sender)
+        await drain(0.01)
+
+        received = [m for m in peer.messages() if m["type"] != "user_join"]
+        assert [m["type"] for m in received] == ["stroke_begin", "stroke_append", "stroke_append", "draw"]
+        assert received[2]["data"] == {"strokeId": "s1", "x": 13, "y": 23, "d": [1, 1]}
+        assert received[2]["senderId"] == "user-a"
+        assert len(received[3]["data"]["element"]["points"]) == 5
+        assert received[3]["seq"] == 1
+        assert not any(m["type"].startswith("stroke") for m in sender.messages())
+
+    @pytest.mark.asyncio
+    async def test_stroke_over_point_limit_is_ended_explicitly(self, manager, handler):
+        """点数の上限を超えたストロークが受け付けた点までで確定し、送信者に終了が通知されることのテスト"""
+        handler.stroke_assembler = StrokeAssembler(max_points=3, max_open=1)
+        sender, peer = FakeWebSocket(), FakeWebSocket()
+        await manager.connect(sender, "wb-stroke", "user-a")
+        await manager.connect(peer, "wb-stroke", "user-b")
+
+        for message in [
+            {"type": "stroke_begin", "data": begin_data()},
+            {"type": "stroke_append", "data": {"strokeId": "s1", "x": 11, "y": 21}},
+            {"type": "stroke_append", "data": {"strokeId": "s1", "x": 12, "y": 22, "d": [1, 1]}},
+            {"type": "stroke_append", "data": {"strokeId": "s1", "x": 14, "y": 24}},
+        ]:
+            await handler.handle_message(message, "wb-stroke", "user-a", sender)
+        await drain(0.01)
+
+        received = [m for m in peer.messages() if m["type"] != "user_join"]
+        assert [m["type"] for m in received] == ["stroke_begin", "stroke_append", "draw"]
+        assert len(received[-1]["data"]["element"]["points"]) == 2
+        ended = [m for m in sender.messages() if m["type"] == "stroke_end"]
+        assert [m["data"] for m in ended] == [{"strokeId": "s1", "reason": "max_points"}]
+        assert manager.get_connection(sender).strokes == {}
@@ -0,0 +1,81 @@
+"""
+閲覧専用接続の配信のユニットテスト
+"""
+import asyncio
+
+import pytest
+
+from app.websocket.codec import OutgoingMessage
+from app.websocket.cursor_aggregator import CursorAggregator
+from app.websocket.drawing_batcher import DrawingEventBatcher
+from app.websocket.interest import parse_viewport, point_bounds
+from tests.websocket.helpers import FakeWebSocket, drain
+
+
+class TestViewerTier:
+    """閲覧専用接続のテストクラス"""
+
+    @pytest.mark.asyncio
+    async def test_viewers_receive_shared_frames_without_presence(self, manager):
+        """閲覧者は入退室を通知されず、メンバーと同じ配信を受け取ることのテスト"""
+        presenter, viewer = FakeWebSocket(), FakeWebSocket()
+        await manager.connect(presenter, "wb-talk", "presenter")
+        await manager.connect(viewer, "wb-talk", "audience", viewer=True)
+
+        await manager.broadcast_to_whiteboard(
+            "wb-talk", {"type": "draw", "data": {"element": {"id": "el-1"}}}, exclude_user="presenter"
+        )
+        await drain(0.01)
+
+        assert [m["type"] for m in presenter.messages()] == []
+        assert [m["type"] for m in viewer.messages()] == ["draw"]
+        assert manager.get_whiteboard_users("wb-talk") == ["presenter"]
+
+        await manager.disconnect(presenter, "wb-talk", "presenter")
+        await drain(0.01)
+        assert viewer.messages()[-1]["type"] == "user_leave"
+        await manager.disconnect(viewer, "wb-talk", "audience")
+        assert manager.viewers.count("wb-talk") == 0
+
+    @pytest.mark.asyncio
+    async def test_viewer_cursors_are_thinned(self, manager):
+        """閲覧者にはカーソルがユーザーごとの最新位置として間引いて配信されることのテスト"""
+        manager.viewers.cursor_interval = 0.02
+        member, viewer = FakeWebSocket(), FakeWebSocket()
+        await manager.connect(member, "wb-talk", "member")
+        await manager.connect(viewer, "wb-talk", "audience", viewer=True)
+
+        for x in range(5):
+            await manager.broadcast_to_whiteboard(
+                "wb-talk", {"type": "cursors", "data": {"cursors": [{"userId": "presenter", "x": x, "y": 0}]}}
+            )
+        await asyncio.sleep(0.05)
+        await drain(0.01)
+
+        assert len([m for m in member.messages() if m["type"] == "cursors"]) == 5
+        frames = [m for m in viewer.messages() if m["type"] == "cursors"]
+        assert [frame["data"]["cursors"] for frame in frames] == [[{"userId": "presenter", "x": 4, "y": 0}]]
+
+    @pytest.mark.asyncio
+    async def test_viewers_receive_viewport_filtered_flushes(self, manager):
+        """表示範囲で絞り込んだカーソル・描画イベントの配信も閲覧者に届くことのテスト"""
+        manager.viewers.cursor_interval = 0.01
+        cursors = CursorAggregator(manager, flush_hz=100)
+        batcher = DrawingEventBatcher(manager, window_ms=10)
+        presenter, member, viewer = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        await manager.connect(presenter, "wb-talk", "presenter")
+        await manager.connect(member, "wb-talk", "member")
+        await manager.connect(viewer, "wb-talk", "audience", viewer=True)
+        manager.set_viewport(manager.get_connection(member), parse_viewport({"x": 0, "y": 0, "width": 100, "height": 100}))
+
+        cursors.update("wb-talk", "presenter", {"x": 5000, "y": 5000})
+        event = {"type": "drawing_event", "data": {"point": {"x": 5000, "y": 5000}}, "senderId": "presenter"}
+        await batcher.add("wb-talk", "presenter", OutgoingMessage(event), point_bounds(event["data"]["point"]))
+        await asyncio.sleep(0.05)
+        await drain(0.01)
+
+        # 表示範囲外のメンバーには届かず、閲覧者には絞り込まずに届く
+        assert [m["type"] for m in member.messages()] == []
+        received = {m["type"]: m for m in viewer.messages()}
+        assert received["cursors"]["data"]["cursors"] == [{"x": 5000, "y": 5000, "userId": "presenter"}]
+        assert received["drawing_events"]["data"]["events"] == [event]
@@ -237,9 +237,10 @@ export const whiteboardApi = {
   },
 
   saveElements(whiteboardId: string, elements: DrawingElement[]): Promise<ApiResponse<DrawingElement[]>> {
-    // Convert elements to backend schema format and exclude server-managed fields
+    // Convert elements to backend schema format and exclude server-managed fields.
+    // The client id is kept so the server stores each element under the same row its WebSocket edits use.
     const elementsForBackend = elements
-      .map(element => convertElementToBackend({
+      .map(element => ({ id: element.id, converted: convertElementToBackend({
         type: element.type,
         x: element.x,
         y: element.y,
@@ -254,8 +255,9 @@ export const whiteboardApi = {
         text: element.text,
         fontSize: element.fontSize,
         fontFamily: element.fontFamily
-      }))
-      .filter(element => element !== null) // Remove unsupported elements
+      }) }))
+      .filter(({ converted }) => converted !== null) // Remove unsupported elements
+      .map(({ id, converted }) => ({ ...converted, id }))
     
     console.log('API Request:', {
       endpoint: `/whiteboards/${whiteboardId}/elements/batch`,
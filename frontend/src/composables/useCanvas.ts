@@ -65,6 +65,12 @@ export function useCanvas(canvasRef: Ref<HTMLCanvasElement | null>) {
           ...baseElement,
           points: [point]
         } as DrawingElement
+        emitDrawingEvent({
+          type: 'start',
+          point,
+          tool: canvasState.tool,
+          element: currentElement.value
+        })
         break
         
       case 'line':
@@ -97,6 +103,7 @@ export function useCanvas(canvasRef: Ref<HTMLCanvasElement | null>) {
       case 'pen':
         if (currentElement.value.points) {
           currentElement.value.points.push(point)
+          emitDrawingEvent({ type: 'move', point, tool: canvasState.tool })
         }
         break
         
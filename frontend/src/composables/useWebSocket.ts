@@ -1,11 +1,13 @@
 import { ref, reactive, onUnmounted } from 'vue'
-import type { WebSocketMessage, DrawingElement, DrawingEvent } from '@/types'
+import type { WebSocketMessage, DrawingElement, DrawingEvent, Point } from '@/types'
 
 interface WebSocketState {
   isConnected: boolean
   isConnecting: boolean
   reconnectAttempts: number
   lastError: string | null
+  // Read-only viewer connection: the server ignores everything but heartbeats
+  isViewer: boolean
 }
 
 interface WebSocketConfig {
@@ -13,6 +15,8 @@ interface WebSocketConfig {
   reconnectInterval: number
   maxReconnectAttempts: number
   heartbeatInterval: number
+  // Messages whose JSON is longer than this are sent as sequenced chunks
+  maxFrameSize: number
 }
 
 export function useWebSocket(config: Partial<WebSocketConfig> = {}) {
@@ -20,7 +24,8 @@ export function useWebSocket(config: Partial<WebSocketConfig> = {}) {
     url: import.meta.env.VITE_WS_URL || 'ws://localhost:8000/ws',
     reconnectInterval: 3000,
     maxReconnectAttempts: 5,
-    heartbeatInterval: 30000
+    heartbeatInterval: 30000,
+    maxFrameSize: 1024 * 1024
   }
 
   const wsConfig = { ...defaultConfig, ...config }
@@ -30,7 +35,8 @@ export function useWebSocket(config: Partial<WebSocketConfig> = {}) {
     isConnected: false,
     isConnecting: false,
     reconnectAttempts: 0,
-    lastError: null
+    lastError: null,
+    isViewer: false
   })
 
   // Message handlers
@@ -40,17 +46,56 @@ export function useWebSocket(config: Partial<WebSocketConfig> = {}) {
   let reconnectTimer: ReturnType<typeof setTimeout> | null = null
   let heartbeatTimer: ReturnType<typeof setInterval> | null = null
 
-  const connect = (whiteboardId: string, userId: string) => {
+  // Position in the room op log, sent on reconnect so the server replays only the gap
+  let resumeWhiteboardId: string | null = null
+  let lastSeq: number | null = null
+  let epoch: string | null = null
+  // Ask the server to push the board state after joining (kept for reconnects)
+  let requestSnapshot = false
+  // Join as a read-only viewer even with edit permission (kept for reconnects)
+  let requestViewer = false
+
+  // Outgoing pen stroke: points are buffered and sent as deltas once per flush interval
+  const STROKE_FLUSH_INTERVAL = 50
+  let outgoingStroke: { strokeId: string; userId: string; pending: Point[]; timer: ReturnType<typeof setTimeout> | null } | null = null
+  // Incoming strokes being drawn by others, keyed by `${senderId}:${strokeId}`
+  const remoteStrokes = new Map<string, DrawingElement>()
+  // Chunked messages from others, keyed by `${senderId}:${id}`
+  const incomingChunks = new Map<string, string[]>()
+  // Chunked draw/erase already applied, waiting for the server's chunk_commit
+  const completedChunks = new Set<string>()
+  // Visible canvas area; the server only forwards cursors and previews that fall inside it
+  let viewport: { x: number; y: number; width: number; height: number } | null = null
+
+  const connect = (whiteboardId: string, userId: string, options: { snapshot?: boolean; viewer?: boolean } = {}) => {
     if (state.isConnected || state.isConnecting) {
       return Promise.resolve()
     }
+    if (options.snapshot !== undefined) {
+      requestSnapshot = options.snapshot
+    }
+    if (options.viewer !== undefined) {
+      requestViewer = options.viewer
+    }
 
     return new Promise<void>((resolve, reject) => {
       try {
         state.isConnecting = true
         state.lastError = null
 
-        const wsUrl = `${wsConfig.url}/${whiteboardId}?userId=${userId}`
+        if (resumeWhiteboardId !== whiteboardId) {
+          resumeWhiteboardId = whiteboardId
+          lastSeq = null
+          epoch = null
+        }
+        const resume = lastSeq !== null && epoch !== null
+          ? `&lastSeq=${lastSeq}&epoch=${encodeURIComponent(epoch)}`
+          : ''
+        const snapshot = requestSnapshot ? '&snapshot=1' : ''
+        const mode = requestViewer ? '&mode=viewer' : ''
+        // The server verifies the token and board permission at the handshake
+        const token = encodeURIComponent(localStorage.getItem('auth_token') || '')
+        const wsUrl = `${wsConfig.url}/${whiteboardId}?userId=${userId}&token=${token}${resume}${snapshot}${mode}`
         socket.value = new WebSocket(wsUrl)
 
         socket.value.onopen = () => {
@@ -120,6 +165,18 @@ export function useWebSocket(config: Partial<WebSocketConfig> = {}) {
     state.isConnected = false
     state.isConnecting = false
     state.reconnectAttempts = 0
+    resumeWhiteboardId = null
+    lastSeq = null
+    epoch = null
+    requestSnapshot = false
+    if (outgoingStroke?.timer) {
+      clearTimeout(outgoingStroke.timer)
+    }
+    outgoingStroke = null
+    remoteStrokes.clear()
+    incomingChunks.clear()
+    completedChunks.clear()
+    viewport = null
   }
 
   const scheduleReconnect = (whiteboardId: string, userId: string) => {
@@ -166,7 +223,11 @@ export function useWebSocket(config: Partial<WebSocketConfig> = {}) {
     }
 
     try {
-      socket.value.send(JSON.stringify(message))
+      const text = JSON.stringify(message)
+      if (text.length > wsConfig.maxFrameSize) {
+        return sendChunked(message.type, text)
+      }
+      socket.value.send(text)
       return true
     } catch (error) {
       console.error('Failed to send WebSocket message:', error)
@@ -174,7 +235,134 @@ export function useWebSocket(config: Partial<WebSocketConfig> = {}) {
     }
   }
 
+  // Split an oversized message into chunks the server relays as they arrive
+  const sendChunked = (type: WebSocketMessage['type'], text: string) => {
+    if (!['draw', 'erase', 'drawing_event'].includes(type)) {
+      console.warn('Message too large to send:', type)
+      return false
+    }
+    // Escaping inside the chunk envelope can double the payload size
+    const size = Math.floor(wsConfig.maxFrameSize / 2) - 1024
+    const count = Math.ceil(text.length / size)
+    const id = `${Date.now()}_${Math.random().toString(36).slice(2, 11)}`
+    for (let index = 0; index < count; index++) {
+      socket.value!.send(JSON.stringify({
+        type: 'chunk',
+        data: { id, index, count, messageType: type, payload: text.slice(index * size, (index + 1) * size) },
+        userId: '',
+        timestamp: ''
+      }))
+    }
+    return true
+  }
+
+  const handleChunk = (message: WebSocketMessage) => {
+    const { id, index, count, payload } = message.data
+    const key = `${message.senderId}:${id}`
+    if (index === 0) {
+      incomingChunks.set(key, [])
+    }
+    const parts = incomingChunks.get(key)
+    if (!parts || parts.length !== index) {
+      incomingChunks.delete(key)
+      return
+    }
+    parts.push(payload)
+    if (parts.length < count) return
+    incomingChunks.delete(key)
+    const inner: WebSocketMessage = JSON.parse(parts.join(''))
+    if (inner.type === 'draw' || inner.type === 'erase') {
+      completedChunks.add(key)
+    }
+    handleMessage({ ...inner, senderId: message.senderId })
+  }
+
   const handleMessage = (message: WebSocketMessage) => {
+    if (typeof message.seq === 'number') {
+      lastSeq = Math.max(lastSeq ?? 0, message.seq)
+    }
+    if (message.type === 'connection_success' && message.data?.epoch) {
+      if (message.data.epoch !== epoch) {
+        epoch = message.data.epoch
+        lastSeq = message.data.seq ?? 0
+      } else {
+        lastSeq = Math.max(lastSeq ?? 0, message.data.seq ?? 0)
+      }
+      state.isViewer = message.data.viewer === true
+      // A new connection starts without a viewport
+      if (viewport) {
+        sendViewport(viewport)
+      }
+    }
+
+    // Server heartbeat: answer so the connection is not evicted as idle
+    if (message.type === 'ping') {
+      sendMessage({
+        type: 'pong',
+        data: {},
+        userId: '',
+        timestamp: message.timestamp
+      })
+      return
+    }
+
+    // Server coalesces cursor moves into one frame per tick
+    if (message.type === 'cursors') {
+      const cursors: Array<{ userId: string; x: number; y: number }> =
+        message.data?.cursors || []
+      cursors.forEach(cursor => {
+        handleMessage({
+          type: 'cursor',
+          data: cursor,
+          userId: cursor.userId,
+          timestamp: message.timestamp
+        })
+      })
+      return
+    }
+
+    // Server may batch drawing previews into one frame (sender order preserved)
+    if (message.type === 'drawing_events') {
+      const events: WebSocketMessage[] = message.data?.events || []
+      events.forEach(event => handleMessage(event))
+      return
+    }
+
+    if (message.type === 'chunk') {
+      handleChunk(message)
+      return
+    }
+    // A commit for chunks we never saw (e.g. replayed after reconnect) means our state is behind
+    if (message.type === 'chunk_commit') {
+      const key = `${message.senderId}:${message.data?.id}`
+      if (!completedChunks.delete(key)) {
+        handleMessage({ type: 'resync', data: { reason: 'missed_chunks' }, userId: '', timestamp: '' })
+      }
+      return
+    }
+
+    // Strokes stream only new points; rebuild the element and hand it to 'draw' handlers
+    if (message.type === 'stroke_begin' || message.type === 'stroke_append') {
+      const element = applyRemoteStroke(message)
+      if (element) {
+        handleMessage({ ...message, type: 'draw', data: { element }, seq: undefined })
+      }
+      return
+    }
+    // The server ended our stroke at its point limit; the finished element goes out as a draw
+    if (message.type === 'stroke_end') {
+      if (outgoingStroke && outgoingStroke.strokeId === message.data?.strokeId) {
+        if (outgoingStroke.timer) {
+          clearTimeout(outgoingStroke.timer)
+        }
+        outgoingStroke = null
+      }
+      return
+    }
+    if (message.type === 'draw' && message.data?.strokeId != null) {
+      remoteStrokes.delete(`${message.senderId}:${message.data.strokeId}`)
+    }
+
     const handlers = messageHandlers.value.get(message.type) || []
     handlers.forEach(handler => {
       try {
@@ -232,6 +420,92 @@ export function useWebSocket(config: Partial<WebSocketConfig> = {}) {
     })
   }
 
+  const applyRemoteStroke = (message: WebSocketMessage): DrawingElement | null => {
+    const key = `${message.senderId}:${message.data?.strokeId}`
+    if (message.type === 'stroke_begin') {
+      const element = message.data.element as DrawingElement
+      const stroke = { ...element, points: element.points?.length ? [...element.points] : [{ x: element.x, y: element.y }] }
+      remoteStrokes.set(key, stroke)
+      return stroke
+    }
+    const stroke = remoteStrokes.get(key)
+    if (!stroke) return null
+    let { x, y } = message.data
+    const deltas: number[] = message.data.d || []
+    stroke.points!.push({ x, y })
+    for (let i = 0; i + 1 < deltas.length; i += 2) {
+      x += deltas[i]
+      y += deltas[i + 1]
+      stroke.points!.push({ x, y })
+    }
+    return { ...stroke, points: [...stroke.points!] }
+  }
+
+  const flushStroke = () => {
+    if (!outgoingStroke) return
+    if (outgoingStroke.timer) {
+      clearTimeout(outgoingStroke.timer)
+      outgoingStroke.timer = null
+    }
+    const points = outgoingStroke.pending
+    if (points.length === 0) return
+    outgoingStroke.pending = []
+    const d: number[] = []
+    for (let i = 1; i < points.length; i++) {
+      d.push(points[i].x - points[i - 1].x, points[i].y - points[i - 1].y)
+    }
+    sendMessage({
+      type: 'stroke_append',
+      data: { strokeId: outgoingStroke.strokeId, x: points[0].x, y: points[0].y, d },
+      userId: outgoingStroke.userId,
+      timestamp: ''
+    })
+  }
+
+  // Pen strokes: begin with the element, append new points as deltas, end to commit
+  const beginStroke = (element: DrawingElement, userId: string) => {
+    if (outgoingStroke) endStroke()
+    outgoingStroke = { strokeId: element.id, userId, pending: [], timer: null }
+    return sendMessage({
+      type: 'stroke_begin',
+      data: { strokeId: element.id, element },
+      userId,
+      timestamp: new Date().toISOString()
+    })
+  }
+
+  const appendStrokePoint = (point: Point) => {
+    if (!outgoingStroke) return
+    outgoingStroke.pending.push(point)
+    if (!outgoingStroke.timer) {
+      outgoingStroke.timer = setTimeout(flushStroke, STROKE_FLUSH_INTERVAL)
+    }
+  }
+
+  const endStroke = () => {
+    if (!outgoingStroke) return false
+    flushStroke()
+    const { strokeId, userId } = outgoingStroke
+    outgoingStroke = null
+    return sendMessage({
+      type: 'stroke_end',
+      data: { strokeId },
+      userId,
+      timestamp: new Date().toISOString()
+    })
+  }
+
+  const sendViewport = (rect: { x: number; y: number; width: number; height: number } | null) => {
+    viewport = rect
+    if (!state.isConnected) return false
+    return sendMessage({
+      type: 'viewport',
+      data: rect,
+      userId: '',
+      timestamp: ''
+    })
+  }
+
   const sendCursorUpdate = (x: number, y: number, userId: string) => {
     return sendMessage({
       type: 'cursor',
@@ -283,6 +557,10 @@ export function useWebSocket(config: Partial<WebSocketConfig> = {}) {
     // Drawing-specific methods
     sendDrawingUpdate,
     sendDrawingEvent,
+    beginStroke,
+    appendStrokePoint,
+    endStroke,
+    sendViewport,
     sendCursorUpdate,
     sendUserJoin,
     sendUserLeave
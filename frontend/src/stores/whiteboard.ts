@@ -104,13 +104,11 @@ export const useWhiteboardStore = defineStore('whiteboard', () => {
 
     currentWhiteboard.value = whiteboard
     if (whiteboard) {
-      // Load drawing elements for this whiteboard
-      await loadDrawingElements(whiteboard.id)
-      
       // Connect to WebSocket for real-time collaboration
+      // (the server pushes the current elements as a snapshot right after joining)
       if (authStore.user) {
         try {
-          await webSocket.connect(whiteboard.id, authStore.user.id)
+          await webSocket.connect(whiteboard.id, authStore.user.id, { snapshot: true })
           isWebSocketConnected.value = true
           
           // Setup WebSocket message handlers for this whiteboard
@@ -118,10 +116,14 @@ export const useWhiteboardStore = defineStore('whiteboard', () => {
           
           // Send user join notification
           webSocket.sendUserJoin(authStore.user.id, authStore.user.name)
+          return
         } catch (error) {
           console.error('Failed to connect to WebSocket:', error)
         }
       }
+      
+      // Fall back to loading drawing elements over REST
+      await loadDrawingElements(whiteboard.id)
     }
   }
 
@@ -421,6 +423,33 @@ export const useWhiteboardStore = defineStore('whiteboard', () => {
       console.log(`User ${data.userId} cursor at:`, data.x, data.y)
     })
 
+    // Board state pushed by the server after joining, split into chunks
+    webSocket.onMessage('snapshot', (data: { elements: DrawingElement[]; chunk: number; chunks: number }) => {
+      const whiteboardId = currentWhiteboard.value?.id
+      if (!whiteboardId) return
+      
+      if (data.chunk === 0) {
+        drawingElements.value = drawingElements.value.filter(el => el.whiteboardId !== whiteboardId)
+      }
+      data.elements.forEach(element => {
+        const existingIndex = drawingElements.value.findIndex(el => el.id === element.id)
+        if (existingIndex === -1) {
+          drawingElements.value.push(element)
+        } else {
+          drawingElements.value[existingIndex] = element
+        }
+      })
+    })
+
+    // Server could not replay the missed operations after a reconnect
+    webSocket.onMessage('resync', () => {
+      if (currentWhiteboard.value) {
+        loadDrawingElements(currentWhiteboard.value.id).catch((error) => {
+          console.error('Resync drawing elements error:', error)
+        })
+      }
+    })
+
     // Handle pong response
     webSocket.onMessage('pong', () => {
       // WebSocket heartbeat response - connection is alive
@@ -77,10 +77,12 @@ export interface DrawingEvent {
 }
 
 export interface WebSocketMessage {
-  type: 'draw' | 'erase' | 'clear' | 'cursor' | 'user_join' | 'user_leave' | 'ping' | 'pong' | 'drawing_event'
+  type: 'draw' | 'erase' | 'clear' | 'cursor' | 'cursors' | 'user_join' | 'user_leave' | 'ping' | 'pong' | 'drawing_event' | 'drawing_events' | 'connection_success' | 'resync' | 'snapshot' | 'stroke_begin' | 'stroke_append' | 'stroke_end' | 'viewport' | 'chunk' | 'chunk_commit'
   data: any
   userId: string
   timestamp: string
+  seq?: number
+  senderId?: string
 }
 
 export interface ApiResponse<T = any> {